@@ -0,0 +1,373 @@
+import contextlib
+import contextvars
+import queue
+import sqlite3
+import threading
+import time
+
+from main import (
+    PNS_PRODUCT_ID,
+    PNS_SMART_MODE_COMMAND,
+    PNS_MUTE_COMMAND,
+    PNS_STOP_PULSE_INPUT_COMMAND,
+    PNS_RUN_CONTROL_COMMAND,
+    PNS_DETAIL_RUN_CONTROL_COMMAND,
+    PNS_CLEAR_COMMAND,
+    PNS_REBOOT_COMMAND,
+    PHN_WRITE_COMMAND,
+)
+
+# behaviour of AuditLog.audit when the queue is full
+AUDIT_POLICY_DROP = 'drop'
+"""drop the record and count it, send_command never waits"""
+AUDIT_POLICY_BLOCK = 'block'
+"""wait for room, send_command is slowed down to the speed of the writer (dropped once the log is closed)"""
+
+AUDIT_CHANGE_VERBS = frozenset(command.decode('ascii') for command in (
+    PNS_SMART_MODE_COMMAND, PNS_MUTE_COMMAND, PNS_STOP_PULSE_INPUT_COMMAND, PNS_RUN_CONTROL_COMMAND,
+    PNS_DETAIL_RUN_CONTROL_COMMAND, PNS_CLEAR_COMMAND, PNS_REBOOT_COMMAND, PHN_WRITE_COMMAND))
+"""verbs of the commands changing the state of a device (status reads are not audited by default)"""
+
+_PNS_HEADER_SIZE = 6
+# the data of a reboot command is the password, only the header (with the data length) is logged
+_REDACTED_VERBS = frozenset((PNS_REBOOT_COMMAND.decode('ascii'),))
+
+_AUDIT_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS audit (
+    id INTEGER PRIMARY KEY,
+    timestamp REAL NOT NULL,
+    device TEXT NOT NULL,
+    actor TEXT,
+    verb TEXT NOT NULL,
+    frame BLOB NOT NULL,
+    response BLOB,
+    error TEXT,
+    latency REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS audit_device_timestamp ON audit (device, timestamp);
+CREATE INDEX IF NOT EXISTS audit_timestamp ON audit (timestamp);
+'''
+
+_audit_actor = contextvars.ContextVar('audit_actor', default=None)
+
+
+@contextlib.contextmanager
+def audit_actor(actor: str):
+    """
+    Attribute the commands sent in a block to an actor
+
+    The actor is a context variable: commands sent from another thread (CommandQueue, Scheduler, ...)
+    keep the actor of that thread
+
+    Parameters
+    ----------
+    actor: str
+        User or service sending the commands
+    """
+    token = _audit_actor.set(actor)
+    try:
+        yield
+    finally:
+        _audit_actor.reset(token)
+
+
+def command_verb(frame: bytes) -> str:
+    """
+    Get the command identifier of a PNS/PHN frame
+
+    Parameters
+    ----------
+    frame: bytes
+        PNS/PHN command
+
+    Returns
+    -------
+    verb: str
+        command identifier ('S', 'D', 'W', ...)
+    """
+    if frame[0:2] == PNS_PRODUCT_ID:
+        return frame[2:3].decode('latin-1')
+    return frame[0:1].decode('latin-1')
+
+
+class AuditRecord:
+    """command recorded by the audit log"""
+
+    __slots__ = ('_timestamp', '_device', '_actor', '_verb', '_frame', '_response', '_error', '_latency')
+
+    def __init__(self, timestamp: float, device: str, actor: str, verb: str, frame: bytes, response: bytes,
+                 error: str, latency: float):
+        """
+        command recorded by the audit log
+
+        Parameters
+        ----------
+        timestamp: float
+            Time the response was received or the command failed (seconds since the epoch)
+        device: str
+            Device id (IP address:port number)
+        actor: str
+            User or service that sent the command, None if unknown
+        verb: str
+            Command identifier
+        frame: bytes
+            Command sent, only the header for a reboot
+        response: bytes
+            Response data, None if the command failed
+        error: str
+            Failure, None if the device responded
+        latency: float
+            Seconds from sending the command to its outcome
+        """
+        self._timestamp = timestamp
+        self._device = device
+        self._actor = actor
+        self._verb = verb
+        self._frame = frame
+        self._response = response
+        self._error = error
+        self._latency = latency
+
+    @property
+    def timestamp(self) -> float:
+        """time of the outcome"""
+        return self._timestamp
+
+    @property
+    def device(self) -> str:
+        """device id"""
+        return self._device
+
+    @property
+    def actor(self) -> str:
+        """user or service that sent the command"""
+        return self._actor
+
+    @property
+    def verb(self) -> str:
+        """command identifier"""
+        return self._verb
+
+    @property
+    def frame(self) -> bytes:
+        """command sent (header only for a reboot, the password is not logged)"""
+        return self._frame
+
+    @property
+    def response(self) -> bytes:
+        """response data"""
+        return self._response
+
+    @property
+    def error(self) -> str:
+        """failure"""
+        return self._error
+
+    @property
+    def latency(self) -> float:
+        """seconds from sending the command to its outcome"""
+        return self._latency
+
+    def __repr__(self) -> str:
+        return 'AuditRecord(%r, %r, %r, %.3f)' % (self._device, self._verb, self._actor, self._timestamp)
+
+
+class AuditLog:
+    """SQLite audit log of the commands sent by send_command, written in batches by a background thread"""
+
+    def __init__(self, path: str, maxsize: int = 65536, policy: str = AUDIT_POLICY_DROP, batch_size: int = 1024,
+                 interval: float = 0.5, verbs=AUDIT_CHANGE_VERBS, actor: str = None):
+        """
+        SQLite audit log of the commands sent by send_command, written in batches by a background thread
+
+        audit only puts the record in a bounded queue, the writer commits one transaction per batch;
+        register the log with main.set_auditor
+
+        Parameters
+        ----------
+        path: str
+            Database file, created if it does not exist
+        maxsize: int
+            Maximum number of records waiting to be written
+        policy: str
+            AUDIT_POLICY_DROP or AUDIT_POLICY_BLOCK, behaviour when maxsize records are waiting
+        batch_size: int
+            Maximum number of records written in one transaction
+        interval: float
+            Maximum seconds a record waits before its batch is written
+        verbs:
+            Command identifiers audited, every command if None
+        actor: str
+            Actor of the commands sent outside an audit_actor block
+        """
+        self._path = path
+        self._policy = policy
+        self._batch_size = batch_size
+        self._interval = interval
+        self._verbs = verbs
+        self._actor = actor
+        self._queue = queue.Queue(maxsize)
+        self._lock = threading.Lock()
+        self._dropped = 0
+        self._error = None
+        connection = sqlite3.connect(path)
+        try:
+            # readers do not block the writer
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.executescript(_AUDIT_SCHEMA)
+        finally:
+            connection.close()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    @property
+    def dropped(self) -> int:
+        """number of records dropped because the queue was full or the log closed"""
+        with self._lock:
+            return self._dropped
+
+    @property
+    def error(self):
+        """last exception of the writer, None if every batch was written"""
+        with self._lock:
+            return self._error
+
+    @property
+    def pending(self) -> int:
+        """number of records waiting to be written"""
+        return self._queue.qsize()
+
+    def audit(self, device: str, frame: bytes, response: bytes, error, latency: float):
+        """
+        Queue a command for the log (called by send_command)
+
+        Parameters
+        ----------
+        device: str
+            Device id
+        frame: bytes
+            Command sent
+        response: bytes
+            Response data, None if the command failed
+        error: Exception
+            Failure, None if the device responded
+        latency: float
+            Seconds from sending the command to its outcome
+        """
+        verb = command_verb(frame)
+        if self._verbs is not None and verb not in self._verbs:
+            return
+        if verb in _REDACTED_VERBS and frame[0:2] == PNS_PRODUCT_ID:
+            frame = frame[:_PNS_HEADER_SIZE]
+        actor = _audit_actor.get()
+        record = (time.time(), device, actor if actor is not None else self._actor, verb, bytes(frame),
+                  None if response is None else bytes(response), None if error is None else repr(error), latency)
+        if self._policy == AUDIT_POLICY_BLOCK:
+            # nothing would make room once the writer is stopped
+            while not self._stop.is_set() and self._thread.is_alive():
+                try:
+                    self._queue.put(record, timeout=self._interval)
+                    return
+                except queue.Full:
+                    pass
+        elif not self._stop.is_set():
+            try:
+                self._queue.put_nowait(record)
+                return
+            except queue.Full:
+                pass
+        with self._lock:
+            self._dropped += 1
+
+    def flush(self):
+        """
+        Wait for the queued records to be written.
+        """
+        self._queue.join()
+
+    def query(self, device: str = None, start: float = None, end: float = None, limit: int = None) -> list:
+        """
+        Read the written records
+
+        Parameters
+        ----------
+        device: str
+            Device id, every device if omitted
+        start: float
+            Earliest time (seconds since the epoch, included), no lower bound if omitted
+        end: float
+            Latest time (excluded), no upper bound if omitted
+        limit: int
+            Maximum number of records, unlimited if omitted
+
+        Returns
+        -------
+        records: list
+            AuditRecord in time order
+        """
+        conditions = []
+        parameters = []
+        if device is not None:
+            conditions.append('device = ?')
+            parameters.append(device)
+        if start is not None:
+            conditions.append('timestamp >= ?')
+            parameters.append(start)
+        if end is not None:
+            conditions.append('timestamp < ?')
+            parameters.append(end)
+        sql = 'SELECT timestamp, device, actor, verb, frame, response, error, latency FROM audit'
+        if conditions:
+            sql += ' WHERE ' + ' AND '.join(conditions)
+        sql += ' ORDER BY timestamp, id'
+        if limit is not None:
+            sql += ' LIMIT ?'
+            parameters.append(limit)
+        connection = sqlite3.connect(self._path)
+        try:
+            return [AuditRecord(*row) for row in connection.execute(sql, parameters)]
+        finally:
+            connection.close()
+
+    def close(self):
+        """
+        Write the queued records and stop the writer.
+        """
+        self._stop.set()
+        self._thread.join()
+
+    def __enter__(self) -> 'AuditLog':
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _run(self):
+        connection = sqlite3.connect(self._path)
+        try:
+            while True:
+                try:
+                    batch = [self._queue.get(timeout=self._interval)]
+                except queue.Empty:
+                    if self._stop.is_set():
+                        break
+                    continue
+                while len(batch) < self._batch_size:
+                    try:
+                        batch.append(self._queue.get_nowait())
+                    except queue.Empty:
+                        break
+                try:
+                    with connection:
+                        connection.executemany(
+                            'INSERT INTO audit (timestamp, device, actor, verb, frame, response, error, latency) '
+                            'VALUES (?, ?, ?, ?, ?, ?, ?, ?)', batch)
+                except Exception as e:
+                    # the batch is lost, the next ones are still tried
+                    with self._lock:
+                        self._error = e
+                for _ in batch:
+                    self._queue.task_done()
+        finally:
+            connection.close()
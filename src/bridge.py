@@ -0,0 +1,583 @@
+import json
+import socket
+import socketserver
+import struct
+import threading
+
+from command_queue import CommandQueue
+from main import (
+    PNS_LED_MODE,
+    PnsRunControlData,
+    PnsDetailRunControlData,
+    PnsDetailStatusData,
+    pns_smart_mode_command,
+    pns_mute_command,
+    pns_stop_pulse_input_command,
+    pns_run_control_command,
+    pns_detail_run_control_command,
+    pns_clear_command,
+    phn_write_command,
+)
+
+BRIDGE_TOPIC_PREFIX = 'lapoe'
+"""first level of the topics of the bridge"""
+
+# topics of a device, below <prefix>/<device id>/
+BRIDGE_STATUS_TOPIC = 'status'
+"""changed status fields, one topic per field (JSON value, null when the field disappears)"""
+BRIDGE_COMMAND_TOPIC = 'command'
+"""commands, one topic per command name (JSON arguments)"""
+BRIDGE_RESULT_TOPIC = 'result'
+"""outcome of the commands, one topic per command name (JSON object with the error, null on success)"""
+
+# command function and argument conversion of each command name
+# (the reboot command is not exposed, it would need the password on the broker)
+_BRIDGE_COMMANDS = {
+    'smart_mode': (pns_smart_mode_command, lambda value: (int(value),)),
+    'mute': (pns_mute_command, lambda value: (int(value),)),
+    'stop_pulse_input': (pns_stop_pulse_input_command, lambda value: (int(value),)),
+    'run_control': (pns_run_control_command, lambda value: (PnsRunControlData(*(int(v) for v in value)),)),
+    'detail_run_control': (pns_detail_run_control_command,
+                           lambda value: (PnsDetailRunControlData(*(int(v) for v in value)),)),
+    'clear': (pns_clear_command, lambda value: ()),
+    'phn_write': (phn_write_command, lambda value: (int(value),)),
+}
+
+# frame of the stand-in broker protocol: operation, topic size, payload size (topic and payload follow)
+_BROKER_FRAME = struct.Struct('>BHI')
+_BROKER_PUBLISH = 1
+_BROKER_SUBSCRIBE = 2
+_BROKER_UNSUBSCRIBE = 3
+
+
+def topic_matches(pattern: str, topic: str) -> bool:
+    """
+    Check a topic against a subscription pattern
+
+    Parameters
+    ----------
+    pattern: str
+        Topic filter, '+' matches one level and a final '#' any number of levels (as in MQTT)
+    topic: str
+        Topic of a message
+
+    Returns
+    -------
+    match: bool
+        True if the topic matches
+    """
+    levels = topic.split('/')
+    filters = pattern.split('/')
+    for i, level in enumerate(filters):
+        if level == '#':
+            return True
+        if i >= len(levels) or (level != '+' and level != levels[i]):
+            return False
+    return len(filters) == len(levels)
+
+
+def status_fields(status) -> dict:
+    """
+    Flatten a status into the fields published by the bridge
+
+    Parameters
+    ----------
+    status: PnsStatusData or PnsDetailStatusData
+        Received data of status acquisition command or detail status acquisition command
+
+    Returns
+    -------
+    fields: dict
+        JSON-serializable value of each field name
+    """
+    fields = {'mode': status.mode, 'input': list(status.input)}
+    if isinstance(status, PnsDetailStatusData):
+        fields['mac_address'] = status.mac_address.hex('-')
+        if status.mode == PNS_LED_MODE:
+            data = status.led_mode_detail_data
+        else:
+            data = status.smart_mode_detail_data
+            smart = data.smart_mode_data
+            fields['smart_mode'] = {'group_no': smart.group_no, 'mute': smart.mute, 'stop_input': smart.stop_input,
+                                    'pattern_no': smart.pattern_no, 'last_pattern': smart.last_pattern}
+        units = (data.led_unit1_data, data.led_unit2_data, data.led_unit3_data, data.led_unit4_data,
+                 data.led_unit5_data)
+        for i, unit in enumerate(units, 1):
+            fields['led%d' % i] = {'pattern': unit.led_pattern, 'red': unit.red, 'green': unit.green,
+                                   'blue': unit.blue}
+        fields['buzzer_pattern'] = data.buzzer_pattern
+    elif status.mode == PNS_LED_MODE:
+        data = status.led_mode_data
+        patterns = (data.led1_pattern, data.led2_pattern, data.led3_pattern, data.led4_pattern, data.led5_pattern)
+        for i, pattern in enumerate(patterns, 1):
+            fields['led%d' % i] = {'pattern': pattern}
+        fields['buzzer_pattern'] = data.buzzer_pattern
+    else:
+        smart = status.smart_mode_data
+        fields['smart_mode'] = {'group_no': smart.group_no, 'mute': smart.mute, 'stop_input': smart.stop_input,
+                                'pattern_no': smart.pattern_no}
+    return fields
+
+
+class StatusBridge:
+    """publishes status changes to a broker and executes the commands received from it"""
+
+    def __init__(self, pool, broker, prefix: str = BRIDGE_TOPIC_PREFIX, batch_size: int = 256,
+                 interval: float = 0.05, max_pending: int = 65536, max_device_commands: int = 8,
+                 commands: CommandQueue = None, on_error=None, max_retry_delay: float = 5.0):
+        """
+        publishes status changes to a broker and executes the commands received from it
+
+        Only the fields that changed since the last update of a device are published. Messages waiting to be
+        published are kept per topic, a newer value replacing the waiting one, so the buffer is bounded by the
+        number of topics whatever the rate of change; update blocks while max_pending topics are waiting.
+
+        The broker is any object with publish(messages), subscribe(pattern, callback) and
+        unsubscribe(pattern, callback) (LocalBroker, BrokerClient or an adapter to an MQTT client);
+        device ids must not contain '/', '+' or '#'
+
+        Parameters
+        ----------
+        pool: ConnectionPool
+            Connections to the devices
+        broker:
+            Broker the messages are published to and the commands received from
+        prefix: str
+            First level of the topics
+        batch_size: int
+            Maximum number of messages handed to the broker in one publish
+        interval: float
+            Seconds between two publishes when fewer than batch_size messages are waiting
+        max_pending: int
+            Maximum number of status topics waiting to be published
+        max_device_commands: int
+            Maximum number of commands of a device waiting to be sent, the following ones are refused
+        commands: CommandQueue
+            Queue the received commands are sent through, a new one on the pool if omitted
+        on_error: callable
+            Called with the exception when the broker fails to publish a batch (the batch is published again)
+        max_retry_delay: float
+            Maximum seconds between two publishes while the broker fails, the delay starts at interval
+            and doubles after every failure
+        """
+        self._pool = pool
+        self._broker = broker
+        self._prefix = prefix
+        self._batch_size = batch_size
+        self._interval = interval
+        self._max_pending = max_pending
+        self._max_device_commands = max_device_commands
+        self._own_commands = commands is None
+        self._commands = CommandQueue(pool) if commands is None else commands
+        self._on_error = on_error
+        self._max_retry_delay = max_retry_delay
+        self._condition = threading.Condition()
+        self._published = {}
+        self._pending = {}
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def pending(self) -> int:
+        """number of messages waiting to be published"""
+        with self._condition:
+            return len(self._pending)
+
+    def update(self, device: str, status, timestamp: float = None) -> list:
+        """
+        Publish the fields of a status that changed since the last update of the device
+
+        The signature matches the on_status callback of ShardSupervisor
+
+        Parameters
+        ----------
+        device: str
+            Device id
+        status: PnsStatusData or PnsDetailStatusData
+            New status of the device
+        timestamp: float
+            Time of the status (unused)
+
+        Returns
+        -------
+        changed: list
+            names of the changed fields
+        """
+        fields = status_fields(status)
+        topic = '%s/%s/%s/' % (self._prefix, device, BRIDGE_STATUS_TOPIC)
+        with self._condition:
+            previous = self._published.get(device, {})
+            self._published[device] = fields
+            changed = [name for name, value in fields.items() if previous.get(name) != value]
+            changed.extend(name for name in previous if name not in fields)
+            messages = {topic + name: json.dumps(fields.get(name)).encode('utf-8') for name in changed}
+            # only new topics take room, a waiting message is replaced in place
+            while (self._pending and
+                   len(self._pending) + sum(1 for t in messages if t not in self._pending) > self._max_pending):
+                self._condition.wait()
+            self._put(messages)
+        return changed
+
+    def forget(self, device: str):
+        """
+        Forget the last published status of a device, its next update publishes every field
+
+        Parameters
+        ----------
+        device: str
+            Device id
+        """
+        with self._condition:
+            self._published.pop(device, None)
+
+    def _put(self, messages: dict):
+        # called with the condition held
+        self._pending.update(messages)
+        if len(self._pending) >= self._batch_size:
+            self._condition.notify_all()
+
+    def _on_command(self, topic: str, payload: bytes):
+        levels = topic.split('/')
+        if len(levels) != len(self._prefix.split('/')) + 3 or levels[-1] not in _BRIDGE_COMMANDS:
+            return
+        device, name = levels[-3], levels[-1]
+        if self._commands.pending(device) >= self._max_device_commands:
+            self._result(device, name, 'busy')
+            return
+        command, convert = _BRIDGE_COMMANDS[name]
+        try:
+            args = convert(json.loads(payload) if payload else None)
+        except (TypeError, ValueError) as e:
+            self._result(device, name, 'invalid arguments: %s' % e)
+            return
+        future = self._commands.submit(device, command, *args)
+        future.add_done_callback(
+            lambda f: self._result(device, name, None if f.exception() is None else str(f.exception())))
+
+    def _result(self, device: str, name: str, error: str):
+        # results never wait for room, there is at most one per device and command name
+        topic = '%s/%s/%s/%s' % (self._prefix, device, BRIDGE_RESULT_TOPIC, name)
+        with self._condition:
+            self._put({topic: json.dumps({'error': error}).encode('utf-8')})
+
+    def flush(self) -> int:
+        """
+        Publish the waiting messages, batch_size at a time
+
+        Returns
+        -------
+        count: int
+            number of messages published
+        """
+        return self._publish()[0]
+
+    def _publish(self) -> tuple:
+        # (number of messages published, True if the broker failed)
+        count = 0
+        while True:
+            with self._condition:
+                if not self._pending:
+                    return count, False
+                batch = []
+                for topic in self._pending:
+                    batch.append((topic, self._pending[topic]))
+                    if len(batch) >= self._batch_size:
+                        break
+                for topic, payload in batch:
+                    del self._pending[topic]
+                self._condition.notify_all()
+            try:
+                self._broker.publish(batch)
+            except Exception as e:
+                with self._condition:
+                    # keep the newer values of the topics updated in the meantime
+                    for topic, payload in batch:
+                        self._pending.setdefault(topic, payload)
+                if self._on_error is not None:
+                    self._on_error(e)
+                return count, True
+            count += len(batch)
+
+    def start(self):
+        """
+        Subscribe to the command topics and start publishing in a background thread.
+        """
+        self._broker.subscribe('%s/+/%s/+' % (self._prefix, BRIDGE_COMMAND_TOPIC), self._on_command)
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stop receiving commands, wait for the pending ones and publish the waiting messages.
+        """
+        self._broker.unsubscribe('%s/+/%s/+' % (self._prefix, BRIDGE_COMMAND_TOPIC), self._on_command)
+        if self._own_commands:
+            self._commands.close()
+        self._stop.set()
+        with self._condition:
+            self._condition.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.flush()
+
+    def _run(self):
+        delay = self._interval
+        while not self._stop.is_set():
+            with self._condition:
+                if len(self._pending) < self._batch_size:
+                    self._condition.wait(self._interval)
+            if self._publish()[1]:
+                # the waiting messages are kept, do not hammer a failing broker with them
+                self._stop.wait(delay)
+                delay = min(delay * 2, self._max_retry_delay)
+            else:
+                delay = self._interval
+
+
+class LocalBroker:
+    """in-process publish/subscribe broker standing in for an MQTT broker"""
+
+    def __init__(self):
+        """
+        in-process publish/subscribe broker standing in for an MQTT broker
+
+        Messages are delivered in the thread of the publisher, so a slow subscriber slows its publishers down
+        """
+        self._lock = threading.Lock()
+        self._subscriptions = []
+
+    def subscribe(self, pattern: str, callback):
+        """
+        Register a function called with (topic, payload) for each message matching a pattern
+
+        Parameters
+        ----------
+        pattern: str
+            Topic filter ('+' and '#' wildcards)
+        callback: callable
+            Called from the thread that publishes
+        """
+        with self._lock:
+            self._subscriptions = self._subscriptions + [(pattern, callback)]
+
+    def unsubscribe(self, pattern: str, callback):
+        """
+        Unregister a function registered with subscribe
+
+        Parameters
+        ----------
+        pattern: str
+            Topic filter
+        callback: callable
+            Registered function
+        """
+        with self._lock:
+            self._subscriptions = [(p, c) for p, c in self._subscriptions if p != pattern or c is not callback]
+
+    def publish(self, messages):
+        """
+        Deliver messages to the matching subscriptions
+
+        Parameters
+        ----------
+        messages:
+            (topic, payload bytes) of each message, in delivery order
+        """
+        subscriptions = self._subscriptions
+        for topic, payload in messages:
+            for pattern, callback in subscriptions:
+                if topic_matches(pattern, topic):
+                    callback(topic, payload)
+
+
+def _recv_exactly(sock: socket.socket, size: int) -> bytes:
+    data = b''
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            raise ConnectionResetError('connection closed')
+        data += chunk
+    return data
+
+
+def _recv_frame(sock: socket.socket) -> tuple:
+    operation, topic_size, payload_size = _BROKER_FRAME.unpack(_recv_exactly(sock, _BROKER_FRAME.size))
+    topic = _recv_exactly(sock, topic_size).decode('utf-8')
+    return operation, topic, _recv_exactly(sock, payload_size)
+
+
+def _frame(operation: int, topic: str, payload: bytes = b'') -> bytes:
+    topic = topic.encode('utf-8')
+    return _BROKER_FRAME.pack(operation, len(topic), len(payload)) + topic + payload
+
+
+class _BrokerRequestHandler(socketserver.BaseRequestHandler):
+
+    def handle(self):
+        broker = self.server.broker
+        lock = threading.Lock()
+        patterns = set()
+
+        def deliver(topic: str, payload: bytes):
+            # one frame per message, however many patterns of the connection match
+            if any(topic_matches(pattern, topic) for pattern in patterns):
+                try:
+                    with lock:
+                        self.request.sendall(_frame(_BROKER_PUBLISH, topic, payload))
+                except OSError:
+                    # the connection is closing, the handler unsubscribes
+                    pass
+
+        broker.subscribe('#', deliver)
+        try:
+            while True:
+                operation, topic, payload = _recv_frame(self.request)
+                if operation == _BROKER_PUBLISH:
+                    broker.publish([(topic, payload)])
+                elif operation == _BROKER_SUBSCRIBE:
+                    patterns = patterns | {topic}
+                elif operation == _BROKER_UNSUBSCRIBE:
+                    patterns = patterns - {topic}
+        except OSError:
+            pass
+        finally:
+            broker.unsubscribe('#', deliver)
+
+
+class BrokerStandInServer(socketserver.ThreadingTCPServer):
+    """local TCP broker serving a LocalBroker to BrokerClient connections"""
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address: tuple, broker: LocalBroker = None):
+        """
+        local TCP broker serving a LocalBroker to BrokerClient connections
+
+        A client reading slowly fills its socket buffers and then slows the publishers down
+
+        Parameters
+        ----------
+        address: tuple
+            (IP address, port number) to listen on, port 0 selects a free port
+        broker: LocalBroker
+            Broker shared by the connections, a new one is created if omitted
+        """
+        super().__init__(address, _BrokerRequestHandler)
+        self.broker = broker if broker is not None else LocalBroker()
+
+    def start(self) -> threading.Thread:
+        """
+        Serve in a background thread
+
+        Returns
+        -------
+        thread: threading.Thread
+            thread running the server
+        """
+        thread = threading.Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+        return thread
+
+
+class BrokerClient:
+    """connection to a BrokerStandInServer, with the interface of LocalBroker"""
+
+    def __init__(self, address: tuple, timeout: float = 5.0):
+        """
+        connection to a BrokerStandInServer, with the interface of LocalBroker
+
+        Parameters
+        ----------
+        address: tuple
+            (IP address, port number) of the server
+        timeout: float
+            Connect timeout in seconds
+        """
+        self._sock = socket.create_connection(address, timeout)
+        self._sock.settimeout(None)
+        self._send_lock = threading.Lock()
+        self._lock = threading.Lock()
+        self._subscriptions = []
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def subscribe(self, pattern: str, callback):
+        """
+        Register a function called with (topic, payload) for each message matching a pattern
+
+        Parameters
+        ----------
+        pattern: str
+            Topic filter ('+' and '#' wildcards)
+        callback: callable
+            Called from the receiving thread of the client
+        """
+        with self._lock:
+            new = all(p != pattern for p, _ in self._subscriptions)
+            self._subscriptions = self._subscriptions + [(pattern, callback)]
+        if new:
+            self._send(_frame(_BROKER_SUBSCRIBE, pattern))
+
+    def unsubscribe(self, pattern: str, callback):
+        """
+        Unregister a function registered with subscribe
+
+        Parameters
+        ----------
+        pattern: str
+            Topic filter
+        callback: callable
+            Registered function
+        """
+        with self._lock:
+            self._subscriptions = [(p, c) for p, c in self._subscriptions if p != pattern or c is not callback]
+            last = all(p != pattern for p, _ in self._subscriptions)
+        if last:
+            self._send(_frame(_BROKER_UNSUBSCRIBE, pattern))
+
+    def publish(self, messages):
+        """
+        Send messages to the server, in one write
+
+        Parameters
+        ----------
+        messages:
+            (topic, payload bytes) of each message, in delivery order
+        """
+        self._send(b''.join(_frame(_BROKER_PUBLISH, topic, payload) for topic, payload in messages))
+
+    def _send(self, data: bytes):
+        with self._send_lock:
+            self._sock.sendall(data)
+
+    def close(self):
+        """
+        Close the connection.
+        """
+        try:
+            self._sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self._sock.close()
+        self._thread.join()
+
+    def __enter__(self) -> 'BrokerClient':
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _run(self):
+        try:
+            while True:
+                operation, topic, payload = _recv_frame(self._sock)
+                if operation != _BROKER_PUBLISH:
+                    continue
+                for pattern, callback in self._subscriptions:
+                    if topic_matches(pattern, topic):
+                        callback(topic, payload)
+        except OSError:
+            pass
@@ -0,0 +1,198 @@
+import functools
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from main import (
+    PNS_DETAIL_RUN_CONTROL_LED_OFF,
+    PNS_DETAIL_RUN_CONTROL_LED_COLOR_RED,
+    PNS_DETAIL_RUN_CONTROL_LED_COLOR_YELLOW,
+    PNS_DETAIL_RUN_CONTROL_LED_COLOR_LEMON,
+    PNS_DETAIL_RUN_CONTROL_LED_COLOR_GREEN,
+    PNS_DETAIL_RUN_CONTROL_LED_COLOR_SKY_BLUE,
+    PNS_DETAIL_RUN_CONTROL_LED_COLOR_BLUE,
+    PNS_DETAIL_RUN_CONTROL_LED_COLOR_PURPLE,
+    PNS_DETAIL_RUN_CONTROL_LED_COLOR_PEACH,
+    PNS_DETAIL_RUN_CONTROL_LED_COLOR_WHITE,
+    PNS_RUN_CONTROL_LED_OFF,
+    PNS_LED_MODE,
+    PnsDetailRunControlData,
+    PnsDetailStatusData,
+)
+
+NOMINAL_COLOR_RGB = {
+    PNS_DETAIL_RUN_CONTROL_LED_OFF: (0, 0, 0),
+    PNS_DETAIL_RUN_CONTROL_LED_COLOR_RED: (255, 0, 0),
+    PNS_DETAIL_RUN_CONTROL_LED_COLOR_YELLOW: (255, 128, 0),
+    PNS_DETAIL_RUN_CONTROL_LED_COLOR_LEMON: (255, 255, 0),
+    PNS_DETAIL_RUN_CONTROL_LED_COLOR_GREEN: (0, 255, 0),
+    PNS_DETAIL_RUN_CONTROL_LED_COLOR_SKY_BLUE: (0, 255, 255),
+    PNS_DETAIL_RUN_CONTROL_LED_COLOR_BLUE: (0, 0, 255),
+    PNS_DETAIL_RUN_CONTROL_LED_COLOR_PURPLE: (128, 0, 255),
+    PNS_DETAIL_RUN_CONTROL_LED_COLOR_PEACH: (255, 96, 128),
+    PNS_DETAIL_RUN_CONTROL_LED_COLOR_WHITE: (255, 255, 255),
+}
+"""nominal RGB of each color of the detailed operation control command"""
+
+
+def nearest_detail_color(red: int, green: int, blue: int, color_table: dict = None) -> int:
+    """
+    Get the color of the detailed operation control command closest to an RGB value
+
+    Parameters
+    ----------
+    red: int
+        R
+    green: int
+        G
+    blue: int
+        B
+    color_table: dict
+        RGB per color code or ColorLookupTable, NOMINAL_COLOR_RGB if omitted
+
+    Returns
+    -------
+    color: int
+        color of the LED unit (off: 0, red: 1, yellow: 2, lemon: 3, green: 4, sky blue: 5, blue: 6, purple: 7, peach: 8, white: 9)
+    """
+    if isinstance(color_table, ColorLookupTable):
+        return color_table.nearest(red, green, blue)
+    if color_table is None:
+        return _NOMINAL_LOOKUP_TABLE.nearest(red, green, blue)
+    best_color = PNS_DETAIL_RUN_CONTROL_LED_OFF
+    best_distance = None
+    for color, (r, g, b) in color_table.items():
+        distance = (red - r) ** 2 + (green - g) ** 2 + (blue - b) ** 2
+        if best_distance is None or distance < best_distance:
+            best_color = color
+            best_distance = distance
+    return best_color
+
+
+def calibrate_color_table(status: PnsDetailStatusData, detail_run_control_data: PnsDetailRunControlData,
+                          color_table: dict = None) -> dict:
+    """
+    Record the RGB reported by a device for the colors it was set to
+
+    Parameters
+    ----------
+    status: PnsDetailStatusData
+        Received data of detail status acquisition command, read after the detailed operation control command
+    detail_run_control_data: PnsDetailRunControlData
+        Detailed operation control data sent to the device
+    color_table: dict
+        RGB per color code to update, a copy of NOMINAL_COLOR_RGB if omitted
+
+    Returns
+    -------
+    color_table: dict
+        RGB per color code
+    """
+    if color_table is None:
+        color_table = dict(NOMINAL_COLOR_RGB)
+    if status.mode == PNS_LED_MODE:
+        detail_data = status.led_mode_detail_data
+    else:
+        detail_data = status.smart_mode_detail_data
+    units = (
+        detail_data.led_unit1_data,
+        detail_data.led_unit2_data,
+        detail_data.led_unit3_data,
+        detail_data.led_unit4_data,
+        detail_data.led_unit5_data,
+    )
+    colors = detail_run_control_data.get_bytes()[0:5]
+    for color, unit in zip(colors, units):
+        if color != PNS_DETAIL_RUN_CONTROL_LED_OFF and unit.led_pattern != PNS_RUN_CONTROL_LED_OFF:
+            color_table[color] = (unit.red, unit.green, unit.blue)
+    return color_table
+
+
+class ColorLookupTable:
+    """nearest color code of RGB values, cached and vectorized with NumPy when installed"""
+
+    def __init__(self, color_table: dict = None, cache_size: int = 4096):
+        """
+        nearest color code of RGB values, cached and vectorized with NumPy when installed
+
+        Parameters
+        ----------
+        color_table: dict
+            RGB per color code (calibrate_color_table, ...), NOMINAL_COLOR_RGB if omitted
+        cache_size: int
+            Number of RGB values whose color code is kept by nearest
+        """
+        if color_table is None:
+            color_table = NOMINAL_COLOR_RGB
+        self._codes = tuple(color_table)
+        self._rgb = tuple(tuple(color_table[code]) for code in self._codes)
+        if numpy is not None:
+            self._codes_array = numpy.array(self._codes, dtype=numpy.uint8)
+            self._rgb_array = numpy.array(self._rgb, dtype=numpy.int32)
+        self._nearest_cached = functools.lru_cache(maxsize=cache_size)(self._nearest)
+
+    @property
+    def color_table(self) -> dict:
+        """RGB per color code"""
+        return dict(zip(self._codes, self._rgb))
+
+    def nearest(self, red: int, green: int, blue: int) -> int:
+        """
+        Get the color code closest to an RGB value
+
+        Parameters
+        ----------
+        red: int
+            R
+        green: int
+            G
+        blue: int
+            B
+
+        Returns
+        -------
+        color: int
+            color of the LED unit
+        """
+        return self._nearest_cached(red, green, blue)
+
+    def _nearest(self, red: int, green: int, blue: int) -> int:
+        best_color = PNS_DETAIL_RUN_CONTROL_LED_OFF
+        best_distance = None
+        for color, (r, g, b) in zip(self._codes, self._rgb):
+            distance = (red - r) ** 2 + (green - g) ** 2 + (blue - b) ** 2
+            if best_distance is None or distance < best_distance:
+                best_color = color
+                best_distance = distance
+        return best_color
+
+    def nearest_many(self, rgb):
+        """
+        Get the color codes closest to a batch of RGB values in one call
+
+        Parameters
+        ----------
+        rgb:
+            RGB values, array of shape (..., 3) (towers x LED units x RGB for a fleet frame)
+
+        Returns
+        -------
+        colors:
+            color codes, numpy.ndarray (uint8) of shape (...) with NumPy, nested lists of the same shape without
+        """
+        if numpy is None:
+            return self._nearest_lists(rgb)
+        rgb = numpy.asarray(rgb, dtype=numpy.int32)
+        # squared distance of every value to every color: (..., colors)
+        distance = ((rgb[..., numpy.newaxis, :] - self._rgb_array) ** 2).sum(axis=-1)
+        return self._codes_array[distance.argmin(axis=-1)]
+
+    def _nearest_lists(self, rgb):
+        if len(rgb) and not hasattr(rgb[0], '__len__'):
+            return self.nearest(*rgb)
+        return [self._nearest_lists(value) for value in rgb]
+
+
+_NOMINAL_LOOKUP_TABLE = ColorLookupTable()
@@ -0,0 +1,272 @@
+import collections
+import concurrent.futures
+import heapq
+import itertools
+import threading
+import time
+
+from fleet import TokenBucket
+from main import (
+    pns_smart_mode_command,
+    pns_run_control_command,
+    pns_detail_run_control_command,
+    pns_clear_command,
+    pns_get_data_command,
+    pns_get_detail_data_command,
+    phn_write_command,
+    phn_read_command,
+)
+
+# priority lane of a queued command
+COMMAND_PRIORITY_URGENT = 0
+"""alarms and clears"""
+COMMAND_PRIORITY_WRITE = 1
+"""routine state writes"""
+COMMAND_PRIORITY_POLL = 2
+"""status polls"""
+
+COMMAND_KEY_LED_STATE = 'led'
+"""supersede key of the commands that replace the whole LED unit/buzzer state"""
+
+# default lane and supersede key of each command
+_COMMAND_DEFAULTS = {
+    pns_clear_command: (COMMAND_PRIORITY_URGENT, COMMAND_KEY_LED_STATE),
+    pns_smart_mode_command: (COMMAND_PRIORITY_WRITE, COMMAND_KEY_LED_STATE),
+    pns_run_control_command: (COMMAND_PRIORITY_WRITE, None),
+    pns_detail_run_control_command: (COMMAND_PRIORITY_WRITE, COMMAND_KEY_LED_STATE),
+    phn_write_command: (COMMAND_PRIORITY_WRITE, COMMAND_KEY_LED_STATE),
+    pns_get_data_command: (COMMAND_PRIORITY_POLL, 'G'),
+    pns_get_detail_data_command: (COMMAND_PRIORITY_POLL, 'E'),
+    phn_read_command: (COMMAND_PRIORITY_POLL, 'R'),
+}
+
+_DEFAULT = object()
+
+
+def command_defaults(command) -> tuple:
+    """
+    Get the default lane and supersede key of a command
+
+    Parameters
+    ----------
+    command: callable
+        Command function of main.py
+
+    Returns
+    -------
+    defaults: tuple
+        (lane, supersede key), the write lane without key for unknown commands
+    """
+    return _COMMAND_DEFAULTS.get(command, (COMMAND_PRIORITY_WRITE, None))
+
+
+class _QueuedCommand:
+
+    __slots__ = ('command', 'args', 'key', 'futures', 'cancelled')
+
+    def __init__(self, command, args: tuple, key, future: concurrent.futures.Future):
+        self.command = command
+        self.args = args
+        self.key = key
+        self.futures = [future]
+        self.cancelled = False
+
+
+class _DeviceQueue:
+
+    __slots__ = ('lanes', 'keys', 'bucket', 'busy', 'size')
+
+    def __init__(self, bucket: TokenBucket):
+        self.lanes = (collections.deque(), collections.deque(), collections.deque())
+        self.keys = {}
+        self.bucket = bucket
+        self.busy = False
+        self.size = 0
+
+
+class CommandQueue:
+    """per-device outbound queue with rate limiting and priority lanes"""
+
+    def __init__(self, pool, rate: float = 10.0, burst: float = 1.0, max_workers: int = 32):
+        """
+        per-device outbound queue with rate limiting and priority lanes
+
+        Commands of a device are sent one at a time, urgent lane first, then writes, then polls;
+        a device waiting for its rate limit does not hold a worker
+
+        Parameters
+        ----------
+        pool: ConnectionPool
+            Connections to the devices
+        rate: float
+            Maximum number of commands per second to each device
+        burst: float
+            Number of commands that can be sent back to back to a device
+        max_workers: int
+            Maximum number of devices served concurrently
+        """
+        self._pool = pool
+        self._rate = rate
+        self._burst = burst
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers)
+        self._lock = threading.Lock()
+        self._devices = {}
+        self._timer_condition = threading.Condition()
+        self._timers = []
+        self._timer_sequence = itertools.count()
+        self._timer_thread = None
+        self._closed = False
+
+    def submit(self, device: str, command, *args, priority: int = None, key=_DEFAULT) -> concurrent.futures.Future:
+        """
+        Queue a command for a device
+
+        A queued command with the same supersede key is replaced by the new one, whatever its lane;
+        the future of the replaced command receives the result of the new one
+
+        Parameters
+        ----------
+        device: str
+            Device id
+        command: callable
+            Command function of main.py
+        args:
+            Arguments of the command other than sock
+        priority: int
+            Lane (urgent: 0, write: 1, poll: 2), the default of the command if omitted
+        key:
+            Supersede key, the default of the command if omitted, None never supersedes
+
+        Returns
+        -------
+        future: concurrent.futures.Future
+            result of the command
+        """
+        default_priority, default_key = command_defaults(command)
+        if priority is None:
+            priority = default_priority
+        if key is _DEFAULT:
+            key = default_key
+        future = concurrent.futures.Future()
+        item = _QueuedCommand(command, args, key, future)
+
+        with self._lock:
+            queue = self._devices.get(device)
+            if queue is None:
+                queue = _DeviceQueue(TokenBucket(self._rate, self._burst))
+                self._devices[device] = queue
+            if key is not None:
+                previous = queue.keys.get(key)
+                if previous is not None:
+                    previous.cancelled = True
+                    item.futures.extend(previous.futures)
+                    queue.size -= 1
+                queue.keys[key] = item
+            queue.lanes[priority].append(item)
+            queue.size += 1
+            start = not queue.busy
+            queue.busy = True
+
+        if start:
+            self._executor.submit(self._drain, device, queue)
+        return future
+
+    def pending(self, device: str) -> int:
+        """
+        Get the number of queued commands of a device
+
+        Parameters
+        ----------
+        device: str
+            Device id
+
+        Returns
+        -------
+        count: int
+            number of commands not sent yet
+        """
+        with self._lock:
+            queue = self._devices.get(device)
+            return queue.size if queue is not None else 0
+
+    def _next(self, queue: _DeviceQueue) -> _QueuedCommand:
+        for lane in queue.lanes:
+            while lane:
+                item = lane.popleft()
+                if item.cancelled:
+                    continue
+                queue.size -= 1
+                if item.key is not None and queue.keys.get(item.key) is item:
+                    del queue.keys[item.key]
+                return item
+        return None
+
+    def _defer(self, delay: float, device: str, queue: _DeviceQueue):
+        with self._timer_condition:
+            heapq.heappush(self._timers, (time.monotonic() + delay, next(self._timer_sequence), device, queue))
+            if self._timer_thread is None:
+                self._timer_thread = threading.Thread(target=self._run_timers, daemon=True)
+                self._timer_thread.start()
+            self._timer_condition.notify()
+
+    def _run_timers(self):
+        while True:
+            with self._timer_condition:
+                while not self._closed:
+                    delay = self._timers[0][0] - time.monotonic() if self._timers else None
+                    if delay is not None and delay <= 0:
+                        break
+                    self._timer_condition.wait(delay)
+                if self._closed:
+                    return
+                when, sequence, device, queue = heapq.heappop(self._timers)
+            self._executor.submit(self._drain, device, queue)
+
+    def _drain(self, device: str, queue: _DeviceQueue):
+        # take the token first, so a command queued while waiting can still go ahead
+        delay = queue.bucket.try_acquire()
+        if delay:
+            # release the worker to the other devices until the token is available
+            self._defer(delay, device, queue)
+            return
+        with self._lock:
+            item = self._next(queue)
+            if item is None:
+                queue.busy = False
+                return
+
+        try:
+            result = self._pool.run(device, item.command, *item.args)
+        except Exception as e:
+            for future in item.futures:
+                future.set_exception(e)
+        else:
+            for future in item.futures:
+                future.set_result(result)
+
+        with self._lock:
+            if queue.size == 0:
+                queue.busy = False
+                return
+        # let other devices use the worker before sending the next command of this one
+        self._executor.submit(self._drain, device, queue)
+
+    def close(self, wait: bool = True):
+        """
+        Stop accepting work
+
+        Parameters
+        ----------
+        wait: bool
+            Wait for the queued commands to be sent
+        """
+        if wait:
+            while True:
+                with self._lock:
+                    if not any(queue.busy for queue in self._devices.values()):
+                        break
+                time.sleep(0.01)
+        with self._timer_condition:
+            self._closed = True
+            self._timer_condition.notify()
+        self._executor.shutdown(wait)
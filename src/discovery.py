@@ -0,0 +1,280 @@
+import asyncio
+import ipaddress
+import sys
+import threading
+import time
+
+from fleet import PNS_PORT
+from main import (
+    LaPoeError,
+    pns_get_detail_data_encode,
+    pns_get_detail_data_decode,
+)
+from transport import AsyncTransport
+
+
+def format_mac_address(mac_address: bytes) -> str:
+    """
+    Format a MAC address
+
+    Parameters
+    ----------
+    mac_address: bytes
+        MAC address (PnsDetailStatusData.mac_address)
+
+    Returns
+    -------
+    mac: str
+        MAC address as xx-xx-xx-xx-xx-xx
+    """
+    return '-'.join('%02x' % b for b in mac_address)
+
+
+class InventoryEntry:
+    """tower found on the network"""
+
+    __slots__ = ('_mac', '_ip', '_port', '_seen')
+
+    def __init__(self, mac: str, ip: str, port: int, seen: float):
+        """
+        tower found on the network
+
+        Parameters
+        ----------
+        mac: str
+            MAC address (xx-xx-xx-xx-xx-xx)
+        ip: str
+            IP address
+        port: int
+            port number
+        seen: float
+            Time of the last answer (seconds since the epoch)
+        """
+        self._mac = mac
+        self._ip = ip
+        self._port = port
+        self._seen = seen
+
+    @property
+    def mac(self) -> str:
+        """MAC address"""
+        return self._mac
+
+    @property
+    def ip(self) -> str:
+        """IP address"""
+        return self._ip
+
+    @property
+    def port(self) -> int:
+        """port number"""
+        return self._port
+
+    @property
+    def seen(self) -> float:
+        """time of the last answer"""
+        return self._seen
+
+    def __repr__(self) -> str:
+        return 'InventoryEntry(%r, %r, %d)' % (self._mac, self._ip, self._port)
+
+
+class Inventory:
+    """towers indexed by MAC address and by IP address"""
+
+    def __init__(self):
+        """
+        towers indexed by MAC address and by IP address
+        """
+        self._lock = threading.Lock()
+        self._by_mac = {}
+        self._by_ip = {}
+
+    def by_mac(self, mac: str) -> InventoryEntry:
+        """
+        Find a tower by MAC address
+
+        Parameters
+        ----------
+        mac: str
+            MAC address (xx-xx-xx-xx-xx-xx)
+
+        Returns
+        -------
+        entry: InventoryEntry
+            tower, None if unknown
+        """
+        with self._lock:
+            return self._by_mac.get(mac.lower().replace(':', '-'))
+
+    def by_ip(self, ip: str) -> InventoryEntry:
+        """
+        Find a tower by IP address
+
+        Parameters
+        ----------
+        ip: str
+            IP address
+
+        Returns
+        -------
+        entry: InventoryEntry
+            tower, None if unknown
+        """
+        with self._lock:
+            return self._by_ip.get(ip)
+
+    @property
+    def entries(self) -> list:
+        """all towers"""
+        with self._lock:
+            return list(self._by_mac.values())
+
+    def update(self, entries: list) -> dict:
+        """
+        Merge the result of a scan
+
+        Parameters
+        ----------
+        entries: list
+            InventoryEntry found by the scan
+
+        Returns
+        -------
+        changes: dict
+            'added': new towers, 'moved': (previous, current) of towers whose address changed
+        """
+        added = []
+        moved = []
+        with self._lock:
+            for entry in entries:
+                previous = self._by_mac.get(entry.mac)
+                if previous is None:
+                    added.append(entry)
+                elif (previous.ip, previous.port) != (entry.ip, entry.port):
+                    moved.append((previous, entry))
+                    if self._by_ip.get(previous.ip) is previous:
+                        del self._by_ip[previous.ip]
+                stale = self._by_ip.get(entry.ip)
+                if stale is not None and stale.mac != entry.mac:
+                    # the address was re-leased to another tower
+                    del self._by_mac[stale.mac]
+                self._by_mac[entry.mac] = entry
+                self._by_ip[entry.ip] = entry
+        return {'added': added, 'moved': moved}
+
+    def missing(self, scanned: list, entries: list) -> list:
+        """
+        Get the known towers of the scanned addresses that did not answer
+
+        Parameters
+        ----------
+        scanned: list
+            Scanned IP addresses
+        entries: list
+            InventoryEntry found by the scan
+
+        Returns
+        -------
+        missing: list
+            InventoryEntry that did not answer
+        """
+        answered = {entry.mac for entry in entries}
+        scanned = set(scanned)
+        with self._lock:
+            return [e for e in self._by_mac.values() if e.ip in scanned and e.mac not in answered]
+
+    def register(self, pool):
+        """
+        Register every tower in a connection pool with its MAC address as device id
+
+        Towers whose address changed are reconnected to the new address
+
+        Parameters
+        ----------
+        pool: ConnectionPool
+            Connections to the devices
+        """
+        for entry in self.entries:
+            pool.add(entry.mac, entry.ip, entry.port)
+
+
+async def probe(ip: str, port: int = PNS_PORT, timeout: float = 0.5) -> InventoryEntry:
+    """
+    Send the get detail status command to an address
+
+    Parameters
+    ----------
+    ip: str
+        IP address
+    port: int
+        port number
+    timeout: float
+        Timeout in seconds of the connection and of the response
+
+    Returns
+    -------
+    entry: InventoryEntry
+        tower answering at the address, None if nothing answered
+    """
+    try:
+        transport = await AsyncTransport.open(ip, port, timeout)
+    except (OSError, asyncio.TimeoutError):
+        return None
+    try:
+        recv_data = await transport.exchange(pns_get_detail_data_encode(), timeout)
+    except (OSError, asyncio.TimeoutError):
+        return None
+    finally:
+        await transport.close()
+    try:
+        status = pns_get_detail_data_decode(recv_data)
+    except (LaPoeError, ValueError):
+        # NAK, or a service on the port that is not a tower
+        return None
+    return InventoryEntry(format_mac_address(status.mac_address), ip, port, time.time())
+
+
+async def scan(network: str, port: int = PNS_PORT, timeout: float = 0.5, concurrency: int = 512) -> list:
+    """
+    Probe every host address of a network
+
+    Parameters
+    ----------
+    network: str
+        Network in CIDR notation (192.168.10.0/22)
+    port: int
+        port number
+    timeout: float
+        Timeout in seconds of each probe
+    concurrency: int
+        Maximum number of probes in flight
+
+    Returns
+    -------
+    entries: list
+        InventoryEntry of every tower that answered
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def bounded_probe(ip: str):
+        async with semaphore:
+            return await probe(ip, port, timeout)
+
+    hosts = [str(ip) for ip in ipaddress.ip_network(network, strict=False).hosts()]
+    results = await asyncio.gather(*(bounded_probe(ip) for ip in hosts))
+    return [entry for entry in results if entry is not None]
+
+
+def main():
+    args = sys.argv
+    if len(args) < 2:
+        print('usage: discovery.py network [port]')
+        return
+    port = int(args[2]) if len(args) >= 3 else PNS_PORT
+    for entry in asyncio.run(scan(args[1], port)):
+        print(entry.mac + " : " + entry.ip)
+
+
+if __name__ == '__main__':
+    main()
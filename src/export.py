@@ -0,0 +1,299 @@
+import os
+import sys
+import threading
+import time
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+from main import (
+    PNS_LED_MODE,
+    PnsDetailStatusData,
+)
+from recorder import Replayer
+
+EXPORT_FILE_SUFFIX = '.parquet'
+"""suffix of the exported files (a file being written ends with .tmp)"""
+
+# columns of a status row, after timestamp and device
+_INPUT_COLUMNS = tuple('input%d' % i for i in range(1, 9))
+_UNIT_COLUMNS = tuple('led%d_%s' % (i, field) for i in range(1, 6) for field in ('pattern', 'red', 'green', 'blue'))
+_STATUS_COLUMNS = ('timestamp', 'device') + _INPUT_COLUMNS + ('mode', 'group_no') + _UNIT_COLUMNS + ('buzzer_pattern',)
+
+
+def status_schema():
+    """
+    Get the Arrow schema of the exported status rows
+
+    Values not reported by the status are null: RGB of the get status command,
+    LED units and buzzer of the get status command in smart mode, group number in LED mode
+
+    Returns
+    -------
+    schema: pyarrow.Schema
+        timestamp (UTC, microseconds), device, input1 to input8 (bool), mode, group_no,
+        led1_pattern, led1_red, led1_green, led1_blue to led5_blue and buzzer_pattern (uint8)
+    """
+    if pyarrow is None:
+        raise ImportError('the columnar export requires pyarrow')
+    fields = [pyarrow.field('timestamp', pyarrow.timestamp('us', tz='UTC'), nullable=False),
+              pyarrow.field('device', pyarrow.string(), nullable=False)]
+    fields.extend(pyarrow.field(name, pyarrow.bool_(), nullable=False) for name in _INPUT_COLUMNS)
+    fields.append(pyarrow.field('mode', pyarrow.uint8(), nullable=False))
+    fields.extend(pyarrow.field(name, pyarrow.uint8()) for name in ('group_no',) + _UNIT_COLUMNS + ('buzzer_pattern',))
+    return pyarrow.schema(fields)
+
+
+class StatusColumns:
+    """column buffers of status rows, converted to Arrow record batches"""
+
+    def __init__(self):
+        """
+        column buffers of status rows, converted to Arrow record batches
+        """
+        self._schema = status_schema()
+        self._columns = [[] for _ in _STATUS_COLUMNS]
+
+    def __len__(self) -> int:
+        return len(self._columns[0])
+
+    def append(self, device: str, status, timestamp: float = None):
+        """
+        Add a status row
+
+        Parameters
+        ----------
+        device: str
+            Device id
+        status: PnsStatusData or PnsDetailStatusData
+            Received data of status acquisition command or detail status acquisition command
+        timestamp: float
+            Time of the status (seconds since the epoch), the current time if omitted
+        """
+        if timestamp is None:
+            timestamp = time.time()
+        row = [round(timestamp * 1000000), device]
+        row.extend(value != 0 for value in status.input)
+        row.append(status.mode)
+        if isinstance(status, PnsDetailStatusData):
+            if status.mode == PNS_LED_MODE:
+                data = status.led_mode_detail_data
+                row.append(None)
+            else:
+                data = status.smart_mode_detail_data
+                row.append(data.smart_mode_data.group_no)
+            for unit in (data.led_unit1_data, data.led_unit2_data, data.led_unit3_data, data.led_unit4_data,
+                         data.led_unit5_data):
+                row.extend((unit.led_pattern, unit.red, unit.green, unit.blue))
+            row.append(data.buzzer_pattern)
+        elif status.mode == PNS_LED_MODE:
+            data = status.led_mode_data
+            row.append(None)
+            for pattern in (data.led1_pattern, data.led2_pattern, data.led3_pattern, data.led4_pattern,
+                            data.led5_pattern):
+                row.extend((pattern, None, None, None))
+            row.append(data.buzzer_pattern)
+        else:
+            row.append(status.smart_mode_data.group_no)
+            row.extend([None] * (len(_UNIT_COLUMNS) + 1))
+        for column, value in zip(self._columns, row):
+            column.append(value)
+
+    def take(self):
+        """
+        Convert the buffered rows and empty the buffers
+
+        Returns
+        -------
+        batch: pyarrow.RecordBatch
+            buffered rows in insertion order
+        """
+        columns, self._columns = self._columns, [[] for _ in _STATUS_COLUMNS]
+        arrays = [pyarrow.array(column, type=field.type) for column, field in zip(columns, self._schema)]
+        return pyarrow.RecordBatch.from_arrays(arrays, schema=self._schema)
+
+
+class StatusExporter:
+    """streams status rows to rolling Parquet files"""
+
+    def __init__(self, directory: str, prefix: str = 'status', row_group_size: int = 131072,
+                 file_rows: int = 16777216, file_duration: float = 3600.0, compression: str = 'zstd'):
+        """
+        streams status rows to rolling Parquet files
+
+        Rows are buffered in columns and written as one row group every row_group_size rows, so each write
+        is a single columnar append. A file is written as <name>.parquet.tmp and renamed when complete,
+        readers of the directory only see finished files. A file is opened with its first row and finished
+        file_duration seconds later, with a partial row group, even if no other row arrives.
+
+        Parameters
+        ----------
+        directory: str
+            Directory of the files, created if it does not exist
+        prefix: str
+            Start of the file names, followed by the opening time (UTC) and a sequence number
+        row_group_size: int
+            Number of rows of each row group
+        file_rows: int
+            Number of rows after which a new file is started
+        file_duration: float
+            Seconds after which a new file is started
+        compression: str
+            Parquet compression codec
+        """
+        self._schema = status_schema()
+        self._directory = directory
+        self._prefix = prefix
+        self._row_group_size = row_group_size
+        self._file_rows = file_rows
+        self._file_duration = file_duration
+        self._compression = compression
+        self._lock = threading.Lock()
+        self._columns = StatusColumns()
+        self._writer = None
+        self._path = None
+        self._timer = None
+        self._opened = 0.0
+        self._rows = 0
+        self._sequence = 0
+        self._files = []
+        os.makedirs(directory, exist_ok=True)
+
+    @property
+    def files(self) -> list:
+        """paths of the finished files"""
+        with self._lock:
+            return list(self._files)
+
+    def write(self, device: str, status, timestamp: float = None):
+        """
+        Add a status row
+
+        The signature matches the on_status callback of ShardSupervisor
+
+        Parameters
+        ----------
+        device: str
+            Device id
+        status: PnsStatusData or PnsDetailStatusData
+            Received data of status acquisition command or detail status acquisition command
+        timestamp: float
+            Time of the status (seconds since the epoch), the current time if omitted
+        """
+        with self._lock:
+            if self._writer is not None and time.monotonic() - self._opened >= self._file_duration:
+                # the buffered rows belong to the expired file
+                self._finish()
+            if self._writer is None:
+                self._open()
+            self._columns.append(device, status, timestamp)
+            if len(self._columns) >= self._row_group_size:
+                self._write_row_group()
+                if self._rows >= self._file_rows:
+                    self._finish()
+
+    def flush(self):
+        """
+        Write the buffered rows as a row group of the current file.
+        """
+        with self._lock:
+            if len(self._columns):
+                self._write_row_group()
+
+    def rotate(self):
+        """
+        Write the buffered rows and finish the current file.
+        """
+        with self._lock:
+            self._finish()
+
+    def close(self):
+        """
+        Write the buffered rows and finish the last file.
+        """
+        self.rotate()
+
+    def __enter__(self) -> 'StatusExporter':
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _write_row_group(self):
+        # called with the lock held
+        if self._writer is None:
+            self._open()
+        batch = self._columns.take()
+        self._writer.write_batch(batch, row_group_size=len(batch))
+        self._rows += len(batch)
+
+    def _open(self):
+        self._sequence += 1
+        name = '%s-%s-%04d%s' % (self._prefix, time.strftime('%Y%m%dT%H%M%S', time.gmtime()), self._sequence,
+                                 EXPORT_FILE_SUFFIX)
+        self._path = os.path.join(self._directory, name)
+        self._writer = pyarrow.parquet.ParquetWriter(self._path + '.tmp', self._schema,
+                                                     compression=self._compression)
+        self._opened = time.monotonic()
+        self._rows = 0
+        # finish the file when it expires, a stream may stop before its next row
+        self._timer = threading.Timer(self._file_duration, self._expire, (self._path,))
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _expire(self, path: str):
+        with self._lock:
+            if self._writer is not None and self._path == path:
+                self._finish()
+
+    def _finish(self):
+        # called with the lock held, writes the buffered rows first
+        if len(self._columns):
+            self._write_row_group()
+        if self._writer is None:
+            return
+        self._timer.cancel()
+        self._writer.close()
+        os.replace(self._path + '.tmp', self._path)
+        self._files.append(self._path)
+        self._writer = None
+
+
+def export_capture(path: str, directory: str, **kwargs) -> list:
+    """
+    Export the status responses of a capture file written by the recorder
+
+    Parameters
+    ----------
+    path: str
+        Capture file
+    directory: str
+        Directory of the Parquet files
+    kwargs:
+        Other arguments of StatusExporter
+
+    Returns
+    -------
+    files: list
+        paths of the written files
+    """
+    with Replayer(path) as replayer, StatusExporter(directory, **kwargs) as exporter:
+        for record, status in replayer.decode():
+            exporter.write(record.device, status, record.timestamp)
+    return exporter.files
+
+
+def main():
+    args = sys.argv
+    if len(args) < 3:
+        print('usage: export.py capture_file directory')
+        return
+    for path in export_capture(args[1], args[2]):
+        print(path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,284 @@
+import contextlib
+import socket
+import threading
+import time
+
+from health import CircuitOpenError, HEALTH_FAILURES
+from main import LaPoeError, LaPoeFrameError
+from retry import retry_policy
+
+PNS_PORT = 10000
+"""port number of PNS/PHN commands"""
+
+
+class _PooledConnection:
+
+    __slots__ = ('address', 'lock', 'sock')
+
+    def __init__(self, address: tuple):
+        self.address = address
+        self.lock = threading.Lock()
+        self.sock = None
+
+
+class ConnectionPool:
+    """persistent connections to a set of LA-POE, one per device"""
+
+    def __init__(self, timeout: float = None, retry_policies: dict = None, health=None):
+        """
+        persistent connections to a set of LA-POE, one per device
+
+        Parameters
+        ----------
+        timeout: float
+            Connect/receive timeout in seconds of each socket, blocking if omitted
+        retry_policies: dict
+            RetryPolicy of each command function used by run (retry.RETRY_POLICIES, ...), no retry if omitted
+        health: HealthTracker
+            Tracker recording the latency and failures of run, whose open circuits fail fast, no tracking if omitted
+        """
+        self._timeout = timeout
+        self._retry_policies = retry_policies
+        self._health = health
+        self._lock = threading.Lock()
+        self._connections = {}
+
+    @property
+    def devices(self) -> list:
+        """registered device ids"""
+        with self._lock:
+            return list(self._connections)
+
+    def add(self, device: str, ip: str, port: int = PNS_PORT):
+        """
+        Register a device
+
+        Parameters
+        ----------
+        device: str
+            Device id
+        ip: str
+            IP address
+        port: int
+            port number
+        """
+        with self._lock:
+            previous = self._connections.get(device)
+            if previous is not None and previous.address == (ip, port):
+                return
+            self._connections[device] = _PooledConnection((ip, port))
+        if previous is not None:
+            self._close(previous)
+
+    def remove(self, device: str):
+        """
+        Unregister a device and close its connection
+
+        Parameters
+        ----------
+        device: str
+            Device id
+        """
+        with self._lock:
+            connection = self._connections.pop(device, None)
+        if connection is not None:
+            self._close(connection)
+        if self._health is not None:
+            self._health.forget(device)
+
+    def reset(self, device: str):
+        """
+        Close the connection of a device, the next use reconnects
+
+        Parameters
+        ----------
+        device: str
+            Device id
+        """
+        with self._lock:
+            connection = self._connections[device]
+        self._close(connection)
+
+    def address(self, device: str) -> tuple:
+        """
+        Get the address of a device
+
+        Parameters
+        ----------
+        device: str
+            Device id
+
+        Returns
+        -------
+        address: tuple
+            (IP address, port number)
+        """
+        with self._lock:
+            return self._connections[device].address
+
+    @contextlib.contextmanager
+    def connection(self, device: str):
+        """
+        Use the connection of a device exclusively
+
+        The socket is connected on first use and discarded when an OSError or a malformed response is raised,
+        so the next use reconnects
+
+        Parameters
+        ----------
+        device: str
+            Device id
+
+        Yields
+        ------
+        sock: socket.socket
+            connected socket
+        """
+        with self._lock:
+            connection = self._connections[device]
+        with connection.lock:
+            if connection.sock is None:
+                connection.sock = socket.create_connection(connection.address, self._timeout)
+            try:
+                yield connection.sock
+            except (OSError, LaPoeFrameError):
+                # the stream may be out of step with the responses
+                connection.sock.close()
+                connection.sock = None
+                raise
+
+    def run(self, device: str, command, *args):
+        """
+        Send a PNS/PHN command to a device
+
+        Transient errors are retried on a new connection according to the retry policy of the command,
+        CircuitOpenError is raised without connecting while the circuit of the device is open.
+        The health tracker records one result per call, after the retries (its latency includes them)
+
+        Parameters
+        ----------
+        device: str
+            Device id
+        command: callable
+            Command function of main.py (pns_run_control_command, phn_read_command, ...)
+        args:
+            Arguments of the command other than sock
+
+        Returns
+        -------
+        result:
+            return value of the command
+        """
+        health = self._health
+        if health is None:
+            return self._call(device, command, *args)
+
+        if not health.allow(device):
+            raise CircuitOpenError('circuit open: %s' % device)
+        started = time.monotonic()
+        try:
+            result = self._call(device, command, *args)
+        except HEALTH_FAILURES as e:
+            health.record_failure(device, e)
+            raise
+        except LaPoeError:
+            # answered with NAK
+            health.record_success(device, time.monotonic() - started)
+            raise
+        health.record_success(device, time.monotonic() - started)
+        return result
+
+    @property
+    def health(self):
+        """health tracker of the devices, None if not tracked"""
+        return self._health
+
+    def _call(self, device: str, command, *args):
+        if self._retry_policies is None:
+            return self._run(device, command, *args)
+        return retry_policy(command, self._retry_policies).call(self._run, device, command, *args)
+
+    def _run(self, device: str, command, *args):
+        with self.connection(device) as sock:
+            return command(*args, sock=sock)
+
+    def close(self):
+        """
+        Close all connections.
+        """
+        with self._lock:
+            connections = list(self._connections.values())
+        for connection in connections:
+            self._close(connection)
+
+    @staticmethod
+    def _close(connection: _PooledConnection):
+        with connection.lock:
+            if connection.sock is not None:
+                connection.sock.close()
+                connection.sock = None
+
+    def __enter__(self) -> 'ConnectionPool':
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class TokenBucket:
+    """token bucket limiting the rate of commands"""
+
+    def __init__(self, rate: float, burst: float = 1.0):
+        """
+        token bucket limiting the rate of commands
+
+        Parameters
+        ----------
+        rate: float
+            Tokens added per second
+        burst: float
+            Maximum number of tokens
+        """
+        self._rate = rate
+        self._burst = burst
+        self._tokens = burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def try_acquire(self, tokens: float = 1.0) -> float:
+        """
+        Take tokens if available
+
+        Parameters
+        ----------
+        tokens: float
+            Number of tokens to take
+
+        Returns
+        -------
+        wait: float
+            0 if the tokens were taken, otherwise seconds until they are available
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self._burst, self._tokens + (now - self._updated) * self._rate)
+            self._updated = now
+            if self._tokens >= tokens:
+                self._tokens -= tokens
+                return 0.0
+            return (tokens - self._tokens) / self._rate
+
+    def acquire(self, tokens: float = 1.0):
+        """
+        Take tokens, waiting until they are available
+
+        Parameters
+        ----------
+        tokens: float
+            Number of tokens to take
+        """
+        while True:
+            wait = self.try_acquire(tokens)
+            if wait == 0.0:
+                return
+            time.sleep(wait)
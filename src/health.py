@@ -0,0 +1,349 @@
+import threading
+import time
+
+from main import LaPoeError, LaPoeFrameError, phn_read_command
+
+HEALTH_HEALTHY = 'healthy'
+"""answering within the latency threshold"""
+HEALTH_DEGRADED = 'degraded'
+"""answering slowly or failing intermittently"""
+HEALTH_OPEN = 'open'
+"""circuit open, commands fail fast until a trial command or a probe succeeds"""
+
+HEALTH_FAILURES = (OSError, LaPoeFrameError)
+"""errors counted as failures of a device (a NAK proves the device is answering)"""
+
+
+class CircuitOpenError(LaPoeError):
+    """command refused because the circuit of the device is open"""
+
+
+class DeviceHealth:
+    """health of a device"""
+
+    __slots__ = ('_device', '_state', '_latency', '_failures', '_error', '_checked')
+
+    def __init__(self, device: str, state: str, latency: float, failures: int, error, checked: float):
+        """
+        health of a device
+
+        Parameters
+        ----------
+        device: str
+            Device id
+        state: str
+            HEALTH_HEALTHY, HEALTH_DEGRADED or HEALTH_OPEN
+        latency: float
+            Moving average of the response time in seconds, None before the first response
+        failures: int
+            Number of consecutive failures
+        error: Exception
+            Last failure, None if none
+        checked: float
+            Time of the last result (seconds since the epoch)
+        """
+        self._device = device
+        self._state = state
+        self._latency = latency
+        self._failures = failures
+        self._error = error
+        self._checked = checked
+
+    @property
+    def device(self) -> str:
+        """device id"""
+        return self._device
+
+    @property
+    def state(self) -> str:
+        """health state"""
+        return self._state
+
+    @property
+    def latency(self) -> float:
+        """moving average of the response time"""
+        return self._latency
+
+    @property
+    def failures(self) -> int:
+        """number of consecutive failures"""
+        return self._failures
+
+    @property
+    def error(self):
+        """last failure"""
+        return self._error
+
+    @property
+    def checked(self) -> float:
+        """time of the last result"""
+        return self._checked
+
+    def __repr__(self) -> str:
+        return 'DeviceHealth(%r, %s, %d failures)' % (self._device, self._state, self._failures)
+
+
+class _DeviceRecord:
+
+    __slots__ = ('latency', 'failures', 'error', 'checked', 'opened')
+
+    def __init__(self):
+        self.latency = None
+        self.failures = 0
+        self.error = None
+        self.checked = None
+        self.opened = None
+
+
+class HealthTracker:
+    """health state and circuit breaker of each device"""
+
+    def __init__(self, failure_threshold: int = 3, slow_latency: float = 0.5, open_duration: float = 5.0,
+                 smoothing: float = 0.2):
+        """
+        health state and circuit breaker of each device
+
+        Parameters
+        ----------
+        failure_threshold: int
+            Number of consecutive failures opening the circuit
+        slow_latency: float
+            Average response time in seconds above which a device is degraded
+        open_duration: float
+            Seconds an open circuit refuses commands before letting one trial command through (half-open),
+            and between two probes of an open circuit
+        smoothing: float
+            Weight of the latest response time in the moving average (0 to 1)
+        """
+        self._failure_threshold = failure_threshold
+        self._slow_latency = slow_latency
+        self._open_duration = open_duration
+        self._smoothing = smoothing
+        self._lock = threading.Lock()
+        self._records = {}
+
+    def _state(self, record: _DeviceRecord) -> str:
+        if record.opened is not None:
+            return HEALTH_OPEN
+        if record.failures or (record.latency is not None and record.latency > self._slow_latency):
+            return HEALTH_DEGRADED
+        return HEALTH_HEALTHY
+
+    def allow(self, device: str) -> bool:
+        """
+        Check whether a command may be sent to a device
+
+        Once open_duration has passed since the circuit opened, one call is allowed as a trial:
+        its success closes the circuit, its failure opens it for another open_duration.
+        If no result is recorded, the next trial is allowed open_duration later
+
+        Parameters
+        ----------
+        device: str
+            Device id
+
+        Returns
+        -------
+        allowed: bool
+            False while the circuit of the device is open, except for the trial call
+        """
+        with self._lock:
+            record = self._records.get(device)
+            if record is None or record.opened is None:
+                return True
+            now = time.monotonic()
+            if now - record.opened < self._open_duration:
+                return False
+            # half-open: the other callers keep failing fast while the trial is running
+            record.opened = now
+            return True
+
+    def record_success(self, device: str, latency: float):
+        """
+        Record a response of a device, closing its circuit
+
+        Parameters
+        ----------
+        device: str
+            Device id
+        latency: float
+            Response time in seconds
+        """
+        with self._lock:
+            record = self._records.setdefault(device, _DeviceRecord())
+            if record.latency is None:
+                record.latency = latency
+            else:
+                record.latency += self._smoothing * (latency - record.latency)
+            record.failures = 0
+            record.opened = None
+            record.checked = time.time()
+
+    def record_failure(self, device: str, error: Exception):
+        """
+        Record a failure of a device, opening its circuit after failure_threshold consecutive failures
+
+        Parameters
+        ----------
+        device: str
+            Device id
+        error: Exception
+            raised error
+        """
+        with self._lock:
+            record = self._records.setdefault(device, _DeviceRecord())
+            record.failures += 1
+            record.error = error
+            record.checked = time.time()
+            if record.failures >= self._failure_threshold:
+                record.opened = time.monotonic()
+
+    def probe_due(self) -> list:
+        """
+        Get the devices whose open circuit is due for a probe
+
+        Returns
+        -------
+        devices: list
+            device ids, their next probe is scheduled open_duration later
+        """
+        now = time.monotonic()
+        due = []
+        with self._lock:
+            for device, record in self._records.items():
+                if record.opened is not None and now - record.opened >= self._open_duration:
+                    record.opened = now
+                    due.append(device)
+        return due
+
+    def health(self, device: str) -> DeviceHealth:
+        """
+        Get the health of a device
+
+        Parameters
+        ----------
+        device: str
+            Device id
+
+        Returns
+        -------
+        health: DeviceHealth
+            health of the device, healthy if nothing was recorded
+        """
+        with self._lock:
+            record = self._records.get(device, _DeviceRecord())
+            return DeviceHealth(device, self._state(record), record.latency, record.failures, record.error,
+                                record.checked)
+
+    def summary(self) -> dict:
+        """
+        Get the health of every device from the recorded results, without probing
+
+        Returns
+        -------
+        summary: dict
+            DeviceHealth of each device id
+        """
+        with self._lock:
+            return {device: DeviceHealth(device, self._state(record), record.latency, record.failures,
+                                         record.error, record.checked)
+                    for device, record in self._records.items()}
+
+    def forget(self, device: str):
+        """
+        Drop the results of a device
+
+        Parameters
+        ----------
+        device: str
+            Device id
+        """
+        with self._lock:
+            self._records.pop(device, None)
+
+
+class HealthMonitor:
+    """background probes of the open circuits"""
+
+    def __init__(self, pool, tracker: HealthTracker, interval: float = 1.0):
+        """
+        background probes of the open circuits
+
+        A device answering phn_read_command gets its circuit closed
+
+        Parameters
+        ----------
+        pool: ConnectionPool
+            Connections to the devices
+        tracker: HealthTracker
+            Health of the devices (usually the health of the pool)
+        interval: float
+            Seconds between two checks of the circuits
+        """
+        self._pool = pool
+        self._tracker = tracker
+        self._interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+
+    def probe(self, device: str) -> bool:
+        """
+        Probe a device with phn_read_command, bypassing its circuit
+
+        Parameters
+        ----------
+        device: str
+            Device id
+
+        Returns
+        -------
+        answered: bool
+            True if the device answered
+        """
+        started = time.monotonic()
+        try:
+            with self._pool.connection(device) as sock:
+                phn_read_command(sock=sock)
+        except KeyError:
+            # device removed from the pool
+            self._tracker.forget(device)
+            return False
+        except HEALTH_FAILURES as e:
+            self._tracker.record_failure(device, e)
+            return False
+        except LaPoeError:
+            pass
+        self._tracker.record_success(device, time.monotonic() - started)
+        return True
+
+    def probe_once(self) -> list:
+        """
+        Probe the devices whose open circuit is due
+
+        Returns
+        -------
+        recovered: list
+            device ids whose circuit was closed
+        """
+        return [device for device in self._tracker.probe_due() if self.probe(device)]
+
+    def start(self):
+        """
+        Start probing in a background thread
+        """
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stop probing
+        """
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _loop(self):
+        while not self._stop.wait(self._interval):
+            self.probe_once()
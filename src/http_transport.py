@@ -0,0 +1,519 @@
+import concurrent.futures
+import http.client
+import http.server
+import json
+import queue
+import struct
+import threading
+import urllib.parse
+
+from main import (
+    PNS_PRODUCT_ID,
+    PNS_SMART_MODE_COMMAND,
+    PNS_MUTE_COMMAND,
+    PNS_STOP_PULSE_INPUT_COMMAND,
+    PNS_RUN_CONTROL_COMMAND,
+    PNS_DETAIL_RUN_CONTROL_COMMAND,
+    PNS_CLEAR_COMMAND,
+    PNS_GET_DATA_COMMAND,
+    PNS_GET_DETAIL_DATA_COMMAND,
+    PNS_ACK,
+    PNS_NAK,
+    PNS_LED_MODE,
+    PHN_WRITE_COMMAND,
+    PHN_READ_COMMAND,
+    PHN_ACK,
+    PHN_NAK,
+    LaPoeFrameError,
+    LaPoeTimeoutError,
+    pns_get_detail_data_encode,
+)
+from phn import phn_run_data_from_patterns, run_control_data_from_phn
+
+HTTP_PORT = 80
+"""port number of the HTTP interface"""
+
+
+class HttpCommandMap:
+    """request paths and formats of the PNS commands of a device"""
+
+    __slots__ = ('_control_path', '_status_path', '_parameters')
+
+    def __init__(self, control_path: str, status_path: str, run_control: str, detail_run_control: str,
+                 smart_mode: str, mute: str, stop_pulse_input: str, clear: str):
+        """
+        request paths and formats of the PNS commands of a device
+
+        There is no default map: take the paths and parameters from the HTTP command specification
+        of the firmware in use.
+
+        The default formats are a placeholder, the formats served by HttpStandInServer and not ones taken
+        from a device specification: a control command is a GET request on control_path with one query
+        parameter (multi-byte data as one hex digit per byte, single-byte data as a decimal number, 1 for
+        the clear command) and the status is a JSON object (see detail_status_data). For a device
+        formatted differently, subclass the map and override control_request and detail_status_data
+
+        Parameters
+        ----------
+        control_path: str
+            Path of the control requests
+        status_path: str
+            Path of the status request
+        run_control: str
+            Query parameter of the operation control command
+        detail_run_control: str
+            Query parameter of the detailed operation control command
+        smart_mode: str
+            Query parameter of the smart mode control command
+        mute: str
+            Query parameter of the mute command
+        stop_pulse_input: str
+            Query parameter of the STOP input/trigger input command
+        clear: str
+            Query parameter of the clear command
+        """
+        self._control_path = control_path
+        self._status_path = status_path
+        self._parameters = {
+            PNS_RUN_CONTROL_COMMAND: run_control,
+            PNS_DETAIL_RUN_CONTROL_COMMAND: detail_run_control,
+            PNS_SMART_MODE_COMMAND: smart_mode,
+            PNS_MUTE_COMMAND: mute,
+            PNS_STOP_PULSE_INPUT_COMMAND: stop_pulse_input,
+            PNS_CLEAR_COMMAND: clear,
+        }
+
+    @property
+    def control_path(self) -> str:
+        """path of the control requests"""
+        return self._control_path
+
+    @property
+    def status_path(self) -> str:
+        """path of the status request"""
+        return self._status_path
+
+    @property
+    def parameters(self) -> dict:
+        """query parameter of each PNS command identifier"""
+        return dict(self._parameters)
+
+    def control_request(self, command: bytes, data: bytes) -> str:
+        """
+        Get the request of a PNS control command
+
+        Parameters
+        ----------
+        command: bytes
+            PNS command identifier (PNS_RUN_CONTROL_COMMAND, PNS_SMART_MODE_COMMAND, ...)
+        data: bytes
+            Data of the PNS command
+
+        Returns
+        -------
+        path: str
+            path and query of the GET request, None if the command is not available over HTTP
+        """
+        parameter = self._parameters.get(command)
+        if parameter is None:
+            return None
+        if len(data) == 0:
+            value = '1'
+        elif len(data) == 1:
+            value = str(data[0])
+        else:
+            value = ''.join('%X' % b for b in data)
+        return self._control_path + '?' + urllib.parse.urlencode({parameter: value})
+
+    def detail_status_data(self, body: bytes) -> bytes:
+        """
+        Rebuild the response data of the get detail status command from the body of the status request
+
+        The default format is a JSON object with mac ('-' separated hex), input (8 values), mode,
+        smart (group, mute, stop, pattern, last_pattern, in smart mode only), led (5 objects with
+        pattern, red, green, blue) and buzzer
+
+        Parameters
+        ----------
+        body: bytes
+            Response body of the status request
+
+        Returns
+        -------
+        recv_data: bytes
+            response data of the get detail status command
+        """
+        status = json.loads(body)
+        data = bytes.fromhex(status['mac'].replace('-', '').replace(':', ''))
+        data += bytes(status['input']) + bytes([status['mode']]) + bytes(4)
+        if status['mode'] != PNS_LED_MODE:
+            smart = status['smart']
+            data += bytes([smart['group'], smart['mute'], smart['stop'], smart['pattern'], smart['last_pattern']])
+        for unit in status['led']:
+            data += bytes([unit['pattern'], unit['red'], unit['green'], unit['blue']])
+        return data + bytes([status['buzzer']])
+
+
+class HttpConnectionPool:
+    """keep-alive HTTP connections to one device"""
+
+    def __init__(self, ip: str, port: int = HTTP_PORT, max_connections: int = 4, timeout: float = 5.0,
+                 proxy: tuple = None):
+        """
+        keep-alive HTTP connections to one device
+
+        Parameters
+        ----------
+        ip: str
+            IP address of the device
+        port: int
+            port number of the device
+        max_connections: int
+            Maximum number of connections, also the maximum number of concurrent requests
+        timeout: float
+            Timeout in seconds of each request
+        proxy: tuple
+            (host, port) of an HTTP proxy, direct connection if omitted
+        """
+        self._host = ip if port == HTTP_PORT else '%s:%d' % (ip, port)
+        self._address = proxy if proxy is not None else (ip, port)
+        self._through_proxy = proxy is not None
+        self._timeout = timeout
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(max_connections)
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_connections)
+
+    @property
+    def address(self) -> tuple:
+        """(host, port number) connected to"""
+        return self._address
+
+    @property
+    def timeout(self) -> float:
+        """timeout in seconds of each request"""
+        return self._timeout
+
+    def request(self, path: str) -> bytes:
+        """
+        Send a GET request on an idle connection
+
+        Parameters
+        ----------
+        path: str
+            Path and query
+
+        Returns
+        -------
+        body: bytes
+            response body
+        """
+        if self._through_proxy:
+            path = 'http://' + self._host + path
+        with self._slots:
+            try:
+                connection = self._idle.get_nowait()
+            except queue.Empty:
+                connection = http.client.HTTPConnection(*self._address, timeout=self._timeout)
+            for attempt in (0, 1):
+                try:
+                    connection.request('GET', path, headers={'Host': self._host, 'Connection': 'keep-alive'})
+                    response = connection.getresponse()
+                    body = response.read()
+                    break
+                except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+                    # the idle connection was closed by the server: retry once on a new one
+                    connection.close()
+                    if attempt:
+                        raise
+                except (OSError, http.client.HTTPException):
+                    connection.close()
+                    raise
+            if response.will_close:
+                connection.close()
+            else:
+                self._idle.put(connection)
+        if response.status != 200:
+            raise http.client.HTTPException('HTTP %d %s' % (response.status, response.reason))
+        return body
+
+    def submit(self, path: str) -> concurrent.futures.Future:
+        """
+        Send a GET request without waiting for the response
+
+        Parameters
+        ----------
+        path: str
+            Path and query
+
+        Returns
+        -------
+        future: concurrent.futures.Future
+            response body, cancel it to give up a request still waiting for a connection
+        """
+        return self._executor.submit(self.request, path)
+
+    def close(self):
+        """
+        Close the idle connections.
+        """
+        self._executor.shutdown()
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+
+def _status_from_detail(detail: bytes) -> bytes:
+    """Rebuild the response data of the get status command from the detailed status"""
+    data = detail[6:15]
+    if detail[14] == PNS_LED_MODE:
+        units = detail[19:39]
+        return data + bytes(units[i * 4] for i in range(5)) + detail[39:40]
+    return data + detail[19:23] + bytes(2)
+
+
+def _phn_from_detail(detail: bytes) -> bytes:
+    """Rebuild the response data of the PHN read command from the detailed status"""
+    offset = 19 if detail[14] == PNS_LED_MODE else 24
+    led_patterns = [detail[offset + i * 4] for i in range(3)]
+    return PHN_READ_COMMAND + bytes([phn_run_data_from_patterns(led_patterns, detail[offset + 20])])
+
+
+class HttpTransport:
+    """socket-like object carrying PNS/PHN commands over the HTTP interface"""
+
+    def __init__(self, pool: HttpConnectionPool, command_map: HttpCommandMap):
+        """
+        socket-like object carrying PNS/PHN commands over the HTTP interface
+
+        Pass it as sock to the command functions of main.py;
+        each command frame is translated into an HTTP request and its response data rebuilt.
+        recv raises LaPoeTimeoutError when no response arrives within the timeout of the pool
+
+        Parameters
+        ----------
+        pool: HttpConnectionPool
+            Keep-alive connections to the device, can be shared by several transports
+        command_map: HttpCommandMap
+            Request paths and formats of the device
+        """
+        self._pool = pool
+        self._map = command_map
+        self._response = None
+
+    def submit(self, send_data: bytes) -> concurrent.futures.Future:
+        """
+        Send a PNS/PHN command without waiting for the response
+
+        Parameters
+        ----------
+        send_data: bytes
+            PNS/PHN command
+
+        Returns
+        -------
+        future: concurrent.futures.Future
+            response data of the command, as returned by the PNS socket
+        """
+        if send_data[0:2] == PNS_PRODUCT_ID:
+            command = send_data[2:3]
+            if command == PNS_GET_DATA_COMMAND:
+                return self._status(_status_from_detail, bytes([PNS_NAK]))
+            if command == PNS_GET_DETAIL_DATA_COMMAND:
+                return self._status(bytes, bytes([PNS_NAK]))
+            path = self._map.control_request(command, send_data[6:])
+            if path is not None:
+                return self._convert(self._pool.submit(path), lambda body: bytes([PNS_ACK]), bytes([PNS_NAK]))
+        else:
+            if send_data[0:1] == PHN_WRITE_COMMAND and len(send_data) == 2:
+                run_control_data = run_control_data_from_phn(send_data[1])
+                path = self._map.control_request(PNS_RUN_CONTROL_COMMAND, run_control_data.get_bytes())
+                return self._convert(self._pool.submit(path), lambda body: PHN_ACK, PHN_NAK)
+            if send_data[0:1] == PHN_READ_COMMAND:
+                return self._status(_phn_from_detail, PHN_NAK)
+
+        # not available over HTTP (reboot command, unknown command)
+        future = concurrent.futures.Future()
+        future.set_result(PHN_NAK if send_data[0:2] != PNS_PRODUCT_ID else bytes([PNS_NAK]))
+        return future
+
+    def _status(self, convert, nak: bytes) -> concurrent.futures.Future:
+        future = self._pool.submit(self._map.status_path)
+        return self._convert(future, lambda body: convert(self._map.detail_status_data(body)), nak)
+
+    @staticmethod
+    def _convert(future: concurrent.futures.Future, convert, nak: bytes) -> concurrent.futures.Future:
+        result = concurrent.futures.Future()
+        result.add_done_callback(lambda f: future.cancel() if f.cancelled() else None)
+
+        def done(f: concurrent.futures.Future):
+            if f.cancelled():
+                return
+            if isinstance(f.exception(), http.client.HTTPException):
+                # the device refused the request
+                result.set_result(nak)
+            elif f.exception() is not None:
+                result.set_exception(f.exception())
+            else:
+                try:
+                    result.set_result(convert(f.result()))
+                except (KeyError, IndexError, TypeError, ValueError) as e:
+                    result.set_exception(LaPoeFrameError('malformed HTTP response: %r' % e))
+
+        future.add_done_callback(done)
+        return result
+
+    def send(self, send_data: bytes) -> int:
+        """
+        Send a PNS/PHN command
+
+        Parameters
+        ----------
+        send_data: bytes
+            PNS/PHN command
+
+        Returns
+        -------
+        size: int
+            number of bytes sent
+        """
+        self._response = self.submit(send_data)
+        return len(send_data)
+
+    def recv(self, bufsize: int) -> bytes:
+        """
+        Receive the response of the last command
+
+        Parameters
+        ----------
+        bufsize: int
+            Maximum number of bytes
+
+        Returns
+        -------
+        recv_data: bytes
+            response data
+        """
+        response, self._response = self._response, None
+        if response is None:
+            return b''
+        try:
+            return response.result(self._pool.timeout)[:bufsize]
+        except concurrent.futures.TimeoutError as e:
+            response.cancel()
+            raise LaPoeTimeoutError('no response') from e
+
+    def getpeername(self) -> tuple:
+        """
+        Get the address connected to
+
+        Returns
+        -------
+        address: tuple
+            (host, port number)
+        """
+        return self._pool.address
+
+
+class _HttpStandInRequestHandler(http.server.BaseHTTPRequestHandler):
+
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        url = urllib.parse.urlsplit(self.path)
+        simulator = self.server.simulator
+        command_map = self.server.command_map
+        if url.path == command_map.status_path:
+            detail = simulator.handle(pns_get_detail_data_encode())
+            self._reply(200, json.dumps(self._json_from_detail(detail)).encode('ascii'))
+            return
+        if url.path != command_map.control_path:
+            self._reply(404, b'')
+            return
+        query = urllib.parse.parse_qs(url.query)
+        for command, parameter in command_map.parameters.items():
+            if parameter in query:
+                value = query[parameter][0]
+                try:
+                    if command == PNS_CLEAR_COMMAND:
+                        data = b''
+                    elif command in (PNS_RUN_CONTROL_COMMAND, PNS_DETAIL_RUN_CONTROL_COMMAND):
+                        data = bytes(int(c, 16) for c in value)
+                    else:
+                        data = bytes([int(value)])
+                except ValueError:
+                    break
+                response = simulator.handle(struct.pack('>2ssxH', PNS_PRODUCT_ID, command, len(data)) + data)
+                self._reply(200 if response[0] == PNS_ACK else 400, b'')
+                return
+        self._reply(400, b'')
+
+    def _reply(self, status: int, body: bytes):
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    @staticmethod
+    def _json_from_detail(detail: bytes) -> dict:
+        status = {
+            'mac': '-'.join('%02x' % b for b in detail[0:6]),
+            'input': list(detail[6:14]),
+            'mode': detail[14],
+        }
+        offset = 19
+        if detail[14] != PNS_LED_MODE:
+            group, mute, stop, pattern, last_pattern = detail[19:24]
+            status['smart'] = {'group': group, 'mute': mute, 'stop': stop, 'pattern': pattern,
+                               'last_pattern': last_pattern}
+            offset = 24
+        status['led'] = [
+            {'pattern': p, 'red': r, 'green': g, 'blue': b}
+            for p, r, g, b in (detail[offset + i * 4:offset + i * 4 + 4] for i in range(5))
+        ]
+        status['buzzer'] = detail[offset + 20]
+        return status
+
+    def log_message(self, format, *args):
+        pass
+
+
+class HttpStandInServer(http.server.ThreadingHTTPServer):
+    """local HTTP server standing in for the HTTP interface of an LA6-POE"""
+
+    daemon_threads = True
+
+    def __init__(self, address: tuple, command_map: HttpCommandMap, simulator=None):
+        """
+        local HTTP server standing in for the HTTP interface of an LA6-POE
+
+        Parameters
+        ----------
+        address: tuple
+            (IP address, port number) to listen on, port 0 selects a free port
+        command_map: HttpCommandMap
+            Paths and parameters served, with the default formats of HttpCommandMap
+        simulator: LaPoeSimulator
+            Simulated device behind the interface, a new one is created if omitted
+        """
+        super().__init__(address, _HttpStandInRequestHandler)
+        if simulator is None:
+            from simulator import LaPoeSimulator
+            simulator = LaPoeSimulator()
+        self.simulator = simulator
+        self.command_map = command_map
+
+    def start(self) -> threading.Thread:
+        """
+        Serve in a background thread
+
+        Returns
+        -------
+        thread: threading.Thread
+            thread running the server
+        """
+        thread = threading.Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+        return thread
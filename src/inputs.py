@@ -0,0 +1,344 @@
+import asyncio
+import threading
+import time
+
+from main import LaPoeError, pns_get_data_command
+
+# edge of a contact input
+INPUT_EDGE_FALLING = 0x00
+"""input turned OFF"""
+INPUT_EDGE_RISING = 0x01
+"""input turned ON"""
+
+
+class InputEdgeEvent:
+    """edge of a contact input"""
+
+    __slots__ = ('_device', '_input_no', '_edge', '_timestamp')
+
+    def __init__(self, device: str, input_no: int, edge: int, timestamp: float):
+        """
+        edge of a contact input
+
+        Parameters
+        ----------
+        device: str
+            Device id
+        input_no: int
+            Input number (1 to 8)
+        edge: int
+            Edge (falling: 0, rising: 1)
+        timestamp: float
+            Time at which the new state was first seen (time.monotonic())
+        """
+        self._device = device
+        self._input_no = input_no
+        self._edge = edge
+        self._timestamp = timestamp
+
+    @property
+    def device(self) -> str:
+        """device id"""
+        return self._device
+
+    @property
+    def input_no(self) -> int:
+        """input number 1 to 8"""
+        return self._input_no
+
+    @property
+    def edge(self) -> int:
+        """edge"""
+        return self._edge
+
+    @property
+    def timestamp(self) -> float:
+        """time at which the new state was first seen"""
+        return self._timestamp
+
+    def __repr__(self) -> str:
+        return 'InputEdgeEvent(%r, %d, %s, %.3f)' % (
+            self._device, self._input_no, 'rising' if self._edge == INPUT_EDGE_RISING else 'falling', self._timestamp)
+
+
+class _DeviceInputState:
+
+    __slots__ = ('stable', 'candidate', 'since', 'count')
+
+    def __init__(self, stable: int):
+        self.stable = stable
+        self.candidate = [None] * 8
+        self.since = [0.0] * 8
+        self.count = [0] * 8
+
+
+class InputEdgeDetector:
+    """converts successive input polls into debounced edge events"""
+
+    def __init__(self, debounce: float = 0.0, glitch_count: int = 1):
+        """
+        converts successive input polls into debounced edge events
+
+        Parameters
+        ----------
+        debounce: float
+            Time in seconds a new input state must persist before its edge is reported
+        glitch_count: int
+            Number of consecutive polls that must agree on a new input state before its edge is reported
+        """
+        self._debounce = debounce
+        self._glitch_count = max(glitch_count, 1)
+        self._lock = threading.Lock()
+        self._devices = {}
+        self._callbacks = []
+
+    def subscribe(self, callback):
+        """
+        Register a function called with each InputEdgeEvent
+
+        Parameters
+        ----------
+        callback: callable
+            Called from the thread that calls update
+        """
+        with self._lock:
+            self._callbacks = self._callbacks + [callback]
+
+    def unsubscribe(self, callback):
+        """
+        Unregister a function registered with subscribe
+
+        Parameters
+        ----------
+        callback: callable
+            Registered function
+        """
+        with self._lock:
+            self._callbacks = [c for c in self._callbacks if c is not callback]
+
+    def stream(self, maxsize: int = 0) -> 'InputEventStream':
+        """
+        Get the events as an async iterator
+
+        Must be called from the running event loop that consumes the events
+
+        Parameters
+        ----------
+        maxsize: int
+            Maximum number of undelivered events (0: unlimited), the oldest is dropped when full
+
+        Returns
+        -------
+        stream: InputEventStream
+            async iterator of InputEdgeEvent
+        """
+        return InputEventStream(self, maxsize)
+
+    def state(self, device: str) -> bytes:
+        """
+        Get the debounced input states
+
+        Parameters
+        ----------
+        device: str
+            Device id
+
+        Returns
+        -------
+        input: bytes
+            Debounced input 1 to 8, None if the device was never polled
+        """
+        with self._lock:
+            state = self._devices.get(device)
+            if state is None:
+                return None
+            return bytes((state.stable >> i) & 1 for i in range(8))
+
+    def update(self, device: str, input_data: bytes, timestamp: float = None) -> list:
+        """
+        Feed one poll of the contact inputs
+
+        The first poll of a device sets its initial state without reporting edges
+
+        Parameters
+        ----------
+        device: str
+            Device id
+        input_data: bytes
+            Input 1 to 8 (PnsStatusData.input or PnsDetailStatusData.input)
+        timestamp: float
+            Time of the poll (time.monotonic()), the current time if omitted
+
+        Returns
+        -------
+        events: list
+            InputEdgeEvent reported by this poll
+        """
+        if timestamp is None:
+            timestamp = time.monotonic()
+        sample = 0
+        for i in range(8):
+            if input_data[i]:
+                sample |= 1 << i
+
+        events = []
+        with self._lock:
+            state = self._devices.get(device)
+            if state is None:
+                self._devices[device] = _DeviceInputState(sample)
+                return events
+            callbacks = self._callbacks
+
+            changed = sample ^ state.stable
+            for i in range(8):
+                bit = 1 << i
+                if not changed & bit:
+                    # back to the debounced state: a pending change was a glitch
+                    state.candidate[i] = None
+                    continue
+                value = (sample >> i) & 1
+                if state.candidate[i] != value:
+                    state.candidate[i] = value
+                    state.since[i] = timestamp
+                    state.count[i] = 1
+                else:
+                    state.count[i] += 1
+                if state.count[i] >= self._glitch_count and timestamp - state.since[i] >= self._debounce:
+                    state.stable ^= bit
+                    state.candidate[i] = None
+                    events.append(InputEdgeEvent(
+                        device, i + 1, INPUT_EDGE_RISING if value else INPUT_EDGE_FALLING, state.since[i]))
+
+        for event in events:
+            for callback in callbacks:
+                callback(event)
+        return events
+
+    def forget(self, device: str):
+        """
+        Drop the state of a device, its next poll sets a new initial state
+
+        Parameters
+        ----------
+        device: str
+            Device id
+        """
+        with self._lock:
+            self._devices.pop(device, None)
+
+
+class InputEventStream:
+    """async iterator over the events of an InputEdgeDetector"""
+
+    def __init__(self, detector: InputEdgeDetector, maxsize: int = 0):
+        """
+        async iterator over the events of an InputEdgeDetector
+
+        Parameters
+        ----------
+        detector: InputEdgeDetector
+            Source of the events
+        maxsize: int
+            Maximum number of undelivered events (0: unlimited), the oldest is dropped when full
+        """
+        self._detector = detector
+        self._loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue(maxsize)
+        self._closed = False
+        detector.subscribe(self._on_event)
+
+    def _on_event(self, event: InputEdgeEvent):
+        self._loop.call_soon_threadsafe(self._put, event)
+
+    def _put(self, event):
+        if self._queue.full():
+            self._queue.get_nowait()
+        self._queue.put_nowait(event)
+
+    def close(self):
+        """
+        Stop receiving events, the iteration ends after the pending events.
+        """
+        if not self._closed:
+            self._closed = True
+            self._detector.unsubscribe(self._on_event)
+            self._loop.call_soon_threadsafe(self._put, None)
+
+    def __aiter__(self) -> 'InputEventStream':
+        return self
+
+    async def __anext__(self) -> InputEdgeEvent:
+        event = await self._queue.get()
+        if event is None:
+            raise StopAsyncIteration
+        return event
+
+
+class InputPoller:
+    """background thread polling the contact inputs of a device"""
+
+    def __init__(self, detector: InputEdgeDetector, device: str, interval: float = 0.1, read_input=None,
+                 on_error=None):
+        """
+        background thread polling the contact inputs of a device
+
+        A failed poll is reported and polling goes on at the next interval
+
+        Parameters
+        ----------
+        detector: InputEdgeDetector
+            Detector fed with each poll
+        device: str
+            Device id
+        interval: float
+            Poll interval in seconds
+        read_input: callable
+            Function returning input 1 to 8, the get status command of the connected device if omitted
+        on_error: callable
+            Called with the exception when a poll fails
+        """
+        self._detector = detector
+        self._device = device
+        self._interval = interval
+        self._read_input = read_input if read_input is not None else lambda: pns_get_data_command().input
+        self._on_error = on_error
+        self._error = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def error(self):
+        """exception of the last poll, None if it succeeded"""
+        return self._error
+
+    def start(self):
+        """
+        Start polling.
+        """
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stop polling and wait for the thread to end.
+        """
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        next_poll = time.monotonic()
+        while not self._stop.is_set():
+            try:
+                input_data = self._read_input()
+            except (LaPoeError, OSError) as e:
+                self._error = e
+                if self._on_error is not None:
+                    self._on_error(e)
+            else:
+                self._error = None
+                self._detector.update(self._device, input_data)
+            next_poll += self._interval
+            self._stop.wait(max(next_poll - time.monotonic(), 0))
@@ -1,8 +1,13 @@
+import functools
 import socket
 import struct
 import sys
+import time
 
 _sock: socket.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+_recorder = None
+_auditor = None
+_decode_cache = None
 
 PNS_PRODUCT_ID = b'AB'
 """product category"""
@@ -116,6 +121,29 @@ PNS_DETAIL_RUN_CONTROL_BUZZER_PATTERN11 = 0x0B
 """pattern 11"""
 
 
+class LaPoeError(Exception):
+    """error of a PNS/PHN command"""
+
+
+class LaPoeNakError(LaPoeError, ValueError):
+    """negative acknowledge returned by the LA-POE"""
+
+    def __init__(self, message: str = 'negative acknowledge'):
+        super().__init__(message)
+
+
+class LaPoeFrameError(LaPoeError, ValueError):
+    """short or malformed response data"""
+
+
+class LaPoeTimeoutError(LaPoeError, TimeoutError):
+    """no response within the timeout of the socket"""
+
+
+class LaPoeConnectionError(LaPoeError, ConnectionError):
+    """connection reset or closed by the LA-POE"""
+
+
 class PnsRunControlData:
     """operation control data class"""
 
@@ -940,7 +968,78 @@ def socket_close():
     _sock.close()
 
 
-def send_command(send_data: bytes) -> bytes:
+def set_decode_cache(maxsize: int):
+    """
+    Share the decoded status between byte-identical responses of the get (detail) status commands
+
+    The status classes are read-only, so an LRU cache keyed on the received data returns the same object
+    for repeated responses instead of decoding them again
+
+    Parameters
+    ----------
+    maxsize: int
+        Maximum number of cached responses, 0 or None disables the cache
+    """
+    global _decode_cache
+    if maxsize:
+        _decode_cache = functools.lru_cache(maxsize=maxsize)(_new_status)
+    else:
+        _decode_cache = None
+
+
+def decode_cache_info():
+    """
+    Get the statistics of the decode cache
+
+    Returns
+    -------
+    info: functools._CacheInfo
+        hits, misses, maxsize and currsize of the cache, None if disabled
+    """
+    decode_cache = _decode_cache
+    if decode_cache is None:
+        return None
+    return decode_cache.cache_info()
+
+
+def _new_status(status_class: type, recv_data: bytes):
+    return status_class(recv_data)
+
+
+def _decode_status(status_class: type, recv_data: bytes):
+    decode_cache = _decode_cache
+    if decode_cache is None:
+        return status_class(recv_data)
+    return decode_cache(status_class, bytes(recv_data))
+
+
+def set_recorder(recorder):
+    """
+    Capture every frame sent and received by send_command
+
+    Parameters
+    ----------
+    recorder: Recorder
+        Recorder that receives the frames (see recorder.py), None stops capturing
+    """
+    global _recorder
+    _recorder = recorder
+
+
+def set_auditor(auditor):
+    """
+    Report every command sent by send_command, with its outcome and latency
+
+    Parameters
+    ----------
+    auditor: AuditLog
+        Log that receives the commands (see audit.py), None stops reporting
+    """
+    global _auditor
+    _auditor = auditor
+
+
+def send_command(send_data: bytes, sock: socket.socket = None) -> bytes:
     """
     Send command
 
@@ -948,31 +1047,94 @@ def send_command(send_data: bytes) -> bytes:
     ----------
     send_data: bytes
         send data
+    sock: socket.socket
+        Connected socket of the target LA-POE, the socket opened by socket_open if omitted
 
     Returns
     -------
     recv_data: bytes
         received data
     """
-    # Send
-    _sock.send(send_data)
-
-    # Receive response data
-    recv_data = _sock.recv(1024)
+    if sock is None:
+        sock = _sock
+
+    recorder = _recorder
+    auditor = _auditor
+    if recorder is not None or auditor is not None:
+        try:
+            device = '%s:%d' % sock.getpeername()[:2]
+        except OSError as e:
+            # not connected
+            raise LaPoeConnectionError(str(e)) from e
+    if recorder is not None:
+        # capture the sent frame (direction 0: send)
+        recorder.record(0, device, send_data)
+
+    started = time.monotonic()
+    try:
+        try:
+            # Send
+            sock.send(send_data)
+
+            # Receive response data
+            recv_data = sock.recv(1024)
+        except TimeoutError as e:
+            raise LaPoeTimeoutError('no response') from e
+        except ConnectionError as e:
+            raise LaPoeConnectionError(str(e)) from e
+        if not recv_data:
+            raise LaPoeConnectionError('connection closed')
+    except Exception as e:
+        if auditor is not None:
+            auditor.audit(device, send_data, None, e, time.monotonic() - started)
+        raise
+
+    if auditor is not None:
+        auditor.audit(device, send_data, recv_data, None, time.monotonic() - started)
+
+    if recorder is not None:
+        # capture the received frame (direction 1: receive)
+        recorder.record(1, device, recv_data)
 
     return recv_data
 
 
-def pns_smart_mode_command(run_data: int):
+def pns_response_decode(recv_data: bytes):
     """
-    Send smart mode control command for PNS command
+    Check the response data of a PNS command answered by ACK/NAK
 
-    Smart mode can be executed for the number specified in the data area
+    Parameters
+    ----------
+    recv_data: bytes
+        received data
+    """
+    _check_pns_response(recv_data, 1)
+    if recv_data[0] != PNS_ACK:
+        raise LaPoeFrameError('unexpected response %r' % recv_data[0:1])
+
+
+def _check_pns_response(recv_data: bytes, size: int):
+    if not recv_data:
+        raise LaPoeFrameError('empty response')
+    if recv_data[0] == PNS_NAK:
+        raise LaPoeNakError()
+    if len(recv_data) < size:
+        raise LaPoeFrameError('short response (%d bytes, expected %d)' % (len(recv_data), size))
+
+
+def pns_smart_mode_encode(run_data: int) -> bytes:
+    """
+    Create smart mode control command for PNS command
 
     Parameters
     ----------
     run_data: int
         Group number to execute smart mode (0x01(Group No.1) to 0x1F(Group No.31))
+
+    Returns
+    -------
+    send_data: bytes
+        data to be sent
     """
     # Create the data to be sent
     send_data = struct.pack(
@@ -983,24 +1145,45 @@ def pns_smart_mode_command(run_data: int):
         run_data,                   # Data area
     )
 
+    return send_data
+
+
+def pns_smart_mode_command(run_data: int, sock: socket.socket = None):
+    """
+    Send smart mode control command for PNS command
+
+    Smart mode can be executed for the number specified in the data area
+
+    Parameters
+    ----------
+    run_data: int
+        Group number to execute smart mode (0x01(Group No.1) to 0x1F(Group No.31))
+    sock: socket.socket
+        Connected socket of the target LA-POE, the socket opened by socket_open if omitted
+    """
+    # Create the data to be sent
+    send_data = pns_smart_mode_encode(run_data)
+
     # Send PNS command
-    recv_data = send_command(send_data)
+    recv_data = send_command(send_data, sock)
 
     # check the response data
-    if recv_data[0] == PNS_NAK:
-        raise ValueError('negative acknowledge')
+    pns_response_decode(recv_data)
 
 
-def pns_mute_command(mute: int):
+def pns_mute_encode(mute: int) -> bytes:
     """
-    Send mute command for PNS command
-
-    Can control the buzzer ON/OFF while Smart Mode is running
+    Create mute command for PNS command
 
     Parameters
     ----------
     mute: int
         Buzzer ON/OFF (ON: 1, OFF: 0)
+
+    Returns
+    -------
+    send_data: bytes
+        data to be sent
     """
     # Create the data to be sent
     send_data = struct.pack(
@@ -1011,26 +1194,45 @@ def pns_mute_command(mute: int):
         mute,               # Data area
     )
 
-    # Send PNS command
-    recv_data = send_command(send_data)
+    return send_data
 
-    # check the response data
-    if recv_data[0] == PNS_NAK:
-        raise ValueError('negative acknowledge')
 
+def pns_mute_command(mute: int, sock: socket.socket = None):
+    """
+    Send mute command for PNS command
 
-def pns_stop_pulse_input_command(input_mode: int):
+    Can control the buzzer ON/OFF while Smart Mode is running
+
+    Parameters
+    ----------
+    mute: int
+        Buzzer ON/OFF (ON: 1, OFF: 0)
+    sock: socket.socket
+        Connected socket of the target LA-POE, the socket opened by socket_open if omitted
     """
-    Send stop/pulse input command for PNS command
+    # Create the data to be sent
+    send_data = pns_mute_encode(mute)
 
-    Transmit during time trigger mode operation to control stop/resume of pattern (STOP input)
+    # Send PNS command
+    recv_data = send_command(send_data, sock)
 
-    Sending this command during pulse trigger mode operation enables pattern transition (trigger input)
+    # check the response data
+    pns_response_decode(recv_data)
+
+
+def pns_stop_pulse_input_encode(input_mode: int) -> bytes:
+    """
+    Create stop/pulse input command for PNS command
 
     Parameters
     ----------
     input_mode: int
         STOP input/trigger input (STOP input ON/trigger input: 1, STOP input: 0)
+
+    Returns
+    -------
+    send_data: bytes
+        data to be sent
     """
     # Create the data to be sent
     send_data = struct.pack(
@@ -1041,21 +1243,37 @@ def pns_stop_pulse_input_command(input_mode: int):
         input_mode,                     # Data area
     )
 
-    # Send PNS command
-    recv_data = send_command(send_data)
+    return send_data
 
-    # check the response data
-    if recv_data[0] == PNS_NAK:
-        raise ValueError('negative acknowledge')
 
+def pns_stop_pulse_input_command(input_mode: int, sock: socket.socket = None):
+    """
+    Send stop/pulse input command for PNS command
+
+    Transmit during time trigger mode operation to control stop/resume of pattern (STOP input)
+
+    Sending this command during pulse trigger mode operation enables pattern transition (trigger input)
 
-def pns_run_control_command(run_control_data: PnsRunControlData):
+    Parameters
+    ----------
+    input_mode: int
+        STOP input/trigger input (STOP input ON/trigger input: 1, STOP input: 0)
+    sock: socket.socket
+        Connected socket of the target LA-POE, the socket opened by socket_open if omitted
     """
-    Send operation control command for PNS command
+    # Create the data to be sent
+    send_data = pns_stop_pulse_input_encode(input_mode)
 
-    Each stage of the LED unit and the buzzer (1 to 3) can be controlled by the pattern specified in the data area
+    # Send PNS command
+    recv_data = send_command(send_data, sock)
 
-    Operates with the color and buzzer set in the signal light mode
+    # check the response data
+    pns_response_decode(recv_data)
+
+
+def pns_run_control_encode(run_control_data: PnsRunControlData) -> bytes:
+    """
+    Create operation control command for PNS command
 
     Parameters
     ----------
@@ -1063,6 +1281,11 @@ def pns_run_control_command(run_control_data: PnsRunControlData):
         LEDPattern of the 1st to 5th stage of the LED unit and buzzer (1 to 3)
         Pattern of LED unit (off: 0, on: 1, blinking: 2, no change: 9)
         Pattern of buzzer (stop: 0, pattern 1: 1, pattern 2: 2, buzzer tone when input simultaneously with buzzer: 3, no change: 9)
+
+    Returns
+    -------
+    send_data: bytes
+        data to be sent
     """
     # Create the data to be sent
     send_data = struct.pack(
@@ -1073,19 +1296,39 @@ def pns_run_control_command(run_control_data: PnsRunControlData):
     )
     send_data += run_control_data.get_bytes()
 
+    return send_data
+
+
+def pns_run_control_command(run_control_data: PnsRunControlData, sock: socket.socket = None):
+    """
+    Send operation control command for PNS command
+
+    Each stage of the LED unit and the buzzer (1 to 3) can be controlled by the pattern specified in the data area
+
+    Operates with the color and buzzer set in the signal light mode
+
+    Parameters
+    ----------
+    run_control_data: PnsRunControlData
+        LEDPattern of the 1st to 5th stage of the LED unit and buzzer (1 to 3)
+        Pattern of LED unit (off: 0, on: 1, blinking: 2, no change: 9)
+        Pattern of buzzer (stop: 0, pattern 1: 1, pattern 2: 2, buzzer tone when input simultaneously with buzzer: 3, no change: 9)
+    sock: socket.socket
+        Connected socket of the target LA-POE, the socket opened by socket_open if omitted
+    """
+    # Create the data to be sent
+    send_data = pns_run_control_encode(run_control_data)
+
     # Send PNS command
-    recv_data = send_command(send_data)
+    recv_data = send_command(send_data, sock)
 
     # check the response data
-    if recv_data[0] == PNS_NAK:
-        raise ValueError('negative acknowledge')
+    pns_response_decode(recv_data)
 
 
-def pns_detail_run_control_command(detail_run_control_data: PnsDetailRunControlData):
+def pns_detail_run_control_encode(detail_run_control_data: PnsDetailRunControlData) -> bytes:
     """
-    Send detailed operation control command for PNS command
-
-    The color and operation pattern of each stage of the LED unit and the buzzer pattern (1 to 11) can be specified and controlled in the data area
+    Create detailed operation control command for PNS command
 
     Parameters
     ----------
@@ -1094,6 +1337,11 @@ def pns_detail_run_control_command(detail_run_control_data: PnsDetailRunControlD
         Pattern of LED unit (off: 0, red: 1, yellow: 2, lemon: 3, green: 4, sky blue: 5, blue: 6, purple: 7, peach: 8, white: 9)
         Flashing action (Flashing OFF: 0, Flashing ON: 1)
         Buzzer pattern (Stop: 0, Pattern 1: 1, Pattern 2: 2, Pattern 3: 3, Pattern 4: 4, Pattern 5: 5, Pattern 6: 6, Pattern 7: 7, Pattern 8: 8, Pattern 9: 9, Pattern 10: 10, Pattern 11: 11)
+
+    Returns
+    -------
+    send_data: bytes
+        data to be sent
     """
     # Create the data to be sent
     send_data = struct.pack(
@@ -1104,19 +1352,43 @@ def pns_detail_run_control_command(detail_run_control_data: PnsDetailRunControlD
     )
     send_data += detail_run_control_data.get_bytes()
 
+    return send_data
+
+
+def pns_detail_run_control_command(detail_run_control_data: PnsDetailRunControlData, sock: socket.socket = None):
+    """
+    Send detailed operation control command for PNS command
+
+    The color and operation pattern of each stage of the LED unit and the buzzer pattern (1 to 11) can be specified and controlled in the data area
+
+    Parameters
+    ----------
+    detail_run_control_data: PnsDetailRunControlData
+        Pattern of the 1st to 5th stage of the LED unit, blinking operation and buzzer (1 to 3)
+        Pattern of LED unit (off: 0, red: 1, yellow: 2, lemon: 3, green: 4, sky blue: 5, blue: 6, purple: 7, peach: 8, white: 9)
+        Flashing action (Flashing OFF: 0, Flashing ON: 1)
+        Buzzer pattern (Stop: 0, Pattern 1: 1, Pattern 2: 2, Pattern 3: 3, Pattern 4: 4, Pattern 5: 5, Pattern 6: 6, Pattern 7: 7, Pattern 8: 8, Pattern 9: 9, Pattern 10: 10, Pattern 11: 11)
+    sock: socket.socket
+        Connected socket of the target LA-POE, the socket opened by socket_open if omitted
+    """
+    # Create the data to be sent
+    send_data = pns_detail_run_control_encode(detail_run_control_data)
+
     # Send PNS command
-    recv_data = send_command(send_data)
+    recv_data = send_command(send_data, sock)
 
     # check the response data
-    if recv_data[0] == PNS_NAK:
-        raise ValueError('negative acknowledge')
+    pns_response_decode(recv_data)
 
 
-def pns_clear_command():
+def pns_clear_encode() -> bytes:
     """
-    Send clear command for PNS command
+    Create clear command for PNS command
 
-    Turn off the LED unit and stop the buzzer
+    Returns
+    -------
+    send_data: bytes
+        data to be sent
     """
     # Create the data to be sent
     send_data = struct.pack(
@@ -1126,24 +1398,43 @@ def pns_clear_command():
         0,                  # Data size
     )
 
+    return send_data
+
+
+def pns_clear_command(sock: socket.socket = None):
+    """
+    Send clear command for PNS command
+
+    Turn off the LED unit and stop the buzzer
+
+    Parameters
+    ----------
+    sock: socket.socket
+        Connected socket of the target LA-POE, the socket opened by socket_open if omitted
+    """
+    # Create the data to be sent
+    send_data = pns_clear_encode()
+
     # Send PNS command
-    recv_data = send_command(send_data)
+    recv_data = send_command(send_data, sock)
 
     # check the response data
-    if recv_data[0] == PNS_NAK:
-        raise ValueError('negative acknowledge')
+    pns_response_decode(recv_data)
 
 
-def pns_reboot_command(password: str):
+def pns_reboot_encode(password: str) -> bytes:
     """
-    Send restart command for PNS command
-
-    LA6-POE can be restarted
+    Create restart command for PNS command
 
     Parameters
     ----------
     password: str
         Password set in the password setting of Web Configuration
+
+    Returns
+    -------
+    send_data: bytes
+        data to be sent
     """
     # Create the data to be sent
     pass_data = password.encode('ascii')
@@ -1155,24 +1446,40 @@ def pns_reboot_command(password: str):
     )
     send_data += pass_data
 
+    return send_data
+
+
+def pns_reboot_command(password: str, sock: socket.socket = None):
+    """
+    Send restart command for PNS command
+
+    LA6-POE can be restarted
+
+    Parameters
+    ----------
+    password: str
+        Password set in the password setting of Web Configuration
+    sock: socket.socket
+        Connected socket of the target LA-POE, the socket opened by socket_open if omitted
+    """
+    # Create the data to be sent
+    send_data = pns_reboot_encode(password)
+
     # Send PNS command
-    recv_data = send_command(send_data)
+    recv_data = send_command(send_data, sock)
 
     # check the response data
-    if recv_data[0] == PNS_NAK:
-        raise ValueError('negative acknowledge')
+    pns_response_decode(recv_data)
 
 
-def pns_get_data_command() -> 'PnsStatusData':
+def pns_get_data_encode() -> bytes:
     """
-    Send status acquisition command for PNS command
-
-    Signal line/contact input status and LED unit and buzzer status can be acquired
+    Create status acquisition command for PNS command
 
     Returns
     -------
-    status_data: PnsStatusData
-        Received data of status acquisition command (status of signal line/contact input and status of LED unit and buzzer)
+    send_data: bytes
+        data to be sent
     """
     # Create the data to be sent
     send_data = struct.pack(
@@ -1182,28 +1489,89 @@ def pns_get_data_command() -> 'PnsStatusData':
         0,                      # Data size
     )
 
-    # Send PNS command
-    recv_data = send_command(send_data)
+    return send_data
+
+
+def pns_get_data_decode(recv_data: bytes) -> 'PnsStatusData':
+    """
+    Check and decode the response data of pns_get_data_command
 
+    Parameters
+    ----------
+    recv_data: bytes
+        received data
+
+    Returns
+    -------
+    status_data: PnsStatusData
+        Received data of status acquisition command (status of signal line/contact input and status of LED unit and buzzer)
+    """
     # check the response data
-    if recv_data[0] == PNS_NAK:
-        raise ValueError('negative acknowledge')
+    _check_pns_response(recv_data, 9)
+    _check_pns_response(recv_data, 15 if recv_data[8] == PNS_LED_MODE else 13)
 
-    status_data = PnsStatusData(recv_data)
+    status_data = _decode_status(PnsStatusData, recv_data)
 
     return status_data
 
 
-def pns_get_detail_data_command() -> 'PnsDetailStatusData':
+def pns_get_data_command(sock: socket.socket = None) -> 'PnsStatusData':
     """
-    Send command to get detailed status of PNS command
+    Send status acquisition command for PNS command
 
-    Signal line/contact input status, LED unit and buzzer status, and color information for each stage can be acquired
+    Signal line/contact input status and LED unit and buzzer status can be acquired
+
+    Parameters
+    ----------
+    sock: socket.socket
+        Connected socket of the target LA-POE, the socket opened by socket_open if omitted
 
     Returns
     -------
-    detail_status_data: PnsDetailStatusData
-        Received data of detail status acquisition command (status of signal line/contact input, status of LED unit and buzzer, and color information of each stage)
+    status_data: PnsStatusData
+        Received data of status acquisition command (status of signal line/contact input and status of LED unit and buzzer)
+    """
+    # Create the data to be sent
+    send_data = pns_get_data_encode()
+
+    # Send PNS command
+    recv_data = send_command(send_data, sock)
+
+    # check and decode the response data
+    status_data = pns_get_data_decode(recv_data)
+
+    return status_data
+
+
+def pns_get_data_frame_command(sock: socket.socket = None) -> bytes:
+    """
+    Send command to get status of PNS command, keeping the response data undecoded
+
+    The response is checked like pns_get_data_command, for callers storing or forwarding the raw frame
+
+    Parameters
+    ----------
+    sock: socket.socket
+        Connected socket of the target LA-POE, the socket opened by socket_open if omitted
+
+    Returns
+    -------
+    recv_data: bytes
+        Response data of status acquisition command
+    """
+    recv_data = send_command(pns_get_data_encode(), sock)
+    pns_get_data_decode(recv_data)
+    return recv_data
+
+
+def pns_get_detail_data_encode() -> bytes:
+    """
+    Create command to get detailed status of PNS command
+
+    Returns
+    -------
+    send_data: bytes
+        data to be sent
     """
     # Create the data to be sent
     send_data = struct.pack(
@@ -1213,23 +1581,84 @@ def pns_get_detail_data_command() -> 'PnsDetailStatusData':
         0,                              # Data size
     )
 
-    # Send PNS command
-    recv_data = send_command(send_data)
+    return send_data
+
 
+def pns_get_detail_data_decode(recv_data: bytes) -> 'PnsDetailStatusData':
+    """
+    Check and decode the response data of pns_get_detail_data_command
+
+    Parameters
+    ----------
+    recv_data: bytes
+        received data
+
+    Returns
+    -------
+    detail_status_data: PnsDetailStatusData
+        Received data of detail status acquisition command (status of signal line/contact input, status of LED unit and buzzer, and color information of each stage)
+    """
     # check the response data
-    if recv_data[0] == PNS_NAK:
-        raise ValueError('negative acknowledge')
+    _check_pns_response(recv_data, 19)
+    _check_pns_response(recv_data, 40 if recv_data[14] == PNS_LED_MODE else 45)
 
-    detail_status_data = PnsDetailStatusData(recv_data)
+    detail_status_data = _decode_status(PnsDetailStatusData, recv_data)
 
     return detail_status_data
 
 
-def phn_write_command(run_data: int):
+def pns_get_detail_data_command(sock: socket.socket = None) -> 'PnsDetailStatusData':
     """
-    Send PHN command write command
+    Send command to get detailed status of PNS command
 
-    Can control the lighting and blinking of LED units 1 to 3 stages, and buzzer patterns 1 and 2
+    Signal line/contact input status, LED unit and buzzer status, and color information for each stage can be acquired
+
+    Parameters
+    ----------
+    sock: socket.socket
+        Connected socket of the target LA-POE, the socket opened by socket_open if omitted
+
+    Returns
+    -------
+    detail_status_data: PnsDetailStatusData
+        Received data of detail status acquisition command (status of signal line/contact input, status of LED unit and buzzer, and color information of each stage)
+    """
+    # Create the data to be sent
+    send_data = pns_get_detail_data_encode()
+
+    # Send PNS command
+    recv_data = send_command(send_data, sock)
+
+    # check and decode the response data
+    detail_status_data = pns_get_detail_data_decode(recv_data)
+
+    return detail_status_data
+
+
+def pns_get_detail_data_frame_command(sock: socket.socket = None) -> bytes:
+    """
+    Send command to get detailed status of PNS command, keeping the response data undecoded
+
+    The response is checked like pns_get_detail_data_command, for callers storing or forwarding the raw frame
+
+    Parameters
+    ----------
+    sock: socket.socket
+        Connected socket of the target LA-POE, the socket opened by socket_open if omitted
+
+    Returns
+    -------
+    recv_data: bytes
+        Response data of detail status acquisition command
+    """
+    recv_data = send_command(pns_get_detail_data_encode(), sock)
+    pns_get_detail_data_decode(recv_data)
+    return recv_data
+
+
+def phn_write_encode(run_data: int) -> bytes:
+    """
+    Create PHN command write command
 
     Parameters
     ----------
@@ -1243,6 +1672,11 @@ def phn_write_command(run_data: int):
             bit2: 3rd LED unit lighting (OFF: 0, ON: 1)
             bit1: 2nd LED unit lighting (OFF: 0, ON: 1)
             bit0: 1st LED unit lighting (OFF: 0, ON: 1)
+
+    Returns
+    -------
+    send_data: bytes
+        data to be sent
     """
     # Create the data to be sent
     send_data = struct.pack(
@@ -1251,24 +1685,64 @@ def phn_write_command(run_data: int):
         run_data,           # Operation data
     )
 
-    # send PHN command
-    recv_data = send_command(send_data)
+    return send_data
 
+
+def phn_write_decode(recv_data: bytes):
+    """
+    Check the response data of phn_write_command
+
+    Parameters
+    ----------
+    recv_data: bytes
+        received data
+    """
     # check the response data
     if recv_data == PHN_NAK:
-        raise ValueError('negative acknowledge')
+        raise LaPoeNakError()
+    if recv_data != PHN_ACK:
+        raise LaPoeFrameError('unexpected response %r' % recv_data)
 
 
-def phn_read_command() -> int:
+def phn_write_command(run_data: int, sock: socket.socket = None):
     """
-    Send command to read PHN command
+    Send PHN command write command
 
-    Get information about LED unit 1 to 3 stage lighting and blinking, and buzzer pattern 1 and 2
+    Can control the lighting and blinking of LED units 1 to 3 stages, and buzzer patterns 1 and 2
+
+    Parameters
+    ----------
+    run_data: int
+        Operation data for lighting and blinking of LED unit 1 to 3 stages, and buzzer pattern 1 and 2
+            bit7: 3rd LED unit blinking (OFF: 0, ON: 1)
+            bit6: 2nd LED unit blinking (OFF: 0, ON: 1)
+            bit5: 1st LED unit blinking (OFF: 0, ON: 1)
+            bit4: Buzzer pattern 2 (OFF: 0, ON: 1)
+            bit3: Buzzer pattern 1 (OFF: 0, ON: 1)
+            bit2: 3rd LED unit lighting (OFF: 0, ON: 1)
+            bit1: 2nd LED unit lighting (OFF: 0, ON: 1)
+            bit0: 1st LED unit lighting (OFF: 0, ON: 1)
+    sock: socket.socket
+        Connected socket of the target LA-POE, the socket opened by socket_open if omitted
+    """
+    # Create the data to be sent
+    send_data = phn_write_encode(run_data)
+
+    # send PHN command
+    recv_data = send_command(send_data, sock)
+
+    # check the response data
+    phn_write_decode(recv_data)
+
+
+def phn_read_encode() -> bytes:
+    """
+    Create command to read PHN command
 
     Returns
     -------
-    run_data: int
-        Received data of read command (operation data of LED unit 1 to 3 stages lighting and blinking, buzzer pattern 1,2)
+    send_data: bytes
+        data to be sent
     """
     # Create the data to be sent
     send_data = struct.pack(
@@ -1276,17 +1750,61 @@ def phn_read_command() -> int:
         PHN_READ_COMMAND,   # Command identifier (R)
     )
 
-    # send PHN command
-    recv_data = send_command(send_data)
+    return send_data
+
+
+def phn_read_decode(recv_data: bytes) -> int:
+    """
+    Check and decode the response data of phn_read_command
+
+    Parameters
+    ----------
+    recv_data: bytes
+        received data
 
+    Returns
+    -------
+    run_data: int
+        Received data of read command (operation data of LED unit 1 to 3 stages lighting and blinking, buzzer pattern 1,2)
+    """
     # check the response data
-    if recv_data[0] != int(PHN_READ_COMMAND.hex(), 16):
-        raise ValueError('negative acknowledge')
+    if recv_data == PHN_NAK:
+        raise LaPoeNakError()
+    if len(recv_data) < 2 or recv_data[0:1] != PHN_READ_COMMAND:
+        raise LaPoeFrameError('unexpected response %r' % recv_data)
 
     run_data = int(recv_data[1])
 
     return run_data
 
 
+def phn_read_command(sock: socket.socket = None) -> int:
+    """
+    Send command to read PHN command
+
+    Get information about LED unit 1 to 3 stage lighting and blinking, and buzzer pattern 1 and 2
+
+    Parameters
+    ----------
+    sock: socket.socket
+        Connected socket of the target LA-POE, the socket opened by socket_open if omitted
+
+    Returns
+    -------
+    run_data: int
+        Received data of read command (operation data of LED unit 1 to 3 stages lighting and blinking, buzzer pattern 1,2)
+    """
+    # Create the data to be sent
+    send_data = phn_read_encode()
+
+    # send PHN command
+    recv_data = send_command(send_data, sock)
+
+    # check and decode the response data
+    run_data = phn_read_decode(recv_data)
+
+    return run_data
+
+
 if __name__ == '__main__':
     main()
@@ -0,0 +1,211 @@
+import concurrent.futures
+import threading
+import time
+
+from colors import ColorLookupTable, nearest_detail_color
+from fleet import TokenBucket
+from main import (
+    LaPoeError,
+    PNS_LED_MODE,
+    PNS_RUN_CONTROL_LED_OFF,
+    PNS_RUN_CONTROL_LED_BLINKING,
+    PNS_DETAIL_RUN_CONTROL_LED_OFF,
+    PNS_DETAIL_RUN_CONTROL_BLINKING_OFF,
+    PNS_DETAIL_RUN_CONTROL_BLINKING_ON,
+    PnsDetailRunControlData,
+    PnsDetailStatusData,
+    pns_get_detail_data_command,
+    pns_detail_run_control_command,
+)
+
+
+def detail_run_control_data_from_status(status: PnsDetailStatusData,
+                                        color_table: dict = None) -> PnsDetailRunControlData:
+    """
+    Convert a detailed status into the detailed operation control data reproducing it
+
+    The detailed operation control command has a single blinking action, so all lit units blink if any unit blinks
+
+    Parameters
+    ----------
+    status: PnsDetailStatusData
+        Received data of detail status acquisition command
+    color_table: dict
+        RGB per color code or ColorLookupTable used to match the reported RGB, NOMINAL_COLOR_RGB if omitted
+
+    Returns
+    -------
+    detail_run_control_data: PnsDetailRunControlData
+        Detailed operation control data
+    """
+    if status.mode == PNS_LED_MODE:
+        detail_data = status.led_mode_detail_data
+    else:
+        detail_data = status.smart_mode_detail_data
+    units = (
+        detail_data.led_unit1_data,
+        detail_data.led_unit2_data,
+        detail_data.led_unit3_data,
+        detail_data.led_unit4_data,
+        detail_data.led_unit5_data,
+    )
+    colors = []
+    blinking_control = PNS_DETAIL_RUN_CONTROL_BLINKING_OFF
+    for unit in units:
+        if unit.led_pattern == PNS_RUN_CONTROL_LED_OFF:
+            colors.append(PNS_DETAIL_RUN_CONTROL_LED_OFF)
+            continue
+        if unit.led_pattern == PNS_RUN_CONTROL_LED_BLINKING:
+            blinking_control = PNS_DETAIL_RUN_CONTROL_BLINKING_ON
+        colors.append(nearest_detail_color(unit.red, unit.green, unit.blue, color_table))
+    return PnsDetailRunControlData(*colors, blinking_control, detail_data.buzzer_pattern)
+
+
+class MirrorService:
+    """mirrors the state of a master tower to any number of slave towers"""
+
+    def __init__(self, pool, master: str, slaves: list, interval: float = 0.2, max_workers: int = 16,
+                 rate: float = None, color_table: dict = None):
+        """
+        mirrors the state of a master tower to any number of slave towers
+
+        Every slave is written directly by a bounded pool of workers rather than relayed down a fan-out tree
+        of slaves: each hop of a tree would add a poll interval to the lag of the towers below it
+
+        Parameters
+        ----------
+        pool: ConnectionPool
+            Connections to the master and the slaves
+        master: str
+            Device id of the master
+        slaves: list
+            Device ids of the slaves
+        interval: float
+            Poll interval of the master in seconds
+        max_workers: int
+            Maximum number of slaves written concurrently
+        rate: float
+            Maximum number of slave writes per second, unlimited if omitted
+        color_table: dict
+            RGB per color code used to match the RGB reported by the master
+        """
+        self._pool = pool
+        self._master = master
+        self._slaves = list(slaves)
+        self._interval = interval
+        self._color_table = ColorLookupTable(color_table)
+        self._bucket = TokenBucket(rate, max(rate, 1.0)) if rate else None
+        self._max_workers = max_workers
+        self._executor = None
+        self._lock = threading.Lock()
+        self._frame = None
+        self._changed_at = None
+        self._applied = {}
+        self._lags = {}
+        self._errors = {}
+        self._master_error = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def lags(self) -> dict:
+        """seconds between the master change being seen and each slave acknowledging it"""
+        with self._lock:
+            return dict(self._lags)
+
+    @property
+    def errors(self) -> dict:
+        """last exception of each slave that is not in sync"""
+        with self._lock:
+            return dict(self._errors)
+
+    @property
+    def master_error(self):
+        """exception of the last poll of the master, None if it succeeded"""
+        with self._lock:
+            return self._master_error
+
+    @property
+    def pending(self) -> list:
+        """slaves not in sync with the master"""
+        with self._lock:
+            return [slave for slave in self._slaves if self._applied.get(slave) != self._frame]
+
+    def sync_once(self) -> bool:
+        """
+        Poll the master once and write its state to the slaves that are not in sync
+
+        Returns
+        -------
+        changed: bool
+            True if the state of the master changed
+        """
+        try:
+            status = self._pool.run(self._master, pns_get_detail_data_command)
+        except Exception as e:
+            with self._lock:
+                self._master_error = e
+            raise
+        data = detail_run_control_data_from_status(status, self._color_table)
+        frame = data.get_bytes()
+        with self._lock:
+            self._master_error = None
+            if self._executor is None:
+                self._executor = concurrent.futures.ThreadPoolExecutor(self._max_workers)
+            executor = self._executor
+            changed = frame != self._frame
+            if changed:
+                self._frame = frame
+                self._changed_at = time.monotonic()
+            changed_at = self._changed_at
+            targets = [slave for slave in self._slaves if self._applied.get(slave) != frame]
+
+        futures = [executor.submit(self._write, slave, data, frame, changed_at) for slave in targets]
+        concurrent.futures.wait(futures)
+        return changed
+
+    def _write(self, slave: str, data: PnsDetailRunControlData, frame: bytes, changed_at: float):
+        if self._bucket is not None:
+            self._bucket.acquire()
+        try:
+            self._pool.run(slave, pns_detail_run_control_command, data)
+        except Exception as e:
+            with self._lock:
+                self._errors[slave] = e
+            return
+        with self._lock:
+            self._applied[slave] = frame
+            self._lags[slave] = time.monotonic() - changed_at
+            self._errors.pop(slave, None)
+
+    def start(self):
+        """
+        Start mirroring in a background thread.
+        """
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stop mirroring and wait for the pending writes.
+        """
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown()
+
+    def _run(self):
+        while not self._stop.is_set():
+            started = time.monotonic()
+            try:
+                self.sync_once()
+            except (LaPoeError, OSError):
+                # master unreachable or refusing (see master_error): keep the slaves as they are
+                # and retry on the next poll
+                pass
+            self._stop.wait(max(self._interval - (time.monotonic() - started), 0))
@@ -0,0 +1,710 @@
+import concurrent.futures
+import socket
+import socketserver
+import struct
+import threading
+
+from main import (
+    PNS_PRODUCT_ID,
+    PNS_SMART_MODE_COMMAND,
+    PNS_MUTE_COMMAND,
+    PNS_STOP_PULSE_INPUT_COMMAND,
+    PNS_RUN_CONTROL_COMMAND,
+    PNS_DETAIL_RUN_CONTROL_COMMAND,
+    PNS_CLEAR_COMMAND,
+    PNS_GET_DATA_COMMAND,
+    PNS_GET_DETAIL_DATA_COMMAND,
+    PNS_ACK,
+    PNS_NAK,
+    PNS_LED_MODE,
+    PHN_WRITE_COMMAND,
+    PHN_READ_COMMAND,
+    PHN_ACK,
+    PHN_NAK,
+    LaPoeError,
+    LaPoeFrameError,
+    LaPoeTimeoutError,
+    pns_get_detail_data_encode,
+)
+from phn import phn_run_data_from_patterns, run_control_data_from_phn
+
+MODBUS_PORT = 502
+"""port number of Modbus TCP"""
+
+# Modbus function code
+MODBUS_READ_HOLDING_REGISTERS = 0x03
+"""read holding registers"""
+MODBUS_READ_INPUT_REGISTERS = 0x04
+"""read input registers"""
+MODBUS_WRITE_SINGLE_REGISTER = 0x06
+"""write single register"""
+MODBUS_WRITE_MULTIPLE_REGISTERS = 0x10
+"""write multiple registers"""
+
+MODBUS_DETAIL_STATUS_SIZE = 45
+"""number of input registers of the detailed status in the default layout of ModbusRegisterMap"""
+
+# MBAP header: transaction id, protocol id, length, unit id
+_MBAP_HEADER = struct.Struct('>HHHB')
+
+
+class ModbusError(Exception):
+    """exception response of a Modbus request"""
+
+    def __init__(self, function: int, exception_code: int):
+        """
+        exception response of a Modbus request
+
+        Parameters
+        ----------
+        function: int
+            Function code of the request
+        exception_code: int
+            Modbus exception code
+        """
+        super().__init__('modbus exception %d (function 0x%02x)' % (exception_code, function))
+        self.function = function
+        self.exception_code = exception_code
+
+
+class ModbusRegisterMap:
+    """register addresses and register layout of the PNS commands of a device"""
+
+    __slots__ = ('_run_control', '_detail_run_control', '_smart_mode', '_mute', '_stop_pulse_input', '_clear',
+                 '_detail_status')
+
+    def __init__(self, run_control: int, detail_run_control: int, smart_mode: int, mute: int,
+                 stop_pulse_input: int, clear: int, detail_status: int):
+        """
+        register addresses and register layout of the PNS commands of a device
+
+        There is no default map: take the addresses from the Modbus specification of the firmware in use.
+
+        The default layout is a placeholder, the layout served by ModbusStandInServer and not one taken
+        from a device specification: each block holds one PNS data byte per register, in the order of the
+        data of the PNS command, and the detailed status is the response data of the get detail status
+        command, one byte per input register. For a device laid out differently, subclass the map and
+        override values, detail_status_size and detail_status_data
+
+        Parameters
+        ----------
+        run_control: int
+            First holding register of 1st to 5th LED unit pattern, buzzer pattern (6 registers)
+        detail_run_control: int
+            First holding register of 1st to 5th LED unit color, blinking action, buzzer pattern (7 registers)
+        smart_mode: int
+            Holding register of the group number to execute smart mode
+        mute: int
+            Holding register of the buzzer ON/OFF of smart mode
+        stop_pulse_input: int
+            Holding register of the STOP input/trigger input
+        clear: int
+            Holding register clearing the LED units and buzzer when 1 is written
+        detail_status: int
+            First input register of the response data of the get detail status command (45 registers)
+        """
+        self._run_control = run_control
+        self._detail_run_control = detail_run_control
+        self._smart_mode = smart_mode
+        self._mute = mute
+        self._stop_pulse_input = stop_pulse_input
+        self._clear = clear
+        self._detail_status = detail_status
+
+    @property
+    def run_control(self) -> int:
+        """first holding register of the operation control data"""
+        return self._run_control
+
+    @property
+    def detail_run_control(self) -> int:
+        """first holding register of the detail operation control data"""
+        return self._detail_run_control
+
+    @property
+    def smart_mode(self) -> int:
+        """holding register of the smart mode group number"""
+        return self._smart_mode
+
+    @property
+    def mute(self) -> int:
+        """holding register of the mute"""
+        return self._mute
+
+    @property
+    def stop_pulse_input(self) -> int:
+        """holding register of the STOP input/trigger input"""
+        return self._stop_pulse_input
+
+    @property
+    def clear(self) -> int:
+        """holding register of the clear"""
+        return self._clear
+
+    @property
+    def detail_status(self) -> int:
+        """first input register of the detailed status"""
+        return self._detail_status
+
+    @property
+    def detail_status_size(self) -> int:
+        """number of input registers of the detailed status"""
+        return MODBUS_DETAIL_STATUS_SIZE
+
+    def values(self, command: bytes, data: bytes) -> list:
+        """
+        Convert the data of a PNS command into the values written to its block of holding registers
+
+        Parameters
+        ----------
+        command: bytes
+            PNS command identifier (PNS_RUN_CONTROL_COMMAND, PNS_SMART_MODE_COMMAND, ...)
+        data: bytes
+            Data of the PNS command
+
+        Returns
+        -------
+        values: list
+            register values, from the first register of the block
+        """
+        if command == PNS_CLEAR_COMMAND:
+            return [1]
+        return list(data)
+
+    def detail_status_data(self, values: list) -> bytes:
+        """
+        Rebuild the response data of the get detail status command from the input registers
+
+        Parameters
+        ----------
+        values: list
+            detail_status_size register values read from detail_status
+
+        Returns
+        -------
+        recv_data: bytes
+            response data of the get detail status command
+        """
+        return bytes(v & 0xFF for v in values)
+
+
+def _cancel_with(result: concurrent.futures.Future, future: concurrent.futures.Future):
+    """Cancel a request future when the future derived from it is cancelled"""
+    result.add_done_callback(lambda f: future.cancel() if f.cancelled() else None)
+
+
+def _recv_exactly(sock: socket.socket, size: int) -> bytes:
+    data = b''
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            raise ConnectionResetError('connection closed')
+        data += chunk
+    return data
+
+
+class ModbusClient:
+    """pipelined Modbus TCP client"""
+
+    def __init__(self, ip: str, port: int = MODBUS_PORT, unit_id: int = 1, timeout: float = None):
+        """
+        pipelined Modbus TCP client
+
+        Requests of several threads are sent without waiting for the previous responses
+        and matched with their responses by transaction id
+
+        Parameters
+        ----------
+        ip: str
+            IP address
+        port: int
+            port number
+        unit_id: int
+            Unit identifier
+        timeout: float
+            Connect timeout and response timeout of ModbusTransport in seconds, blocking if omitted
+        """
+        self._address = (ip, port)
+        self._unit_id = unit_id
+        self._timeout = timeout
+        self._sock = socket.create_connection((ip, port), timeout)
+        # the reader thread waits for responses indefinitely, each request times out on its future
+        self._sock.settimeout(None)
+        self._send_lock = threading.Lock()
+        self._lock = threading.Lock()
+        self._transaction_id = 0
+        # function code and future of each transaction id waiting for its response
+        self._pending = {}
+        self._closed = False
+        self._reader = threading.Thread(target=self._read_responses, daemon=True)
+        self._reader.start()
+
+    @property
+    def address(self) -> tuple:
+        """(IP address, port number) of the device"""
+        return self._address
+
+    @property
+    def timeout(self) -> float:
+        """response timeout in seconds, None if blocking"""
+        return self._timeout
+
+    @property
+    def pending(self) -> int:
+        """number of requests waiting for their response"""
+        with self._lock:
+            return len(self._pending)
+
+    def request(self, function: int, payload: bytes) -> concurrent.futures.Future:
+        """
+        Send a request
+
+        Parameters
+        ----------
+        function: int
+            Function code
+        payload: bytes
+            Request data following the function code
+
+        Returns
+        -------
+        future: concurrent.futures.Future
+            Response data following the function code, cancel it to give up waiting
+        """
+        future = concurrent.futures.Future()
+        with self._lock:
+            if self._closed:
+                raise ConnectionResetError('connection closed')
+            if len(self._pending) > 0xFFFF:
+                raise LaPoeError('too many Modbus requests waiting for a response')
+            # a transaction id still waiting is skipped, its late response must not resolve another request
+            transaction_id = (self._transaction_id + 1) & 0xFFFF
+            while transaction_id in self._pending:
+                transaction_id = (transaction_id + 1) & 0xFFFF
+            self._transaction_id = transaction_id
+            self._pending[transaction_id] = (function, future)
+        future.add_done_callback(lambda f: self._discard(transaction_id, f))
+        frame = _MBAP_HEADER.pack(
+            transaction_id,     # transaction id
+            0,                  # protocol id (Modbus)
+            len(payload) + 2,   # length (unit id, function code and data)
+            self._unit_id,      # unit id
+        ) + bytes([function]) + payload
+        try:
+            with self._send_lock:
+                self._sock.sendall(frame)
+        except OSError:
+            with self._lock:
+                self._pending.pop(transaction_id, None)
+            raise
+        return future
+
+    def _discard(self, transaction_id: int, future: concurrent.futures.Future):
+        # done callback of the request futures: a cancelled request no longer waits for its response
+        if future.cancelled():
+            with self._lock:
+                if self._pending.get(transaction_id, (None, None))[1] is future:
+                    del self._pending[transaction_id]
+
+    def _read_responses(self):
+        try:
+            while True:
+                header = _recv_exactly(self._sock, _MBAP_HEADER.size)
+                transaction_id, _, length, _ = _MBAP_HEADER.unpack(header)
+                pdu = _recv_exactly(self._sock, length - 1)
+                with self._lock:
+                    function, future = self._pending.pop(transaction_id, (None, None))
+                if future is None or not future.set_running_or_notify_cancel():
+                    # cancelled by the caller
+                    continue
+                if pdu[0:1] == bytes([function | 0x80]) and len(pdu) >= 2:
+                    future.set_exception(ModbusError(function, pdu[1]))
+                elif pdu[0:1] == bytes([function]):
+                    future.set_result(pdu[1:])
+                else:
+                    future.set_exception(LaPoeFrameError('unexpected Modbus response %r' % pdu[0:1]))
+        except Exception as e:
+            with self._lock:
+                self._closed = True
+                pending = list(self._pending.values())
+                self._pending.clear()
+            for _, future in pending:
+                if future.set_running_or_notify_cancel():
+                    future.set_exception(e)
+
+    def read_input_registers(self, address: int, count: int) -> concurrent.futures.Future:
+        """
+        Read input registers
+
+        Parameters
+        ----------
+        address: int
+            First register address
+        count: int
+            Number of registers
+
+        Returns
+        -------
+        future: concurrent.futures.Future
+            list of register values
+        """
+        return self._read(MODBUS_READ_INPUT_REGISTERS, address, count)
+
+    def read_holding_registers(self, address: int, count: int) -> concurrent.futures.Future:
+        """
+        Read holding registers
+
+        Parameters
+        ----------
+        address: int
+            First register address
+        count: int
+            Number of registers
+
+        Returns
+        -------
+        future: concurrent.futures.Future
+            list of register values
+        """
+        return self._read(MODBUS_READ_HOLDING_REGISTERS, address, count)
+
+    def _read(self, function: int, address: int, count: int) -> concurrent.futures.Future:
+        result = concurrent.futures.Future()
+        future = self.request(function, struct.pack('>HH', address, count))
+        _cancel_with(result, future)
+
+        def done(f: concurrent.futures.Future):
+            if f.cancelled():
+                return
+            if f.exception() is not None:
+                result.set_exception(f.exception())
+                return
+            try:
+                data = f.result()
+                values = list(struct.unpack('>%dH' % (data[0] // 2), data[1:1 + data[0]]))
+            except (IndexError, struct.error) as e:
+                result.set_exception(LaPoeFrameError('malformed Modbus response: %s' % e))
+                return
+            result.set_result(values)
+
+        future.add_done_callback(done)
+        return result
+
+    def write_registers(self, address: int, values: list) -> concurrent.futures.Future:
+        """
+        Write consecutive holding registers in one request
+
+        Parameters
+        ----------
+        address: int
+            First register address
+        values: list
+            Register values
+
+        Returns
+        -------
+        future: concurrent.futures.Future
+            completed when the device acknowledges the write
+        """
+        if len(values) == 1:
+            return self.request(MODBUS_WRITE_SINGLE_REGISTER, struct.pack('>HH', address, values[0]))
+        payload = struct.pack('>HHB%dH' % len(values), address, len(values), len(values) * 2, *values)
+        return self.request(MODBUS_WRITE_MULTIPLE_REGISTERS, payload)
+
+    def close(self):
+        """
+        Close the connection.
+        """
+        with self._lock:
+            self._closed = True
+        try:
+            self._sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self._sock.close()
+        self._reader.join()
+
+
+class ModbusTransport:
+    """socket-like object carrying PNS/PHN commands over Modbus TCP"""
+
+    def __init__(self, client: ModbusClient, register_map: ModbusRegisterMap):
+        """
+        socket-like object carrying PNS/PHN commands over Modbus TCP
+
+        Pass it as sock to the command functions of main.py;
+        each command frame is translated into register reads/writes and its response data rebuilt.
+        recv raises LaPoeTimeoutError when no response arrives within the timeout of the client,
+        the request is then cancelled and its late response ignored
+
+        Parameters
+        ----------
+        client: ModbusClient
+            Modbus connection, can be shared by several transports
+        register_map: ModbusRegisterMap
+            Register addresses and layout of the device
+        """
+        self._client = client
+        self._map = register_map
+        self._response = None
+
+    def submit(self, send_data: bytes) -> concurrent.futures.Future:
+        """
+        Send a PNS/PHN command without waiting for the response
+
+        Parameters
+        ----------
+        send_data: bytes
+            PNS/PHN command
+
+        Returns
+        -------
+        future: concurrent.futures.Future
+            response data of the command, as returned by the PNS socket
+        """
+        client = self._client
+        registers = self._map
+        if send_data[0:2] == PNS_PRODUCT_ID:
+            command = send_data[2:3]
+            data = send_data[6:]
+            blocks = {
+                PNS_RUN_CONTROL_COMMAND: registers.run_control,
+                PNS_DETAIL_RUN_CONTROL_COMMAND: registers.detail_run_control,
+                PNS_SMART_MODE_COMMAND: registers.smart_mode,
+                PNS_MUTE_COMMAND: registers.mute,
+                PNS_STOP_PULSE_INPUT_COMMAND: registers.stop_pulse_input,
+                PNS_CLEAR_COMMAND: registers.clear,
+            }
+            if command in blocks:
+                return self._ack(client.write_registers(blocks[command], registers.values(command, data)))
+            if command == PNS_GET_DATA_COMMAND:
+                return self._status(_status_from_detail)
+            if command == PNS_GET_DETAIL_DATA_COMMAND:
+                return self._status(bytes)
+        else:
+            if send_data[0:1] == PHN_WRITE_COMMAND and len(send_data) == 2:
+                run_control_data = run_control_data_from_phn(send_data[1])
+                values = registers.values(PNS_RUN_CONTROL_COMMAND, run_control_data.get_bytes())
+                return self._ack(client.write_registers(registers.run_control, values), PHN_ACK, PHN_NAK)
+            if send_data[0:1] == PHN_READ_COMMAND:
+                return self._status(lambda values: PHN_READ_COMMAND + bytes([_phn_from_detail(values)]), PHN_NAK)
+
+        # not available over Modbus (reboot command, unknown command)
+        future = concurrent.futures.Future()
+        future.set_result(PHN_NAK if send_data[0:2] != PNS_PRODUCT_ID else bytes([PNS_NAK]))
+        return future
+
+    @staticmethod
+    def _ack(future: concurrent.futures.Future, ack: bytes = bytes([PNS_ACK]), nak: bytes = bytes([PNS_NAK])):
+        result = concurrent.futures.Future()
+        _cancel_with(result, future)
+
+        def done(f: concurrent.futures.Future):
+            if f.cancelled():
+                return
+            if isinstance(f.exception(), ModbusError):
+                result.set_result(nak)
+            elif f.exception() is not None:
+                result.set_exception(f.exception())
+            else:
+                result.set_result(ack)
+
+        future.add_done_callback(done)
+        return result
+
+    def _status(self, convert, nak: bytes = bytes([PNS_NAK])) -> concurrent.futures.Future:
+        result = concurrent.futures.Future()
+        future = self._client.read_input_registers(self._map.detail_status, self._map.detail_status_size)
+        _cancel_with(result, future)
+
+        def done(f: concurrent.futures.Future):
+            if f.cancelled():
+                return
+            if isinstance(f.exception(), ModbusError):
+                result.set_result(nak)
+            elif f.exception() is not None:
+                result.set_exception(f.exception())
+            else:
+                try:
+                    result.set_result(convert(self._map.detail_status_data(f.result())))
+                except (IndexError, ValueError) as e:
+                    result.set_exception(LaPoeFrameError('malformed detailed status: %s' % e))
+
+        future.add_done_callback(done)
+        return result
+
+    def send(self, send_data: bytes) -> int:
+        """
+        Send a PNS/PHN command
+
+        Parameters
+        ----------
+        send_data: bytes
+            PNS/PHN command
+
+        Returns
+        -------
+        size: int
+            number of bytes sent
+        """
+        self._response = self.submit(send_data)
+        return len(send_data)
+
+    def recv(self, bufsize: int) -> bytes:
+        """
+        Receive the response of the last command
+
+        Parameters
+        ----------
+        bufsize: int
+            Maximum number of bytes
+
+        Returns
+        -------
+        recv_data: bytes
+            response data
+        """
+        response, self._response = self._response, None
+        if response is None:
+            return b''
+        try:
+            return response.result(self._client.timeout)[:bufsize]
+        except concurrent.futures.TimeoutError as e:
+            response.cancel()
+            raise LaPoeTimeoutError('no response') from e
+
+    def getpeername(self) -> tuple:
+        """
+        Get the address of the device
+
+        Returns
+        -------
+        address: tuple
+            (IP address, port number)
+        """
+        return self._client.address
+
+
+def _status_from_detail(detail: bytes) -> bytes:
+    """Rebuild the response data of the get status command from the detailed status"""
+    data = detail[6:15]
+    if detail[14] == PNS_LED_MODE:
+        units = detail[19:39]
+        data += bytes(units[i * 4] for i in range(5)) + detail[39:40]
+    else:
+        data += detail[19:23] + bytes(2)
+    return data
+
+
+def _phn_from_detail(detail: bytes) -> int:
+    """Rebuild the operation data of the PHN read command from the detailed status"""
+    offset = 19 if detail[14] == PNS_LED_MODE else 24
+    led_patterns = [detail[offset + i * 4] for i in range(3)]
+    return phn_run_data_from_patterns(led_patterns, detail[offset + 20])
+
+
+class _ModbusRequestHandler(socketserver.BaseRequestHandler):
+
+    def handle(self):
+        try:
+            while True:
+                header = _recv_exactly(self.request, _MBAP_HEADER.size)
+                transaction_id, protocol_id, length, unit_id = _MBAP_HEADER.unpack(header)
+                pdu = _recv_exactly(self.request, length - 1)
+                response = self.server.handle_pdu(pdu)
+                self.request.sendall(_MBAP_HEADER.pack(transaction_id, protocol_id, len(response) + 1, unit_id)
+                                     + response)
+        except OSError:
+            pass
+
+
+class ModbusStandInServer(socketserver.ThreadingTCPServer):
+    """local Modbus TCP server standing in for an LA6-POE"""
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address: tuple, register_map: ModbusRegisterMap, simulator=None):
+        """
+        local Modbus TCP server standing in for an LA6-POE
+
+        Parameters
+        ----------
+        address: tuple
+            (IP address, port number) to listen on, port 0 selects a free port
+        register_map: ModbusRegisterMap
+            Register addresses served, with the default layout of ModbusRegisterMap
+        simulator: LaPoeSimulator
+            Simulated device behind the register map, a new one is created if omitted
+        """
+        super().__init__(address, _ModbusRequestHandler)
+        if simulator is None:
+            from simulator import LaPoeSimulator
+            simulator = LaPoeSimulator()
+        self.simulator = simulator
+        self.register_map = register_map
+        # PNS command written by each block of holding registers (first register, size)
+        self._write_blocks = (
+            (register_map.run_control, 6, PNS_RUN_CONTROL_COMMAND),
+            (register_map.detail_run_control, 7, PNS_DETAIL_RUN_CONTROL_COMMAND),
+            (register_map.smart_mode, 1, PNS_SMART_MODE_COMMAND),
+            (register_map.mute, 1, PNS_MUTE_COMMAND),
+            (register_map.stop_pulse_input, 1, PNS_STOP_PULSE_INPUT_COMMAND),
+            (register_map.clear, 1, PNS_CLEAR_COMMAND),
+        )
+
+    def start(self) -> threading.Thread:
+        """
+        Serve in a background thread
+
+        Returns
+        -------
+        thread: threading.Thread
+            thread running the server
+        """
+        thread = threading.Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+        return thread
+
+    def handle_pdu(self, pdu: bytes) -> bytes:
+        """
+        Process one request
+
+        Parameters
+        ----------
+        pdu: bytes
+            Function code and request data
+
+        Returns
+        -------
+        response: bytes
+            Function code and response data
+        """
+        function = pdu[0]
+        if function == MODBUS_READ_INPUT_REGISTERS:
+            address, count = struct.unpack('>HH', pdu[1:5])
+            detail = self.simulator.handle(pns_get_detail_data_encode())
+            detail = detail + bytes(MODBUS_DETAIL_STATUS_SIZE - len(detail))
+            first = address - self.register_map.detail_status
+            if first < 0 or first + count > MODBUS_DETAIL_STATUS_SIZE:
+                return bytes([function | 0x80, 0x02])
+            values = detail[first:first + count]
+            return bytes([function, count * 2]) + struct.pack('>%dH' % count, *values)
+
+        if function == MODBUS_WRITE_SINGLE_REGISTER:
+            address, value = struct.unpack('>HH', pdu[1:5])
+            values = [value]
+        elif function == MODBUS_WRITE_MULTIPLE_REGISTERS:
+            address, count = struct.unpack('>HH', pdu[1:5])
+            values = list(struct.unpack('>%dH' % count, pdu[6:6 + count * 2]))
+        else:
+            return bytes([function | 0x80, 0x01])
+
+        for first, size, command in self._write_blocks:
+            if address == first and len(values) == size:
+                data = b'' if command == PNS_CLEAR_COMMAND else bytes(v & 0xFF for v in values)
+                response = self.simulator.handle(struct.pack('>2ssxH', PNS_PRODUCT_ID, command, len(data)) + data)
+                if response[0] == PNS_NAK:
+                    return bytes([function | 0x80, 0x03])
+                return pdu[0:5]
+        return bytes([function | 0x80, 0x02])
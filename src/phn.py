@@ -0,0 +1,424 @@
+import concurrent.futures
+import socket
+
+from main import (
+    PNS_RUN_CONTROL_LED_OFF,
+    PNS_RUN_CONTROL_LED_ON,
+    PNS_RUN_CONTROL_LED_BLINKING,
+    PNS_RUN_CONTROL_LED_NO_CHANGE,
+    PNS_RUN_CONTROL_BUZZER_STOP,
+    PNS_RUN_CONTROL_BUZZER_PATTERN1,
+    PNS_RUN_CONTROL_BUZZER_PATTERN2,
+    PHN_LED_UNIT1_BLINKING,
+    PHN_LED_UNIT2_BLINKING,
+    PHN_LED_UNIT3_BLINKING,
+    PHN_BUZZER_PATTERN1,
+    PHN_BUZZER_PATTERN2,
+    PHN_LED_UNIT1_LIGHTING,
+    PHN_LED_UNIT2_LIGHTING,
+    PHN_LED_UNIT3_LIGHTING,
+    PnsRunControlData,
+    phn_write_command,
+    phn_read_command,
+)
+
+PHN_LED_UNIT_BITS = (
+    (PHN_LED_UNIT1_LIGHTING, PHN_LED_UNIT1_BLINKING),
+    (PHN_LED_UNIT2_LIGHTING, PHN_LED_UNIT2_BLINKING),
+    (PHN_LED_UNIT3_LIGHTING, PHN_LED_UNIT3_BLINKING),
+)
+"""(lighting, blinking) bits of the 1st to 3rd LED unit"""
+PHN_BUZZER_BITS = PHN_BUZZER_PATTERN1 | PHN_BUZZER_PATTERN2
+"""buzzer bits"""
+
+
+def phn_run_data_from_patterns(led_patterns, buzzer_pattern: int) -> int:
+    """
+    Convert LED unit/buzzer patterns into the operation data of the PHN command
+
+    Parameters
+    ----------
+    led_patterns:
+        Pattern of the 1st to 3rd (or more) LED unit (off: 0, on: 1, blinking: 2)
+    buzzer_pattern: int
+        Buzzer pattern (stop: 0, pattern 1: 1, pattern 2: 2)
+
+    Returns
+    -------
+    run_data: int
+        Operation data of the PHN command
+    """
+    run_data = 0
+    for pattern, (lighting, blinking) in zip(led_patterns, PHN_LED_UNIT_BITS):
+        if pattern == PNS_RUN_CONTROL_LED_ON:
+            run_data |= lighting
+        elif pattern == PNS_RUN_CONTROL_LED_BLINKING:
+            run_data |= lighting | blinking
+    if buzzer_pattern == PNS_RUN_CONTROL_BUZZER_PATTERN1:
+        run_data |= PHN_BUZZER_PATTERN1
+    elif buzzer_pattern == PNS_RUN_CONTROL_BUZZER_PATTERN2:
+        run_data |= PHN_BUZZER_PATTERN2
+    return run_data
+
+
+def run_control_data_from_phn(run_data: int) -> PnsRunControlData:
+    """
+    Convert the operation data of the PHN command into operation control data
+
+    The 4th and 5th LED unit are left unchanged
+
+    Parameters
+    ----------
+    run_data: int
+        Operation data of the PHN command
+
+    Returns
+    -------
+    run_control_data: PnsRunControlData
+        Operation control data
+    """
+    patterns = []
+    for lighting, blinking in PHN_LED_UNIT_BITS:
+        if run_data & blinking:
+            patterns.append(PNS_RUN_CONTROL_LED_BLINKING)
+        elif run_data & lighting:
+            patterns.append(PNS_RUN_CONTROL_LED_ON)
+        else:
+            patterns.append(PNS_RUN_CONTROL_LED_OFF)
+    if run_data & PHN_BUZZER_PATTERN2:
+        buzzer_pattern = PNS_RUN_CONTROL_BUZZER_PATTERN2
+    elif run_data & PHN_BUZZER_PATTERN1:
+        buzzer_pattern = PNS_RUN_CONTROL_BUZZER_PATTERN1
+    else:
+        buzzer_pattern = PNS_RUN_CONTROL_BUZZER_STOP
+    return PnsRunControlData(*patterns, PNS_RUN_CONTROL_LED_NO_CHANGE, PNS_RUN_CONTROL_LED_NO_CHANGE, buzzer_pattern)
+
+
+class PhnState:
+    """immutable operation data of the PHN command"""
+
+    __slots__ = ('_run_data',)
+
+    def __init__(self, run_data: int = 0):
+        """
+        immutable operation data of the PHN command
+
+        Parameters
+        ----------
+        run_data: int
+            Operation data of the PHN command (PHN_LED_UNIT*_LIGHTING, PHN_LED_UNIT*_BLINKING, PHN_BUZZER_PATTERN*)
+        """
+        if not 0 <= run_data <= 0xFF:
+            raise ValueError('operation data out of range')
+        object.__setattr__(self, '_run_data', run_data)
+
+    @classmethod
+    def from_patterns(cls, led_patterns, buzzer_pattern: int) -> 'PhnState':
+        """
+        Create the state from LED unit/buzzer patterns
+
+        Parameters
+        ----------
+        led_patterns:
+            Pattern of the 1st to 3rd LED unit (off: 0, on: 1, blinking: 2)
+        buzzer_pattern: int
+            Buzzer pattern (stop: 0, pattern 1: 1, pattern 2: 2)
+
+        Returns
+        -------
+        state: PhnState
+            state
+        """
+        return cls(phn_run_data_from_patterns(led_patterns, buzzer_pattern))
+
+    def __setattr__(self, name, value):
+        raise AttributeError('PhnState is immutable')
+
+    @property
+    def run_data(self) -> int:
+        """operation data of the PHN command"""
+        return self._run_data
+
+    @property
+    def led_patterns(self) -> tuple:
+        """pattern of the 1st to 3rd LED unit (off: 0, on: 1, blinking: 2)"""
+        return tuple(PNS_RUN_CONTROL_LED_BLINKING if self._run_data & blinking
+                     else PNS_RUN_CONTROL_LED_ON if self._run_data & lighting
+                     else PNS_RUN_CONTROL_LED_OFF
+                     for lighting, blinking in PHN_LED_UNIT_BITS)
+
+    @property
+    def buzzer_pattern(self) -> int:
+        """buzzer pattern (stop: 0, pattern 1: 1, pattern 2: 2)"""
+        if self._run_data & PHN_BUZZER_PATTERN2:
+            return PNS_RUN_CONTROL_BUZZER_PATTERN2
+        if self._run_data & PHN_BUZZER_PATTERN1:
+            return PNS_RUN_CONTROL_BUZZER_PATTERN1
+        return PNS_RUN_CONTROL_BUZZER_STOP
+
+    def is_set(self, bits: int) -> bool:
+        """
+        Check bits
+
+        Parameters
+        ----------
+        bits: int
+            Bits to check
+
+        Returns
+        -------
+        set: bool
+            True if all the bits are set
+        """
+        return self._run_data & bits == bits
+
+    def set(self, bits: int) -> 'PhnState':
+        """
+        Set bits
+
+        Parameters
+        ----------
+        bits: int
+            Bits to set
+
+        Returns
+        -------
+        state: PhnState
+            new state
+        """
+        return PhnState(self._run_data | bits)
+
+    def clear(self, bits: int) -> 'PhnState':
+        """
+        Clear bits
+
+        Parameters
+        ----------
+        bits: int
+            Bits to clear
+
+        Returns
+        -------
+        state: PhnState
+            new state
+        """
+        return PhnState(self._run_data & ~bits & 0xFF)
+
+    def merge(self, other: 'PhnState', mask: int = 0xFF) -> 'PhnState':
+        """
+        Take bits from another state
+
+        Parameters
+        ----------
+        other: PhnState
+            State giving the bits
+        mask: int
+            Bits taken from other, the other bits are kept
+
+        Returns
+        -------
+        state: PhnState
+            new state
+        """
+        return PhnState((self._run_data & ~mask & 0xFF) | (other.run_data & mask))
+
+    def with_led(self, unit: int, pattern: int) -> 'PhnState':
+        """
+        Change the pattern of an LED unit
+
+        Parameters
+        ----------
+        unit: int
+            LED unit (1 to 3)
+        pattern: int
+            Pattern (off: 0, on: 1, blinking: 2)
+
+        Returns
+        -------
+        state: PhnState
+            new state
+        """
+        lighting, blinking = PHN_LED_UNIT_BITS[unit - 1]
+        if pattern == PNS_RUN_CONTROL_LED_ON:
+            bits = lighting
+        elif pattern == PNS_RUN_CONTROL_LED_BLINKING:
+            bits = lighting | blinking
+        else:
+            bits = 0
+        return self.merge(PhnState(bits), lighting | blinking)
+
+    def with_buzzer(self, pattern: int) -> 'PhnState':
+        """
+        Change the buzzer pattern
+
+        Parameters
+        ----------
+        pattern: int
+            Buzzer pattern (stop: 0, pattern 1: 1, pattern 2: 2)
+
+        Returns
+        -------
+        state: PhnState
+            new state
+        """
+        return self.merge(PhnState(phn_run_data_from_patterns((), pattern)), PHN_BUZZER_BITS)
+
+    def __int__(self) -> int:
+        return self._run_data
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, PhnState):
+            return NotImplemented
+        return self._run_data == other._run_data
+
+    def __hash__(self) -> int:
+        return hash(self._run_data)
+
+    def __repr__(self) -> str:
+        return 'PhnState(0x%02X)' % self._run_data
+
+
+def phn_read_modify_write_command(set_bits: int = 0, clear_bits: int = 0, sock: socket.socket = None) -> int:
+    """
+    Read the PHN state and write it back with bits set and cleared, on the same connection
+
+    Repeating it gives the same state, so it can be retried like a write
+
+    Parameters
+    ----------
+    set_bits: int
+        Bits to set
+    clear_bits: int
+        Bits to clear
+    sock: socket.socket
+        Connected socket of the target LA-POE, the socket opened by socket_open if omitted
+
+    Returns
+    -------
+    run_data: int
+        operation data written
+    """
+    state = PhnState(phn_read_command(sock=sock)).clear(clear_bits).set(set_bits)
+    phn_write_command(state.run_data, sock=sock)
+    return state.run_data
+
+
+def phn_update(pool, device: str, set_bits: int = 0, clear_bits: int = 0) -> PhnState:
+    """
+    Read-modify-write the PHN state of a device with one R and one W
+
+    Both are sent by one ConnectionPool.run, so no other command of the pool interleaves
+    and the retry policy and circuit breaker of the pool apply
+
+    Parameters
+    ----------
+    pool: ConnectionPool
+        Connections to the devices
+    device: str
+        Device id
+    set_bits: int
+        Bits to set
+    clear_bits: int
+        Bits to clear
+
+    Returns
+    -------
+    state: PhnState
+        state written
+    """
+    return PhnState(pool.run(device, phn_read_modify_write_command, set_bits, clear_bits))
+
+
+def _phn_batch(function, items, executor, max_workers: int) -> dict:
+    own_executor = executor is None
+    if own_executor:
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers)
+    try:
+        futures = {device: executor.submit(function, device, *args) for device, args in items}
+        results = {}
+        for device, future in futures.items():
+            try:
+                results[device] = future.result()
+            except Exception as e:
+                results[device] = e
+        return results
+    finally:
+        if own_executor:
+            executor.shutdown()
+
+
+def phn_write_all(pool, states: dict, executor: concurrent.futures.Executor = None, max_workers: int = 16) -> dict:
+    """
+    Write the PHN state of many devices concurrently
+
+    Parameters
+    ----------
+    pool: ConnectionPool
+        Connections to the devices
+    states: dict
+        PhnState (or operation data) of each device id
+    executor: concurrent.futures.Executor
+        Executor sending the commands, a thread pool of max_workers threads if omitted
+    max_workers: int
+        Number of threads of the thread pool
+
+    Returns
+    -------
+    results: dict
+        None or the raised exception of each device id
+    """
+    return _phn_batch(lambda device, run_data: pool.run(device, phn_write_command, run_data),
+                      ((device, (int(state),)) for device, state in states.items()), executor, max_workers)
+
+
+def phn_read_all(pool, devices, executor: concurrent.futures.Executor = None, max_workers: int = 16) -> dict:
+    """
+    Read the PHN state of many devices concurrently
+
+    Parameters
+    ----------
+    pool: ConnectionPool
+        Connections to the devices
+    devices:
+        Device ids
+    executor: concurrent.futures.Executor
+        Executor sending the commands, a thread pool of max_workers threads if omitted
+    max_workers: int
+        Number of threads of the thread pool
+
+    Returns
+    -------
+    results: dict
+        PhnState or the raised exception of each device id
+    """
+    return _phn_batch(lambda device: PhnState(pool.run(device, phn_read_command)),
+                      ((device, ()) for device in devices), executor, max_workers)
+
+
+def phn_update_all(pool, devices, set_bits: int = 0, clear_bits: int = 0,
+                   executor: concurrent.futures.Executor = None, max_workers: int = 16) -> dict:
+    """
+    Read-modify-write the PHN state of many devices concurrently (phn_update)
+
+    Parameters
+    ----------
+    pool: ConnectionPool
+        Connections to the devices
+    devices:
+        Device ids
+    set_bits: int
+        Bits to set
+    clear_bits: int
+        Bits to clear
+    executor: concurrent.futures.Executor
+        Executor sending the commands, a thread pool of max_workers threads if omitted
+    max_workers: int
+        Number of threads of the thread pool
+
+    Returns
+    -------
+    results: dict
+        PhnState written or the raised exception of each device id
+    """
+    return _phn_batch(lambda device: phn_update(pool, device, set_bits, clear_bits),
+                      ((device, ()) for device in devices), executor, max_workers)
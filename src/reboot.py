@@ -0,0 +1,236 @@
+import concurrent.futures
+import math
+import socket
+import threading
+import time
+
+from main import (
+    LaPoeConnectionError,
+    pns_reboot_command,
+    pns_get_detail_data_command,
+    phn_read_command,
+)
+from snapshot import restore_command
+
+
+class RebootResult:
+    """outcome of the reboot of a device"""
+
+    __slots__ = ('_device', '_error', '_downtime', '_restored')
+
+    def __init__(self, device: str, error, downtime: float, restored: bool):
+        """
+        outcome of the reboot of a device
+
+        Parameters
+        ----------
+        device: str
+            Device id
+        error: Exception
+            Failure, None if the device came back
+        downtime: float
+            Seconds from the reboot command to the first answer, None if it did not come back
+        restored: bool
+            True if the pre-reboot state was restored
+        """
+        self._device = device
+        self._error = error
+        self._downtime = downtime
+        self._restored = restored
+
+    @property
+    def device(self) -> str:
+        """device id"""
+        return self._device
+
+    @property
+    def error(self):
+        """failure, None if the device came back"""
+        return self._error
+
+    @property
+    def downtime(self) -> float:
+        """seconds from the reboot command to the first answer"""
+        return self._downtime
+
+    @property
+    def restored(self) -> bool:
+        """True if the pre-reboot state was restored"""
+        return self._restored
+
+    def __repr__(self) -> str:
+        return 'RebootResult(%r, error=%r, downtime=%r)' % (self._device, self._error, self._downtime)
+
+
+class RollingReboot:
+    """reboots devices in rolling waves, keeping most of each zone lit"""
+
+    def __init__(self, pool, password: str, zones: dict = None, max_fraction: float = 0.25, max_concurrent: int = 16,
+                 probe_timeout: float = 0.3, probe_interval: float = 0.2, down_timeout: float = 5.0,
+                 ready_timeout: float = 120.0, restore: bool = True, color_table: dict = None):
+        """
+        reboots devices in rolling waves, keeping most of each zone lit
+
+        A device starts rebooting as soon as its zone has fewer than max_fraction of its devices dark;
+        it is dark from the reboot command until it answers phn_read_command again and its state is restored
+
+        Parameters
+        ----------
+        pool: ConnectionPool
+            Connections to the devices
+        password: str
+            Password set in the password setting of Web Configuration
+        zones: dict
+            Zone of each device id, all the devices form one zone if omitted
+        max_fraction: float
+            Maximum fraction of a zone dark at once (at least one device)
+        max_concurrent: int
+            Maximum number of devices dark at once across all zones
+        probe_timeout: float
+            Connect/receive timeout in seconds of a readiness probe
+        probe_interval: float
+            Seconds between two readiness probes
+        down_timeout: float
+            Seconds waited for the device to stop answering after the reboot command
+        ready_timeout: float
+            Seconds waited for the device to answer again
+        restore: bool
+            Restore the state read before the reboot (smart mode group or detailed operation control)
+        color_table: dict
+            RGB per color code used to match the reported RGB, NOMINAL_COLOR_RGB if omitted
+        """
+        self._pool = pool
+        self._password = password
+        self._zones = zones if zones is not None else {}
+        self._max_fraction = max_fraction
+        self._max_concurrent = max_concurrent
+        self._probe_timeout = probe_timeout
+        self._probe_interval = probe_interval
+        self._down_timeout = down_timeout
+        self._ready_timeout = ready_timeout
+        self._restore = restore
+        self._color_table = color_table
+
+    def probe(self, device: str) -> bool:
+        """
+        Check whether a device answers, on a new connection with a short timeout
+
+        Parameters
+        ----------
+        device: str
+            Device id
+
+        Returns
+        -------
+        ready: bool
+            True if the device answered phn_read_command
+        """
+        try:
+            with socket.create_connection(self._pool.address(device), self._probe_timeout) as sock:
+                phn_read_command(sock=sock)
+        except (OSError, ValueError):
+            return False
+        return True
+
+    def reboot(self, device: str) -> RebootResult:
+        """
+        Reboot a device, wait for it to answer and restore its state
+
+        Parameters
+        ----------
+        device: str
+            Device id
+
+        Returns
+        -------
+        result: RebootResult
+            outcome
+        """
+        try:
+            state = self._pool.run(device, pns_get_detail_data_command) if self._restore else None
+            started = time.monotonic()
+            try:
+                self._pool.run(device, pns_reboot_command, self._password)
+            except LaPoeConnectionError:
+                # the device may drop the connection before answering
+                pass
+            self._pool.reset(device)
+        except Exception as e:
+            return RebootResult(device, e, None, False)
+
+        deadline = started + self._down_timeout
+        while time.monotonic() < deadline and self.probe(device):
+            time.sleep(self._probe_interval)
+        deadline = started + self._ready_timeout
+        while not self.probe(device):
+            if time.monotonic() >= deadline:
+                return RebootResult(device, TimeoutError('no answer after reboot'), None, False)
+            time.sleep(self._probe_interval)
+        downtime = time.monotonic() - started
+
+        if state is None:
+            return RebootResult(device, None, downtime, False)
+        try:
+            command, args = restore_command(state, self._color_table)
+            self._pool.run(device, command, *args)
+        except Exception as e:
+            return RebootResult(device, e, downtime, False)
+        return RebootResult(device, None, downtime, True)
+
+    def run(self, devices=None, progress=None) -> dict:
+        """
+        Reboot devices in rolling waves
+
+        Parameters
+        ----------
+        devices:
+            Device ids, every device of the pool if omitted
+        progress: callable
+            Called with (RebootResult, number done, total) as each device completes
+
+        Returns
+        -------
+        results: dict
+            RebootResult of each device id
+        """
+        devices = list(self._pool.devices if devices is None else devices)
+        # a zone is sized by all its devices, rebooted or not
+        sizes = {}
+        for zone in self._zones.values():
+            sizes[zone] = sizes.get(zone, 0) + 1
+        for device in devices:
+            if device not in self._zones:
+                sizes[None] = sizes.get(None, 0) + 1
+        limits = {zone: max(1, math.floor(size * self._max_fraction)) for zone, size in sizes.items()}
+        dark = dict.fromkeys(sizes, 0)
+        condition = threading.Condition()
+        results = {}
+
+        def reboot(device: str, zone):
+            try:
+                result = self.reboot(device)
+            except Exception as e:
+                result = RebootResult(device, e, None, False)
+            with condition:
+                dark[zone] -= 1
+                results[device] = result
+                done = len(results)
+                condition.notify_all()
+            if progress is not None:
+                progress(result, done, len(devices))
+
+        waiting = list(devices)
+        with concurrent.futures.ThreadPoolExecutor(self._max_concurrent) as executor:
+            with condition:
+                while waiting:
+                    running = sum(dark.values())
+                    for device in list(waiting):
+                        zone = self._zones.get(device)
+                        if running < self._max_concurrent and dark[zone] < limits[zone]:
+                            dark[zone] += 1
+                            running += 1
+                            waiting.remove(device)
+                            executor.submit(reboot, device, zone)
+                    if waiting:
+                        condition.wait()
+        return results
@@ -0,0 +1,309 @@
+import concurrent.futures
+import heapq
+import itertools
+import threading
+import time
+
+from colors import ColorLookupTable
+from fleet import TokenBucket
+from main import (
+    PNS_LED_MODE,
+    PNS_SMART_MODE,
+    PNS_RUN_CONTROL_LED_NO_CHANGE,
+    PnsRunControlData,
+    PnsDetailRunControlData,
+    pns_smart_mode_command,
+    pns_run_control_command,
+    pns_detail_run_control_command,
+    pns_get_data_command,
+    pns_get_detail_data_command,
+)
+from mirror import detail_run_control_data_from_status
+
+
+def _run_control_converged(desired: PnsRunControlData, status) -> bool:
+    if status.mode != PNS_LED_MODE:
+        return False
+    led = status.led_mode_data
+    actual = (led.led1_pattern, led.led2_pattern, led.led3_pattern, led.led4_pattern, led.led5_pattern)
+    for want, have in zip(desired.get_bytes()[0:5], actual):
+        if want != PNS_RUN_CONTROL_LED_NO_CHANGE and want != have:
+            return False
+    return True
+
+
+def _detail_run_control_converged(desired: PnsDetailRunControlData, status, color_table) -> bool:
+    if status.mode != PNS_LED_MODE:
+        return False
+    want = desired.get_bytes()
+    have = detail_run_control_data_from_status(status, color_table).get_bytes()
+    if want[0:5] != have[0:5]:
+        return False
+    # the blinking action cannot be seen with every unit off
+    return want[0:5] == bytes(5) or want[5] == have[5]
+
+
+class Reconciler:
+    """converges each device to a desired state and corrects drift"""
+
+    def __init__(self, pool, interval: float = 5.0, rate: float = None, max_workers: int = 16,
+                 color_table: dict = None):
+        """
+        converges each device to a desired state and corrects drift
+
+        Every pass reads the status of the devices with a desired state (G, or E for detailed operation control
+        data) and sends a corrective command only to the devices that diverged. The buzzer is not compared,
+        so a buzzer silenced on the device is not sounded again.
+
+        With n diverged devices, a reachable device converges within interval + n / rate seconds.
+        A correction waiting for the rate limit does not hold a worker: it is sent from a timer
+        when a token is available, in the order the devices diverged
+
+        Parameters
+        ----------
+        pool: ConnectionPool
+            Connections to the devices
+        interval: float
+            Seconds between two passes
+        rate: float
+            Maximum number of corrective commands per second, unlimited if omitted
+        max_workers: int
+            Maximum number of devices read or corrected concurrently
+        color_table: dict
+            RGB per color code used to match the reported RGB, NOMINAL_COLOR_RGB if omitted
+        """
+        self._pool = pool
+        self._interval = interval
+        self._bucket = TokenBucket(rate, max(rate, 1.0)) if rate else None
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers)
+        self._color_table = ColorLookupTable(color_table)
+        self._lock = threading.Lock()
+        self._desired = {}
+        self._diverged = {}
+        self._convergence = {}
+        self._errors = {}
+        # desired state of each device whose correction waits for a token
+        self._waiting = {}
+        self._timer_condition = threading.Condition()
+        self._timers = []
+        self._timer_sequence = itertools.count()
+        self._timer_thread = None
+        self._closed = False
+        self._stop = threading.Event()
+        self._thread = None
+
+    def set_desired(self, device: str, desired):
+        """
+        Set the desired state of a device
+
+        Parameters
+        ----------
+        device: str
+            Device id
+        desired:
+            PnsRunControlData, PnsDetailRunControlData or smart mode group number (int)
+        """
+        if not isinstance(desired, (PnsRunControlData, PnsDetailRunControlData, int)):
+            raise TypeError('unsupported desired state')
+        with self._lock:
+            self._desired[device] = desired
+            self._diverged.setdefault(device, time.monotonic())
+            # a correction waiting for the rate limit is dropped, the next pass compares the new state
+            self._waiting.pop(device, None)
+
+    def clear_desired(self, device: str):
+        """
+        Stop reconciling a device
+
+        Parameters
+        ----------
+        device: str
+            Device id
+        """
+        with self._lock:
+            self._desired.pop(device, None)
+            self._diverged.pop(device, None)
+            self._errors.pop(device, None)
+            self._waiting.pop(device, None)
+
+    def desired(self, device: str):
+        """
+        Get the desired state of a device
+
+        Parameters
+        ----------
+        device: str
+            Device id
+
+        Returns
+        -------
+        desired:
+            desired state, None if the device is not reconciled
+        """
+        with self._lock:
+            return self._desired.get(device)
+
+    @property
+    def diverged(self) -> dict:
+        """seconds since each device not in its desired state was first seen diverged"""
+        now = time.monotonic()
+        with self._lock:
+            return {device: now - since for device, since in self._diverged.items()}
+
+    @property
+    def convergence(self) -> dict:
+        """seconds the last divergence of each device took to be corrected"""
+        with self._lock:
+            return dict(self._convergence)
+
+    @property
+    def errors(self) -> dict:
+        """last exception of each device whose read or correction failed"""
+        with self._lock:
+            return dict(self._errors)
+
+    @property
+    def waiting(self) -> list:
+        """device ids whose correction waits for the rate limit"""
+        with self._lock:
+            return list(self._waiting)
+
+    def reconcile_once(self) -> list:
+        """
+        Compare every device with its desired state and correct the diverged ones
+
+        Devices whose correction already waits for the rate limit are skipped
+
+        Returns
+        -------
+        corrected: list
+            device ids a corrective command was sent to, not those left waiting for the rate limit
+        """
+        with self._lock:
+            desired = {device: state for device, state in self._desired.items() if device not in self._waiting}
+        futures = {device: self._executor.submit(self._reconcile, device, state) for device, state in desired.items()}
+        corrected = []
+        for device, future in futures.items():
+            try:
+                if future.result():
+                    corrected.append(device)
+            except Exception as e:
+                with self._lock:
+                    self._errors[device] = e
+        return corrected
+
+    def _converged(self, device: str, desired) -> bool:
+        if isinstance(desired, PnsDetailRunControlData):
+            status = self._pool.run(device, pns_get_detail_data_command)
+            return _detail_run_control_converged(desired, status, self._color_table)
+        status = self._pool.run(device, pns_get_data_command)
+        if isinstance(desired, PnsRunControlData):
+            return _run_control_converged(desired, status)
+        return status.mode == PNS_SMART_MODE and status.smart_mode_data.group_no == desired
+
+    def _reconcile(self, device: str, desired) -> bool:
+        if self._converged(device, desired):
+            with self._lock:
+                since = self._diverged.pop(device, None)
+                if since is not None and self._desired.get(device) is desired:
+                    self._convergence[device] = time.monotonic() - since
+                self._errors.pop(device, None)
+            return False
+
+        with self._lock:
+            self._diverged.setdefault(device, time.monotonic())
+        if self._bucket is not None:
+            delay = self._bucket.try_acquire()
+            if delay:
+                # release the worker to the other devices until a token is available
+                with self._lock:
+                    self._waiting[device] = desired
+                self._defer(delay, next(self._timer_sequence), device, desired)
+                return False
+        self._correct(device, desired)
+        return True
+
+    def _correct(self, device: str, desired):
+        if isinstance(desired, PnsDetailRunControlData):
+            self._pool.run(device, pns_detail_run_control_command, desired)
+        elif isinstance(desired, PnsRunControlData):
+            self._pool.run(device, pns_run_control_command, desired)
+        else:
+            self._pool.run(device, pns_smart_mode_command, desired)
+        with self._lock:
+            self._errors.pop(device, None)
+
+    def _defer(self, delay: float, sequence: int, device: str, desired):
+        with self._timer_condition:
+            if self._closed:
+                return
+            heapq.heappush(self._timers, (time.monotonic() + delay, sequence, device, desired))
+            if self._timer_thread is None:
+                self._timer_thread = threading.Thread(target=self._run_timers, daemon=True)
+                self._timer_thread.start()
+            self._timer_condition.notify()
+
+    def _run_timers(self):
+        while True:
+            with self._timer_condition:
+                while not self._closed:
+                    delay = self._timers[0][0] - time.monotonic() if self._timers else None
+                    if delay is not None and delay <= 0:
+                        break
+                    self._timer_condition.wait(delay)
+                if self._closed:
+                    return
+                when, sequence, device, desired = heapq.heappop(self._timers)
+                delay = self._bucket.try_acquire()
+                if delay:
+                    # keep the place of the device among the waiting ones
+                    heapq.heappush(self._timers, (time.monotonic() + delay, sequence, device, desired))
+                    continue
+            self._executor.submit(self._send_waiting, device, desired)
+
+    def _send_waiting(self, device: str, desired):
+        with self._lock:
+            if self._waiting.get(device) is not desired:
+                return
+            del self._waiting[device]
+            # a new desired state is read again by the next pass
+            if self._desired.get(device) is not desired:
+                return
+        try:
+            self._correct(device, desired)
+        except Exception as e:
+            with self._lock:
+                self._errors[device] = e
+
+    def start(self):
+        """
+        Start reconciling in a background thread.
+        """
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stop reconciling and wait for the pending commands, the corrections waiting for the rate limit are dropped.
+        """
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        with self._timer_condition:
+            self._closed = True
+            self._timers.clear()
+            self._timer_condition.notify()
+            timer_thread = self._timer_thread
+        if timer_thread is not None:
+            timer_thread.join()
+        with self._lock:
+            self._waiting.clear()
+        self._executor.shutdown()
+
+    def _run(self):
+        while not self._stop.is_set():
+            started = time.monotonic()
+            self.reconcile_once()
+            self._stop.wait(max(self._interval - (time.monotonic() - started), 0))
@@ -0,0 +1,304 @@
+import mmap
+import os
+import struct
+import threading
+import time
+
+from main import (
+    PNS_PRODUCT_ID,
+    PNS_GET_DATA_COMMAND,
+    PNS_GET_DETAIL_DATA_COMMAND,
+    LaPoeError,
+    pns_get_data_decode,
+    pns_get_detail_data_decode,
+)
+
+RECORD_FILE_MAGIC = b'LAPR\x01'
+"""header of a capture file (identifier and format version)"""
+
+# direction of a recorded frame
+RECORD_DIRECTION_SEND = 0x00
+"""frame sent to the device"""
+RECORD_DIRECTION_RECV = 0x01
+"""frame received from the device"""
+
+# record layout: body size, timestamp, direction, device id size (device id and frame follow)
+_RECORD_HEADER = struct.Struct('>IdBB')
+
+
+class RecordedFrame:
+    """frame captured by the recorder"""
+
+    __slots__ = ('_timestamp', '_direction', '_device', '_frame')
+
+    def __init__(self, timestamp: float, direction: int, device: str, frame: bytes):
+        """
+        frame captured by the recorder
+
+        Parameters
+        ----------
+        timestamp: float
+            Capture time (seconds since the epoch)
+        direction: int
+            Direction of the frame (send: 0, receive: 1)
+        device: str
+            Device id
+        frame: bytes
+            Frame data
+        """
+        self._timestamp = timestamp
+        self._direction = direction
+        self._device = device
+        self._frame = frame
+
+    @property
+    def timestamp(self) -> float:
+        """capture time"""
+        return self._timestamp
+
+    @property
+    def direction(self) -> int:
+        """direction of the frame"""
+        return self._direction
+
+    @property
+    def device(self) -> str:
+        """device id"""
+        return self._device
+
+    @property
+    def frame(self) -> bytes:
+        """frame data"""
+        return self._frame
+
+
+class Recorder:
+    """append-only binary log of PNS/PHN frames"""
+
+    def __init__(self, path: str):
+        """
+        append-only binary log of PNS/PHN frames
+
+        Parameters
+        ----------
+        path: str
+            Capture file, created if it does not exist
+        """
+        self._lock = threading.Lock()
+        self._file = open(path, 'ab')
+        if self._file.tell() == 0:
+            self._file.write(RECORD_FILE_MAGIC)
+
+    def record(self, direction: int, device: str, frame: bytes, timestamp: float = None):
+        """
+        Append a frame to the log
+
+        Parameters
+        ----------
+        direction: int
+            Direction of the frame (send: 0, receive: 1)
+        device: str
+            Device id
+        frame: bytes
+            Frame data
+        timestamp: float
+            Capture time, the current time if omitted
+        """
+        if timestamp is None:
+            timestamp = time.time()
+        device_id = device.encode('utf-8')
+        header = _RECORD_HEADER.pack(
+            _RECORD_HEADER.size - 4 + len(device_id) + len(frame),     # body size
+            timestamp,                                                  # capture time
+            direction,                                                  # direction
+            len(device_id),                                             # device id size
+        )
+        with self._lock:
+            self._file.write(header + device_id + frame)
+
+    def flush(self):
+        """
+        Write buffered records to the file.
+        """
+        with self._lock:
+            self._file.flush()
+
+    def close(self):
+        """
+        Close the log.
+        """
+        with self._lock:
+            self._file.close()
+
+    def __enter__(self) -> 'Recorder':
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class Replayer:
+    """reader of a capture file written by the recorder"""
+
+    def __init__(self, path: str):
+        """
+        reader of a capture file written by the recorder
+
+        The file is memory-mapped, so records are scanned without loading the whole capture
+
+        Parameters
+        ----------
+        path: str
+            Capture file
+        """
+        self._file = open(path, 'rb')
+        if os.fstat(self._file.fileno()).st_size <= len(RECORD_FILE_MAGIC):
+            self._map = None
+        else:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            if self._map[0:len(RECORD_FILE_MAGIC)] != RECORD_FILE_MAGIC:
+                self.close()
+                raise ValueError('not a capture file')
+
+    def records(self):
+        """
+        Iterate over the recorded frames
+
+        A record truncated by an interrupted capture ends the iteration
+
+        Yields
+        ------
+        record: RecordedFrame
+            recorded frame in capture order
+        """
+        if self._map is None:
+            return
+        data = self._map
+        offset = len(RECORD_FILE_MAGIC)
+        end = len(data)
+        while offset + _RECORD_HEADER.size <= end:
+            size, timestamp, direction, device_size = _RECORD_HEADER.unpack_from(data, offset)
+            next_offset = offset + 4 + size
+            if next_offset > end:
+                break
+            device_start = offset + _RECORD_HEADER.size
+            frame_start = device_start + device_size
+            yield RecordedFrame(
+                timestamp,
+                direction,
+                data[device_start:frame_start].decode('utf-8'),
+                data[frame_start:next_offset],
+            )
+            offset = next_offset
+
+    def exchanges(self):
+        """
+        Iterate over command/response pairs
+
+        Yields
+        ------
+        exchange: tuple
+            (sent frame, received frame) of the same device, the received frame is None when missing
+        """
+        pending = {}
+        for record in self.records():
+            if record.direction == RECORD_DIRECTION_SEND:
+                if record.device in pending:
+                    yield pending[record.device], None
+                pending[record.device] = record
+            elif record.device in pending:
+                yield pending.pop(record.device), record
+        for record in pending.values():
+            yield record, None
+
+    def replay(self, handler, speed: float = None):
+        """
+        Feed the recorded frames to a handler
+
+        Parameters
+        ----------
+        handler: callable
+            Called with each RecordedFrame
+        speed: float
+            Playback speed relative to the capture (2.0: twice as fast), as fast as possible if omitted
+        """
+        start_clock = None
+        start_timestamp = None
+        for record in self.records():
+            if speed is not None:
+                if start_clock is None:
+                    start_clock = time.monotonic()
+                    start_timestamp = record.timestamp
+                delay = (record.timestamp - start_timestamp) / speed - (time.monotonic() - start_clock)
+                if delay > 0:
+                    time.sleep(delay)
+            handler(record)
+
+    def replay_into(self, simulator, speed: float = None):
+        """
+        Send the recorded commands to a simulator
+
+        Parameters
+        ----------
+        simulator: LaPoeSimulator
+            Simulated device (anything with handle(frame) -> bytes)
+        speed: float
+            Playback speed relative to the capture, as fast as possible if omitted
+
+        Returns
+        -------
+        mismatches: list
+            (sent frame, recorded response, simulated response) for every response that differs
+        """
+        mismatches = []
+        responses = {}
+
+        def handle(record: RecordedFrame):
+            if record.direction == RECORD_DIRECTION_SEND:
+                responses[record.device] = (record, simulator.handle(record.frame))
+            elif record.device in responses:
+                sent, simulated = responses.pop(record.device)
+                if simulated != record.frame:
+                    mismatches.append((sent, record, simulated))
+
+        self.replay(handle, speed)
+        return mismatches
+
+    def decode(self):
+        """
+        Decode the recorded responses of status acquisition commands
+
+        NAK responses and truncated or malformed frames are skipped
+
+        Yields
+        ------
+        status: tuple
+            (RecordedFrame of the response, PnsStatusData or PnsDetailStatusData)
+        """
+        decoders = {PNS_GET_DATA_COMMAND: pns_get_data_decode, PNS_GET_DETAIL_DATA_COMMAND: pns_get_detail_data_decode}
+        for sent, received in self.exchanges():
+            if received is None or sent.frame[0:2] != PNS_PRODUCT_ID:
+                continue
+            decode = decoders.get(sent.frame[2:3])
+            if decode is None:
+                continue
+            try:
+                status = decode(received.frame)
+            except LaPoeError:
+                continue
+            yield received, status
+
+    def close(self):
+        """
+        Close the capture file.
+        """
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        self._file.close()
+
+    def __enter__(self) -> 'Replayer':
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -0,0 +1,166 @@
+import random
+import time
+
+from main import (
+    LaPoeFrameError,
+    pns_smart_mode_command,
+    pns_mute_command,
+    pns_stop_pulse_input_command,
+    pns_run_control_command,
+    pns_detail_run_control_command,
+    pns_clear_command,
+    pns_reboot_command,
+    pns_get_data_command,
+    pns_get_data_frame_command,
+    pns_get_detail_data_command,
+    pns_get_detail_data_frame_command,
+    phn_write_command,
+    phn_read_command,
+)
+from phn import phn_read_modify_write_command
+
+RETRY_TRANSIENT_ERRORS = (OSError, LaPoeFrameError)
+"""errors worth retrying: timeout, connection reset/refused and short or malformed response (not NAK)"""
+
+
+class RetryPolicy:
+    """number of attempts and jittered exponential backoff of a command"""
+
+    __slots__ = ('_attempts', '_base_delay', '_max_delay', '_retry_on')
+
+    def __init__(self, attempts: int = 3, base_delay: float = 0.05, max_delay: float = 1.0,
+                 retry_on: tuple = RETRY_TRANSIENT_ERRORS):
+        """
+        number of attempts and jittered exponential backoff of a command
+
+        Parameters
+        ----------
+        attempts: int
+            Maximum number of attempts, 1 disables retries
+        base_delay: float
+            Backoff ceiling in seconds before the 2nd attempt, doubled for every further attempt
+        max_delay: float
+            Maximum backoff ceiling in seconds
+        retry_on: tuple
+            Exception types that are retried, any other error is raised at once
+        """
+        if attempts < 1:
+            raise ValueError('attempts must be at least 1')
+        self._attempts = attempts
+        self._base_delay = base_delay
+        self._max_delay = max_delay
+        self._retry_on = retry_on
+
+    @property
+    def attempts(self) -> int:
+        """maximum number of attempts"""
+        return self._attempts
+
+    def delay(self, retry: int) -> float:
+        """
+        Get the backoff before a retry
+
+        The delay is drawn uniformly between 0 and the ceiling (full jitter),
+        so devices failing together do not retry together
+
+        Parameters
+        ----------
+        retry: int
+            Number of the retry (0: first retry)
+
+        Returns
+        -------
+        delay: float
+            seconds to wait
+        """
+        return random.uniform(0.0, min(self._max_delay, self._base_delay * (2 ** retry)))
+
+    def is_retryable(self, error: BaseException) -> bool:
+        """
+        Check whether an error is retried
+
+        Parameters
+        ----------
+        error: BaseException
+            raised error
+
+        Returns
+        -------
+        retryable: bool
+            True if the command is sent again
+        """
+        return isinstance(error, self._retry_on)
+
+    def call(self, function, *args, **kwargs):
+        """
+        Call a function, retrying transient errors
+
+        Parameters
+        ----------
+        function: callable
+            Function to call (command function, ConnectionPool.run, ...)
+        args:
+            Positional arguments of the function
+        kwargs:
+            Keyword arguments of the function
+
+        Returns
+        -------
+        result:
+            return value of the function
+        """
+        retry = 0
+        while True:
+            try:
+                return function(*args, **kwargs)
+            except Exception as e:
+                if retry + 1 >= self._attempts or not self.is_retryable(e):
+                    raise
+            time.sleep(self.delay(retry))
+            retry += 1
+
+
+NO_RETRY = RetryPolicy(attempts=1)
+"""policy sending a command once"""
+
+DEFAULT_RETRY_POLICY = RetryPolicy()
+"""policy of the idempotent commands"""
+
+RETRY_POLICIES = {
+    pns_smart_mode_command: DEFAULT_RETRY_POLICY,
+    pns_mute_command: DEFAULT_RETRY_POLICY,
+    pns_stop_pulse_input_command: NO_RETRY,
+    pns_run_control_command: DEFAULT_RETRY_POLICY,
+    pns_detail_run_control_command: DEFAULT_RETRY_POLICY,
+    pns_clear_command: DEFAULT_RETRY_POLICY,
+    pns_reboot_command: NO_RETRY,
+    pns_get_data_command: DEFAULT_RETRY_POLICY,
+    pns_get_data_frame_command: DEFAULT_RETRY_POLICY,
+    pns_get_detail_data_command: DEFAULT_RETRY_POLICY,
+    pns_get_detail_data_frame_command: DEFAULT_RETRY_POLICY,
+    phn_write_command: DEFAULT_RETRY_POLICY,
+    phn_read_command: DEFAULT_RETRY_POLICY,
+    phn_read_modify_write_command: DEFAULT_RETRY_POLICY,
+}
+"""retry policy of each command function of main.py, a reboot or a STOP/trigger input is never repeated"""
+
+
+def retry_policy(command, policies: dict = None) -> RetryPolicy:
+    """
+    Get the retry policy of a command
+
+    Parameters
+    ----------
+    command: callable
+        Command function of main.py
+    policies: dict
+        Policy of each command function, RETRY_POLICIES if omitted
+
+    Returns
+    -------
+    policy: RetryPolicy
+        policy of the command, NO_RETRY for unknown commands
+    """
+    if policies is None:
+        policies = RETRY_POLICIES
+    return policies.get(command, NO_RETRY)
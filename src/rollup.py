@@ -0,0 +1,242 @@
+import threading
+
+from colors import ColorLookupTable
+from main import (
+    PNS_LED_MODE,
+    PNS_SMART_MODE,
+    PNS_RUN_CONTROL_LED_OFF,
+    PNS_RUN_CONTROL_LED_BLINKING,
+    PNS_RUN_CONTROL_BUZZER_STOP,
+    PnsDetailStatusData,
+)
+
+# rollup counters of a zone
+ROLLUP_TOWERS = 'towers'
+"""towers in the zone"""
+ROLLUP_LIT = 'lit'
+"""towers with at least one LED unit lit"""
+ROLLUP_BLINKING = 'blinking'
+"""towers with at least one LED unit blinking"""
+ROLLUP_BUZZER = 'buzzer'
+"""towers whose buzzer is sounding"""
+ROLLUP_SMART_MODE = 'smart_mode'
+"""towers in smart mode"""
+ROLLUP_INPUTS_CLOSED = 'inputs_closed'
+"""contact inputs closed over all the towers"""
+
+
+def rollup_color_key(color: int) -> str:
+    """
+    Get the counter of the towers showing a color
+
+    Parameters
+    ----------
+    color: int
+        color of the LED unit (red: 1, yellow: 2, ..., only known from PnsDetailStatusData)
+
+    Returns
+    -------
+    key: str
+        counter name
+    """
+    return 'color_%d' % color
+
+
+class ZoneRollup:
+    """counters per zone kept up to date from status changes"""
+
+    def __init__(self, zones: dict = None, color_table: dict = None):
+        """
+        counters per zone kept up to date from status changes
+
+        Each update removes the previous contribution of the device and adds the new one,
+        so its cost does not depend on the size of the fleet
+
+        Parameters
+        ----------
+        zones: dict
+            Zone of each device id, devices without zone are counted in zone None
+        color_table: dict
+            RGB per color code used to match the reported RGB, NOMINAL_COLOR_RGB if omitted
+        """
+        self._zones = dict(zones) if zones is not None else {}
+        self._color_table = ColorLookupTable(color_table)
+        self._lock = threading.Lock()
+        self._contributions = {}
+        self._totals = {}
+        self._callbacks = []
+
+    def subscribe(self, callback):
+        """
+        Register a function called with (zone, changed counters) on each change of a rollup
+
+        Parameters
+        ----------
+        callback: callable
+            Called from the thread that calls update, with the new value of each changed counter
+        """
+        with self._lock:
+            self._callbacks = self._callbacks + [callback]
+
+    def unsubscribe(self, callback):
+        """
+        Unregister a function registered with subscribe
+
+        Parameters
+        ----------
+        callback: callable
+            Registered function
+        """
+        with self._lock:
+            self._callbacks = [c for c in self._callbacks if c is not callback]
+
+    def totals(self, zone=None) -> dict:
+        """
+        Get the counters of a zone
+
+        Parameters
+        ----------
+        zone:
+            Zone
+
+        Returns
+        -------
+        totals: dict
+            value of each non-zero counter
+        """
+        with self._lock:
+            return dict(self._totals.get(zone, {}))
+
+    @property
+    def zones(self) -> dict:
+        """counters of every zone"""
+        with self._lock:
+            return {zone: dict(totals) for zone, totals in self._totals.items()}
+
+    def _contribution(self, status) -> dict:
+        contribution = {ROLLUP_TOWERS: 1}
+        closed = sum(1 for value in status.input if value)
+        if closed:
+            contribution[ROLLUP_INPUTS_CLOSED] = closed
+        if status.mode == PNS_SMART_MODE:
+            contribution[ROLLUP_SMART_MODE] = 1
+
+        if isinstance(status, PnsDetailStatusData):
+            data = status.led_mode_detail_data if status.mode == PNS_LED_MODE else status.smart_mode_detail_data
+            units = (data.led_unit1_data, data.led_unit2_data, data.led_unit3_data, data.led_unit4_data,
+                     data.led_unit5_data)
+            patterns = [unit.led_pattern for unit in units]
+            for unit in units:
+                if unit.led_pattern != PNS_RUN_CONTROL_LED_OFF:
+                    color = self._color_table.nearest(unit.red, unit.green, unit.blue)
+                    contribution[rollup_color_key(color)] = 1
+            buzzer_pattern = data.buzzer_pattern
+        elif status.mode == PNS_LED_MODE:
+            data = status.led_mode_data
+            patterns = [data.led1_pattern, data.led2_pattern, data.led3_pattern, data.led4_pattern, data.led5_pattern]
+            buzzer_pattern = data.buzzer_pattern
+        else:
+            # the get status command does not report the units in smart mode
+            patterns = []
+            buzzer_pattern = PNS_RUN_CONTROL_BUZZER_STOP
+
+        if any(pattern != PNS_RUN_CONTROL_LED_OFF for pattern in patterns):
+            contribution[ROLLUP_LIT] = 1
+        if PNS_RUN_CONTROL_LED_BLINKING in patterns:
+            contribution[ROLLUP_BLINKING] = 1
+        if buzzer_pattern != PNS_RUN_CONTROL_BUZZER_STOP:
+            contribution[ROLLUP_BUZZER] = 1
+        return contribution
+
+    def _apply(self, zone, previous: dict, current: dict) -> dict:
+        # called with the lock held
+        totals = self._totals.setdefault(zone, {})
+        changes = {}
+        for key in previous.keys() | current.keys():
+            delta = current.get(key, 0) - previous.get(key, 0)
+            if delta:
+                value = totals.get(key, 0) + delta
+                if value:
+                    totals[key] = value
+                else:
+                    del totals[key]
+                changes[key] = value
+        if not totals:
+            del self._totals[zone]
+        return changes
+
+    def _notify(self, callbacks: list, updates: list):
+        for zone, changes in updates:
+            if changes:
+                for callback in callbacks:
+                    callback(zone, changes)
+
+    def update(self, device: str, status, timestamp: float = None) -> dict:
+        """
+        Account for a new status of a device
+
+        The signature matches the on_status callback of ShardSupervisor
+
+        Parameters
+        ----------
+        device: str
+            Device id
+        status: PnsStatusData or PnsDetailStatusData
+            New status of the device
+        timestamp: float
+            Time of the status (unused)
+
+        Returns
+        -------
+        changes: dict
+            new value of each changed counter of the zone of the device
+        """
+        current = self._contribution(status)
+        with self._lock:
+            zone = self._zones.get(device)
+            previous = self._contributions.get(device, {})
+            self._contributions[device] = current
+            changes = self._apply(zone, previous, current)
+            callbacks = self._callbacks
+        self._notify(callbacks, [(zone, changes)])
+        return changes
+
+    def remove(self, device: str):
+        """
+        Stop counting a device
+
+        Parameters
+        ----------
+        device: str
+            Device id
+        """
+        with self._lock:
+            zone = self._zones.get(device)
+            previous = self._contributions.pop(device, None)
+            if previous is None:
+                return
+            changes = self._apply(zone, previous, {})
+            callbacks = self._callbacks
+        self._notify(callbacks, [(zone, changes)])
+
+    def set_zone(self, device: str, zone):
+        """
+        Move a device to another zone
+
+        Parameters
+        ----------
+        device: str
+            Device id
+        zone:
+            New zone
+        """
+        with self._lock:
+            previous_zone = self._zones.get(device)
+            self._zones[device] = zone
+            contribution = self._contributions.get(device)
+            if contribution is None or previous_zone == zone:
+                return
+            updates = [(previous_zone, self._apply(previous_zone, contribution, {})),
+                       (zone, self._apply(zone, {}, contribution))]
+            callbacks = self._callbacks
+        self._notify(callbacks, updates)
@@ -0,0 +1,323 @@
+import threading
+
+from main import PNS_LED_MODE
+
+RULE_INPUT_SMART_MODE = 0
+"""index key of smart mode conditions (inputs use 1 to 8)"""
+
+
+class InputCondition:
+    """condition on a contact input"""
+
+    __slots__ = ('_device', '_input_no', '_value')
+
+    def __init__(self, device: str, input_no: int, value: int = 1):
+        """
+        condition on a contact input
+
+        Parameters
+        ----------
+        device: str
+            Device id
+        input_no: int
+            Input number (1 to 8)
+        value: int
+            Input state that satisfies the condition (OFF: 0, ON: 1)
+        """
+        self._device = device
+        self._input_no = input_no
+        self._value = 1 if value else 0
+
+    @property
+    def key(self) -> tuple:
+        """(device id, input number) the condition depends on"""
+        return self._device, self._input_no
+
+    def evaluate(self, inputs: dict, groups: dict) -> bool:
+        """
+        Evaluate the condition
+
+        Parameters
+        ----------
+        inputs: dict
+            Bit mask of input 1 to 8 (bit0: input 1) per device id
+        groups: dict
+            Smart mode group number (0 in signal light mode) per device id
+
+        Returns
+        -------
+        satisfied: bool
+            True if the condition is satisfied
+        """
+        mask = inputs.get(self._device)
+        if mask is None:
+            return False
+        return (mask >> (self._input_no - 1)) & 1 == self._value
+
+
+class SmartModeCondition:
+    """condition on the smart mode group being executed"""
+
+    __slots__ = ('_device', '_group_no')
+
+    def __init__(self, device: str, group_no: int):
+        """
+        condition on the smart mode group being executed
+
+        Parameters
+        ----------
+        device: str
+            Device id
+        group_no: int
+            Group number (0x01 to 0x1F), 0 is satisfied while the device runs signal light mode
+        """
+        self._device = device
+        self._group_no = group_no
+
+    @property
+    def key(self) -> tuple:
+        """(device id, 0) the condition depends on"""
+        return self._device, RULE_INPUT_SMART_MODE
+
+    def evaluate(self, inputs: dict, groups: dict) -> bool:
+        """
+        Evaluate the condition
+
+        Parameters
+        ----------
+        inputs: dict
+            Bit mask of input 1 to 8 (bit0: input 1) per device id
+        groups: dict
+            Smart mode group number (0 in signal light mode) per device id
+
+        Returns
+        -------
+        satisfied: bool
+            True if the condition is satisfied
+        """
+        if self._device not in groups:
+            return False
+        return groups[self._device] == self._group_no
+
+
+class RuleAction:
+    """command sent to a tower when a rule fires"""
+
+    __slots__ = ('_device', '_command', '_args')
+
+    def __init__(self, device: str, command, *args):
+        """
+        command sent to a tower when a rule fires
+
+        Parameters
+        ----------
+        device: str
+            Device id of the target
+        command: callable
+            Command function of main.py (pns_run_control_command, pns_smart_mode_command, phn_write_command, ...)
+        args:
+            Arguments of the command other than sock
+        """
+        self._device = device
+        self._command = command
+        self._args = args
+
+    @property
+    def device(self) -> str:
+        """device id of the target"""
+        return self._device
+
+    def execute(self, pool):
+        """
+        Send the command
+
+        Parameters
+        ----------
+        pool: ConnectionPool
+            Connections of the fleet
+        """
+        pool.run(self._device, self._command, *self._args)
+
+
+class Rule:
+    """actions triggered when all conditions are satisfied"""
+
+    def __init__(self, name: str, conditions: list, actions: list, release_actions: list = ()):
+        """
+        actions triggered when all conditions are satisfied
+
+        Parameters
+        ----------
+        name: str
+            Rule name
+        conditions: list
+            InputCondition/SmartModeCondition, all must be satisfied
+        actions: list
+            RuleAction sent when the conditions become satisfied
+        release_actions: list
+            RuleAction sent when the conditions stop being satisfied
+        """
+        if not conditions:
+            raise ValueError('rule without condition')
+        self._name = name
+        self._conditions = tuple(conditions)
+        self._actions = tuple(actions)
+        self._release_actions = tuple(release_actions)
+
+    @property
+    def name(self) -> str:
+        """rule name"""
+        return self._name
+
+    @property
+    def conditions(self) -> tuple:
+        """conditions"""
+        return self._conditions
+
+    @property
+    def actions(self) -> tuple:
+        """actions sent when the conditions become satisfied"""
+        return self._actions
+
+    @property
+    def release_actions(self) -> tuple:
+        """actions sent when the conditions stop being satisfied"""
+        return self._release_actions
+
+
+class RuleEngine:
+    """evaluates rules on status changes and drives the target towers"""
+
+    def __init__(self, pool, executor=None, on_error=None):
+        """
+        evaluates rules on status changes and drives the target towers
+
+        Parameters
+        ----------
+        pool: ConnectionPool
+            Connections used to send the actions
+        executor: concurrent.futures.Executor
+            Executor sending the actions, they are sent by the caller of update if omitted
+        on_error: callable
+            Called with (rule, action, exception) when an action fails, the exception is raised by update
+            if omitted; required with an executor, whose failures could not be raised
+        """
+        if executor is not None and on_error is None:
+            raise ValueError('on_error is required with an executor')
+        self._pool = pool
+        self._executor = executor
+        self._on_error = on_error
+        self._lock = threading.Lock()
+        self._rules = {}
+        self._index = {}
+        self._active = {}
+        self._inputs = {}
+        self._groups = {}
+
+    def add_rule(self, rule: Rule):
+        """
+        Register a rule, replacing a rule of the same name
+
+        Parameters
+        ----------
+        rule: Rule
+            Rule to register
+        """
+        with self._lock:
+            self._remove(rule.name)
+            self._rules[rule.name] = rule
+            self._active[rule.name] = False
+            for key in {condition.key for condition in rule.conditions}:
+                self._index[key] = self._index.get(key, ()) + (rule,)
+
+    def remove_rule(self, name: str):
+        """
+        Unregister a rule
+
+        Parameters
+        ----------
+        name: str
+            Rule name
+        """
+        with self._lock:
+            self._remove(name)
+
+    def _remove(self, name: str):
+        rule = self._rules.pop(name, None)
+        if rule is None:
+            return
+        del self._active[name]
+        for key in {condition.key for condition in rule.conditions}:
+            rules = tuple(r for r in self._index[key] if r is not rule)
+            if rules:
+                self._index[key] = rules
+            else:
+                del self._index[key]
+
+    def update(self, device: str, status) -> list:
+        """
+        Evaluate the rules depending on a status change of a device
+
+        Parameters
+        ----------
+        device: str
+            Device id
+        status: PnsStatusData or PnsDetailStatusData
+            Decoded status of the device
+
+        Returns
+        -------
+        fired: list
+            (rule, satisfied) of each rule whose state changed
+        """
+        input_data = status.input
+        mask = 0
+        for i in range(8):
+            if input_data[i]:
+                mask |= 1 << i
+        if status.mode == PNS_LED_MODE:
+            group_no = 0
+        elif hasattr(status, 'smart_mode_data'):
+            group_no = status.smart_mode_data.group_no
+        else:
+            group_no = status.smart_mode_detail_data.smart_mode_data.group_no
+
+        fired = []
+        with self._lock:
+            previous_mask = self._inputs.get(device)
+            changed = mask ^ previous_mask if previous_mask is not None else 0xFF
+            group_changed = previous_mask is None or self._groups.get(device) != group_no
+            self._inputs[device] = mask
+            self._groups[device] = group_no
+
+            # collect only the rules depending on what changed
+            candidates = {}
+            for i in range(8):
+                if changed & (1 << i):
+                    for rule in self._index.get((device, i + 1), ()):
+                        candidates[rule.name] = rule
+            if group_changed:
+                for rule in self._index.get((device, RULE_INPUT_SMART_MODE), ()):
+                    candidates[rule.name] = rule
+
+            for rule in candidates.values():
+                satisfied = all(c.evaluate(self._inputs, self._groups) for c in rule.conditions)
+                if satisfied != self._active[rule.name]:
+                    self._active[rule.name] = satisfied
+                    fired.append((rule, satisfied))
+
+        for rule, satisfied in fired:
+            for action in rule.actions if satisfied else rule.release_actions:
+                if self._executor is None:
+                    self._execute(rule, action)
+                else:
+                    self._executor.submit(self._execute, rule, action)
+        return fired
+
+    def _execute(self, rule: Rule, action: RuleAction):
+        try:
+            action.execute(self._pool)
+        except Exception as e:
+            if self._on_error is None:
+                raise
+            self._on_error(rule, action, e)
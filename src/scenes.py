@@ -0,0 +1,281 @@
+import threading
+
+from colors import ColorLookupTable
+from main import (
+    PNS_SMART_MODE,
+    PNS_RUN_CONTROL_LED_OFF,
+    PNS_RUN_CONTROL_LED_ON,
+    PNS_RUN_CONTROL_LED_BLINKING,
+    PNS_DETAIL_RUN_CONTROL_LED_OFF,
+    PNS_DETAIL_RUN_CONTROL_BLINKING_ON,
+    PnsDetailRunControlData,
+    PnsDetailStatusData,
+    pns_smart_mode_command,
+    pns_detail_run_control_command,
+    pns_get_detail_data_command,
+)
+
+SCENE_GROUP_MIN = 0x01
+"""first smart mode group"""
+SCENE_GROUP_MAX = 0x1F
+"""last smart mode group"""
+
+
+class Scene:
+    """named state of a tower, played by a smart mode group or by a detailed operation control frame"""
+
+    __slots__ = ('_name', '_group_no', '_detail_run_control_data')
+
+    def __init__(self, name: str, group_no: int = None, detail_run_control_data: PnsDetailRunControlData = None):
+        """
+        named state of a tower, played by a smart mode group or by a detailed operation control frame
+
+        Parameters
+        ----------
+        name: str
+            Scene name
+        group_no: int
+            Smart mode group holding the scene on the devices (0x01(Group No.1) to 0x1F(Group No.31))
+        detail_run_control_data: PnsDetailRunControlData
+            Frame sent to the devices without the group
+        """
+        if group_no is None and detail_run_control_data is None:
+            raise ValueError('scene without group nor frame')
+        if group_no is not None and not SCENE_GROUP_MIN <= group_no <= SCENE_GROUP_MAX:
+            raise ValueError('group number out of range')
+        self._name = name
+        self._group_no = group_no
+        self._detail_run_control_data = detail_run_control_data
+
+    @property
+    def name(self) -> str:
+        """scene name"""
+        return self._name
+
+    @property
+    def group_no(self) -> int:
+        """smart mode group, None if the scene has no group"""
+        return self._group_no
+
+    @property
+    def detail_run_control_data(self) -> PnsDetailRunControlData:
+        """detailed operation control data, None if the scene has no frame"""
+        return self._detail_run_control_data
+
+    def __repr__(self) -> str:
+        return 'Scene(%r, group_no=%r)' % (self._name, self._group_no)
+
+
+def _frame_playing(detail_run_control_data: PnsDetailRunControlData, status, color_table: ColorLookupTable) -> bool:
+    # the buzzer is not compared, it may have been silenced on the device
+    want = detail_run_control_data.get_bytes()
+    if want[5] == PNS_DETAIL_RUN_CONTROL_BLINKING_ON:
+        lit_pattern = PNS_RUN_CONTROL_LED_BLINKING
+    else:
+        lit_pattern = PNS_RUN_CONTROL_LED_ON
+    if isinstance(status, PnsDetailStatusData):
+        data = status.led_mode_detail_data
+        units = (data.led_unit1_data, data.led_unit2_data, data.led_unit3_data, data.led_unit4_data,
+                 data.led_unit5_data)
+        for color, unit in zip(want[0:5], units):
+            if color == PNS_DETAIL_RUN_CONTROL_LED_OFF:
+                if unit.led_pattern != PNS_RUN_CONTROL_LED_OFF:
+                    return False
+            elif unit.led_pattern != lit_pattern or color_table.nearest(unit.red, unit.green, unit.blue) != color:
+                return False
+        return True
+    # the get status command reports the patterns only
+    data = status.led_mode_data
+    patterns = (data.led1_pattern, data.led2_pattern, data.led3_pattern, data.led4_pattern, data.led5_pattern)
+    return all(pattern == (PNS_RUN_CONTROL_LED_OFF if color == PNS_DETAIL_RUN_CONTROL_LED_OFF else lit_pattern)
+               for color, pattern in zip(want[0:5], patterns))
+
+
+class SceneManager:
+    """switches the scene of each device, with the one-byte smart mode command when possible"""
+
+    def __init__(self, pool, color_table: dict = None):
+        """
+        switches the scene of each device, with the one-byte smart mode command when possible
+
+        Parameters
+        ----------
+        pool: ConnectionPool
+            Connections to the devices
+        color_table: dict
+            RGB per color code used to match the reported RGB, NOMINAL_COLOR_RGB if omitted
+        """
+        self._pool = pool
+        self._color_table = ColorLookupTable(color_table)
+        self._lock = threading.Lock()
+        self._scenes = {}
+        self._groups = {}
+        self._by_group = {}
+        self._active = {}
+
+    @property
+    def scenes(self) -> list:
+        """defined scenes"""
+        with self._lock:
+            return list(self._scenes.values())
+
+    def define(self, scene: Scene):
+        """
+        Define or replace a scene
+
+        Parameters
+        ----------
+        scene: Scene
+            Scene
+        """
+        with self._lock:
+            previous = self._scenes.get(scene.name)
+            if previous is not None and previous.group_no is not None:
+                self._by_group.pop(previous.group_no, None)
+            self._scenes[scene.name] = scene
+            if scene.group_no is not None:
+                self._by_group[scene.group_no] = scene.name
+            # the devices may no longer be playing the new definition
+            for device, name in list(self._active.items()):
+                if name == scene.name:
+                    del self._active[device]
+
+    def remove(self, name: str):
+        """
+        Remove a scene
+
+        Parameters
+        ----------
+        name: str
+            Scene name
+        """
+        with self._lock:
+            scene = self._scenes.pop(name)
+            if scene.group_no is not None and self._by_group.get(scene.group_no) == name:
+                del self._by_group[scene.group_no]
+            for device, active in list(self._active.items()):
+                if active == name:
+                    del self._active[device]
+
+    def preload(self, device: str, groups):
+        """
+        Declare the smart mode groups configured on a device
+
+        Scenes whose group is configured are played with the smart mode command (T),
+        the other ones with the detailed operation control command (D)
+
+        Parameters
+        ----------
+        device: str
+            Device id
+        groups:
+            Configured group numbers
+        """
+        with self._lock:
+            self._groups[device] = frozenset(groups)
+
+    def active(self, device: str) -> str:
+        """
+        Get the scene played by a device
+
+        Parameters
+        ----------
+        device: str
+            Device id
+
+        Returns
+        -------
+        name: str
+            scene name, None if unknown
+        """
+        with self._lock:
+            return self._active.get(device)
+
+    def activate(self, device: str, name: str, force: bool = False) -> bool:
+        """
+        Switch a device to a scene
+
+        Parameters
+        ----------
+        device: str
+            Device id
+        name: str
+            Scene name
+        force: bool
+            Send the command even if the scene is already active
+
+        Returns
+        -------
+        sent: bool
+            False if the scene was already active and nothing was sent
+        """
+        with self._lock:
+            scene = self._scenes[name]
+            if not force and self._active.get(device) == name:
+                return False
+            use_group = scene.group_no is not None and scene.group_no in self._groups.get(device, ())
+        if use_group:
+            self._pool.run(device, pns_smart_mode_command, scene.group_no)
+        elif scene.detail_run_control_data is not None:
+            self._pool.run(device, pns_detail_run_control_command, scene.detail_run_control_data)
+        else:
+            raise ValueError('scene %s is neither preloaded on %s nor has a frame' % (name, device))
+        with self._lock:
+            self._active[device] = name
+        return True
+
+    def update(self, device: str, status) -> str:
+        """
+        Track the scene of a device from its status
+
+        In signal light mode, the scene last sent to the device is kept only if the status still shows
+        its frame (a manual change or a command of another client ends it): the lit units and their
+        colors with a detailed status, the lit units only with a status
+
+        Parameters
+        ----------
+        device: str
+            Device id
+        status: PnsStatusData or PnsDetailStatusData
+            Status of the device (pns_get_data_command or pns_get_detail_data_command)
+
+        Returns
+        -------
+        name: str
+            scene played by the device, None if unknown
+        """
+        with self._lock:
+            if status.mode == PNS_SMART_MODE:
+                if isinstance(status, PnsDetailStatusData):
+                    group_no = status.smart_mode_detail_data.smart_mode_data.group_no
+                else:
+                    group_no = status.smart_mode_data.group_no
+                name = self._by_group.get(group_no)
+            else:
+                # signal light mode: only a scene sent with D can be playing
+                name = self._active.get(device)
+                scene = self._scenes.get(name)
+                if (scene is None or scene.detail_run_control_data is None or
+                        not _frame_playing(scene.detail_run_control_data, status, self._color_table)):
+                    name = None
+            if name is None:
+                self._active.pop(device, None)
+            else:
+                self._active[device] = name
+            return name
+
+    def refresh(self, device: str) -> str:
+        """
+        Read the detailed status of a device and track its scene
+
+        Parameters
+        ----------
+        device: str
+            Device id
+
+        Returns
+        -------
+        name: str
+            scene played by the device, None if unknown
+        """
+        return self.update(device, self._pool.run(device, pns_get_detail_data_command))
@@ -0,0 +1,341 @@
+import concurrent.futures
+import itertools
+import logging
+import math
+import threading
+import time
+
+from command_queue import command_defaults
+
+_DEFAULT = object()
+
+_log = logging.getLogger(__name__)
+
+
+class ScheduledAction:
+    """command to send to a device at a given time"""
+
+    __slots__ = ('_when', '_device', '_command', '_args', '_key', '_sequence', '_cancelled')
+
+    _counter = itertools.count()
+
+    def __init__(self, when: float, device: str, command, *args, key=_DEFAULT):
+        """
+        command to send to a device at a given time
+
+        Parameters
+        ----------
+        when: float
+            Due time (seconds since the epoch)
+        device: str
+            Device id
+        command: callable
+            Command function of main.py
+        args:
+            Arguments of the command other than sock
+        key:
+            Merge key, the supersede key of the command if omitted (see command_queue.py), None never merges
+        """
+        self._when = when
+        self._device = device
+        self._command = command
+        self._args = args
+        self._key = command_defaults(command)[1] if key is _DEFAULT else key
+        self._sequence = next(ScheduledAction._counter)
+        self._cancelled = False
+
+    @property
+    def when(self) -> float:
+        """due time"""
+        return self._when
+
+    @property
+    def device(self) -> str:
+        """device id"""
+        return self._device
+
+    @property
+    def command(self):
+        """command function"""
+        return self._command
+
+    @property
+    def args(self) -> tuple:
+        """arguments of the command"""
+        return self._args
+
+    @property
+    def key(self):
+        """merge key"""
+        return self._key
+
+    @property
+    def cancelled(self) -> bool:
+        """True if cancelled"""
+        return self._cancelled
+
+    def cancel(self):
+        """
+        Cancel the action, it is dropped when due
+        """
+        self._cancelled = True
+
+    def __repr__(self) -> str:
+        return 'ScheduledAction(%r, %s, %.3f)' % (self._device, self._command.__name__, self._when)
+
+
+class TimerWheel:
+    """hierarchical timer wheel, O(1) insertion and O(1) amortized work per tick"""
+
+    def __init__(self, tick: float = 0.1, slots: tuple = (256, 64, 64, 64), start: float = None):
+        """
+        hierarchical timer wheel, O(1) insertion and O(1) amortized work per tick
+
+        Level 0 has one slot per tick, each higher level one slot per revolution of the level below;
+        items of a higher level slot are cascaded to the lower levels when their slot comes round
+
+        Parameters
+        ----------
+        tick: float
+            Resolution in seconds
+        slots: tuple
+            Number of slots of each level (256, 64, 64, 64 at 0.1 s covers 77 days)
+        start: float
+            Time of tick 0 (seconds since the epoch), now if omitted
+        """
+        self._tick = tick
+        self._slots = tuple(slots)
+        # ticks covered by one slot of each level
+        self._spans = tuple(math.prod(self._slots[:level]) for level in range(len(self._slots)))
+        self._range = math.prod(self._slots)
+        self._start = time.time() if start is None else start
+        self._current = 0
+        self._wheels = [[[] for _ in range(count)] for count in self._slots]
+        self._overflow = []
+        self._size = 0
+
+    @property
+    def tick(self) -> float:
+        """resolution in seconds"""
+        return self._tick
+
+    def __len__(self) -> int:
+        return self._size
+
+    def _expiry(self, when: float) -> int:
+        return math.ceil((when - self._start) / self._tick - 1e-9)
+
+    def insert(self, when: float, item):
+        """
+        Add an item
+
+        Parameters
+        ----------
+        when: float
+            Due time (seconds since the epoch)
+        item:
+            Item returned by advance when due
+        """
+        self._size += 1
+        self._place(max(self._expiry(when), self._current + 1), item)
+
+    def _place(self, expiry: int, item):
+        delta = expiry - self._current
+        if delta >= self._range:
+            self._overflow.append((expiry, item))
+            return
+        for level, span in enumerate(self._spans):
+            if delta < span * self._slots[level]:
+                self._wheels[level][(expiry // span) % self._slots[level]].append((expiry, item))
+                return
+
+    def advance(self, now: float = None) -> list:
+        """
+        Move the wheel up to a time
+
+        Parameters
+        ----------
+        now: float
+            Current time (seconds since the epoch), now if omitted
+
+        Returns
+        -------
+        items: list
+            items due, in due order
+        """
+        target = math.floor(((time.time() if now is None else now) - self._start) / self._tick + 1e-9)
+        due = []
+        while self._current < target:
+            self._current += 1
+            current = self._current
+            if current % self._range == 0 and self._overflow:
+                overflow, self._overflow = self._overflow, []
+                for expiry, item in overflow:
+                    self._place(expiry, item)
+            # cascade from the top so that cascaded items reach the level 0 slot of this tick
+            for level in range(len(self._slots) - 1, 0, -1):
+                span = self._spans[level]
+                if current % span == 0:
+                    slot = self._wheels[level][(current // span) % self._slots[level]]
+                    self._wheels[level][(current // span) % self._slots[level]] = []
+                    for expiry, item in slot:
+                        self._place(expiry, item)
+            slot = self._wheels[0][current % self._slots[0]]
+            if slot:
+                self._wheels[0][current % self._slots[0]] = []
+                self._size -= len(slot)
+                due.extend(item for expiry, item in slot)
+        return due
+
+
+class Scheduler:
+    """timed per-device commands dispatched through a connection pool"""
+
+    def __init__(self, pool, tick: float = 0.1, max_workers: int = 16, on_error=None):
+        """
+        timed per-device commands dispatched through a connection pool
+
+        Actions of a device falling due in the same tick are sent together in scheduling order,
+        an action being dropped when a later one of the same tick has the same merge key
+
+        Parameters
+        ----------
+        pool: ConnectionPool
+            Connections to the devices
+        tick: float
+            Resolution in seconds
+        max_workers: int
+            Maximum number of devices served concurrently
+        on_error: callable
+            Called with (action, exception) when a command fails; if omitted, the first failure of a device
+            is raised by its future returned by run_due, and logged when dispatched by the background thread
+        """
+        self._pool = pool
+        self._tick = tick
+        self._on_error = on_error
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers)
+        self._lock = threading.Lock()
+        self._wheel = TimerWheel(tick)
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def pending(self) -> int:
+        """number of actions not yet due (cancelled ones included)"""
+        with self._lock:
+            return len(self._wheel)
+
+    def schedule(self, when: float, device: str, command, *args, key=_DEFAULT) -> ScheduledAction:
+        """
+        Schedule a command
+
+        Parameters
+        ----------
+        when: float
+            Due time (seconds since the epoch)
+        device: str
+            Device id
+        command: callable
+            Command function of main.py
+        args:
+            Arguments of the command other than sock
+        key:
+            Merge key, the supersede key of the command if omitted, None never merges
+
+        Returns
+        -------
+        action: ScheduledAction
+            scheduled action, cancel() drops it
+        """
+        action = ScheduledAction(when, device, command, *args, key=key)
+        with self._lock:
+            self._wheel.insert(when, action)
+        return action
+
+    def load(self, actions):
+        """
+        Replace the whole schedule at once
+
+        The new wheel is built aside and swapped in, so no tick sees a partial schedule
+
+        Parameters
+        ----------
+        actions:
+            ScheduledAction of the new schedule
+        """
+        wheel = TimerWheel(self._tick)
+        for action in actions:
+            wheel.insert(action.when, action)
+        with self._lock:
+            self._wheel = wheel
+
+    def run_due(self, now: float = None) -> list:
+        """
+        Dispatch the actions due
+
+        Parameters
+        ----------
+        now: float
+            Current time (seconds since the epoch), now if omitted
+
+        Returns
+        -------
+        futures: list
+            concurrent.futures.Future of each device served, raising the first failure of the device if on_error
+            is omitted
+        """
+        with self._lock:
+            due = self._wheel.advance(now)
+        by_device = {}
+        for action in due:
+            if not action.cancelled:
+                by_device.setdefault(action.device, []).append(action)
+        return [self._executor.submit(self._dispatch, self._merge(actions)) for actions in by_device.values()]
+
+    @staticmethod
+    def _merge(actions: list) -> list:
+        actions.sort(key=lambda action: action._sequence)
+        last = {action.key: action for action in actions if action.key is not None}
+        return [action for action in actions if action.key is None or last[action.key] is action]
+
+    def _dispatch(self, actions: list):
+        error = None
+        for action in actions:
+            try:
+                self._pool.run(action.device, action.command, *action.args)
+            except Exception as e:
+                if self._on_error is not None:
+                    self._on_error(action, e)
+                elif error is None:
+                    error = e
+        if error is not None:
+            raise error
+
+    def start(self):
+        """
+        Start dispatching in a background thread.
+        """
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stop dispatching and wait for the commands being sent.
+        """
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self._executor.shutdown()
+
+    def _run(self):
+        while not self._stop.wait(self._tick):
+            for future in self.run_due():
+                future.add_done_callback(self._report)
+
+    @staticmethod
+    def _report(future: concurrent.futures.Future):
+        error = future.exception()
+        if error is not None:
+            _log.error('scheduled command failed', exc_info=error)
@@ -0,0 +1,413 @@
+import bisect
+import concurrent.futures
+import hashlib
+import multiprocessing
+import multiprocessing.connection
+import os
+import struct
+import threading
+import time
+
+from fleet import ConnectionPool, PNS_PORT
+from health import HealthTracker
+from main import (
+    PnsDetailStatusData,
+    pns_get_detail_data_decode,
+    pns_get_detail_data_frame_command,
+)
+from retry import RETRY_POLICIES
+
+SHARD_RECORD_STATUS = 0
+"""record carrying the response data of the get detail status command"""
+SHARD_RECORD_ERROR = 1
+"""record carrying the error of a poll"""
+
+# record sent by the workers: device id size, record type, time, payload size, then device id and payload
+_SHARD_RECORD_HEADER = struct.Struct('>HBdH')
+
+
+class HashRing:
+    """consistent hashing of device ids onto nodes"""
+
+    def __init__(self, nodes=(), replicas: int = 64):
+        """
+        consistent hashing of device ids onto nodes
+
+        Parameters
+        ----------
+        nodes:
+            Initial nodes
+        replicas: int
+            Number of points of each node on the ring
+        """
+        self._replicas = replicas
+        self._points = []
+        self._owners = []
+        for node in nodes:
+            self.add(node)
+
+    @staticmethod
+    def _hash(key: str) -> int:
+        return int.from_bytes(hashlib.blake2b(key.encode('utf-8'), digest_size=8).digest(), 'big')
+
+    @property
+    def nodes(self) -> set:
+        """nodes on the ring"""
+        return set(self._owners)
+
+    def add(self, node):
+        """
+        Add a node
+
+        Parameters
+        ----------
+        node:
+            Node (hashable, its str is hashed)
+        """
+        for i in range(self._replicas):
+            point = self._hash('%s#%d' % (node, i))
+            index = bisect.bisect(self._points, point)
+            self._points.insert(index, point)
+            self._owners.insert(index, node)
+
+    def remove(self, node):
+        """
+        Remove a node, only its devices move to other nodes
+
+        Parameters
+        ----------
+        node:
+            Node
+        """
+        kept = [(p, o) for p, o in zip(self._points, self._owners) if o != node]
+        self._points = [p for p, o in kept]
+        self._owners = [o for p, o in kept]
+
+    def node(self, key: str):
+        """
+        Get the node owning a key
+
+        Parameters
+        ----------
+        key: str
+            Device id
+
+        Returns
+        -------
+        node:
+            owning node, None if the ring is empty
+        """
+        if not self._points:
+            return None
+        index = bisect.bisect(self._points, self._hash(key)) % len(self._points)
+        return self._owners[index]
+
+
+def _shard_worker(commands, results, interval: float, timeout: float, max_workers: int, open_duration: float):
+    # worker process: polls its devices, sends only the changed responses
+    # unreachable devices fail fast, then one poll every open_duration checks them again (half-open circuit)
+    pool = ConnectionPool(timeout, RETRY_POLICIES, HealthTracker(open_duration=open_duration))
+    last = {}
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers)
+
+    def poll(device: str) -> bytes:
+        return pool.run(device, pns_get_detail_data_frame_command)
+
+    try:
+        deadline = time.monotonic()
+        while True:
+            wait = deadline - time.monotonic()
+            if commands.poll(max(wait, 0.0)):
+                command = commands.recv()
+                if command[0] == 'add':
+                    pool.add(command[1], command[2], command[3])
+                    last.pop(command[1], None)
+                elif command[0] == 'remove':
+                    pool.remove(command[1])
+                    last.pop(command[1], None)
+                else:
+                    return
+                continue
+
+            deadline = time.monotonic() + interval
+            devices = pool.devices
+            futures = [executor.submit(poll, device) for device in devices]
+            batch = []
+            for device, future in zip(devices, futures):
+                device_id = device.encode('utf-8')
+                try:
+                    recv_data = future.result()
+                except Exception as e:
+                    last.pop(device, None)
+                    payload = repr(e).encode('utf-8')
+                    batch.append(_SHARD_RECORD_HEADER.pack(len(device_id), SHARD_RECORD_ERROR, time.time(),
+                                                           len(payload)) + device_id + payload)
+                    continue
+                if last.get(device) == recv_data:
+                    continue
+                last[device] = recv_data
+                batch.append(_SHARD_RECORD_HEADER.pack(len(device_id), SHARD_RECORD_STATUS, time.time(),
+                                                       len(recv_data)) + device_id + recv_data)
+            if batch:
+                # one message per round
+                results.send_bytes(b''.join(batch))
+    except (EOFError, OSError, KeyboardInterrupt):
+        pass
+    finally:
+        executor.shutdown(wait=False)
+        pool.close()
+
+
+class _Worker:
+
+    __slots__ = ('name', 'process', 'commands', 'results', 'devices')
+
+    def __init__(self, name: str, process, commands, results):
+        self.name = name
+        self.process = process
+        self.commands = commands
+        self.results = results
+        self.devices = set()
+
+
+class ShardSupervisor:
+    """polls the get detail status of a fleet from worker processes sharded by consistent hashing"""
+
+    def __init__(self, workers: int = None, interval: float = 1.0, timeout: float = 1.0, max_workers: int = 64,
+                 on_status=None, on_error=None, open_duration: float = 5.0):
+        """
+        polls the get detail status of a fleet from worker processes sharded by consistent hashing
+
+        Each worker owns the connections of its devices, validates the responses and sends back
+        the raw response data of the devices that changed, batched per poll round
+
+        Parameters
+        ----------
+        workers: int
+            Number of worker processes, the number of CPUs if omitted
+        interval: float
+            Poll interval in seconds
+        timeout: float
+            Connect/receive timeout in seconds
+        max_workers: int
+            Number of polling threads of each worker process
+        on_status: callable
+            Called with (device, PnsDetailStatusData, time) for every changed status, from the receiving thread
+        on_error: callable
+            Called with (device, error text, time) for every failed poll, from the receiving thread
+        open_duration: float
+            Seconds a device that failed to answer is not polled (its polls fail with CircuitOpenError)
+            before it is tried again
+        """
+        self._worker_count = workers or os.cpu_count() or 1
+        self._interval = interval
+        self._timeout = timeout
+        self._max_workers = max_workers
+        self._open_duration = open_duration
+        self._on_status = on_status
+        self._on_error = on_error
+        self._context = multiprocessing.get_context('spawn')
+        self._lock = threading.Lock()
+        self._ring = HashRing()
+        self._workers = {}
+        self._addresses = {}
+        self._owners = {}
+        self._status = {}
+        self._errors = {}
+        self._thread = None
+        self._stopping = False
+
+    @property
+    def workers(self) -> dict:
+        """device ids owned by each live worker"""
+        with self._lock:
+            return {name: set(worker.devices) for name, worker in self._workers.items()}
+
+    @property
+    def errors(self) -> dict:
+        """last error text of each device whose last poll failed"""
+        with self._lock:
+            return dict(self._errors)
+
+    def status(self, device: str) -> PnsDetailStatusData:
+        """
+        Get the last status of a device
+
+        Parameters
+        ----------
+        device: str
+            Device id
+
+        Returns
+        -------
+        status: PnsDetailStatusData
+            last status, None before the first response
+        """
+        with self._lock:
+            recv_data = self._status.get(device)
+        if recv_data is None:
+            return None
+        return pns_get_detail_data_decode(recv_data)
+
+    def start(self):
+        """
+        Start the worker processes
+        """
+        with self._lock:
+            self._stopping = False
+            for i in range(self._worker_count):
+                self._spawn('worker-%d' % i)
+        self._thread = threading.Thread(target=self._receive, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stop the worker processes
+        """
+        with self._lock:
+            self._stopping = True
+            workers = list(self._workers.values())
+            self._workers.clear()
+        for worker in workers:
+            try:
+                worker.commands.send(('stop',))
+            except OSError:
+                pass
+        for worker in workers:
+            worker.process.join(self._interval + self._timeout + 1.0)
+            if worker.process.is_alive():
+                worker.process.terminate()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def add(self, device: str, ip: str, port: int = PNS_PORT):
+        """
+        Register a device, polled by the worker owning it on the hash ring
+
+        Parameters
+        ----------
+        device: str
+            Device id
+        ip: str
+            IP address
+        port: int
+            port number
+        """
+        with self._lock:
+            self._addresses[device] = (ip, port)
+            self._assign(device)
+
+    def remove(self, device: str):
+        """
+        Unregister a device
+
+        Parameters
+        ----------
+        device: str
+            Device id
+        """
+        with self._lock:
+            self._addresses.pop(device, None)
+            self._status.pop(device, None)
+            self._errors.pop(device, None)
+            name = self._owners.pop(device, None)
+            worker = self._workers.get(name)
+            if worker is not None:
+                worker.devices.discard(device)
+                self._send(worker, ('remove', device))
+
+    def _spawn(self, name: str):
+        parent_commands, child_commands = self._context.Pipe()
+        parent_results, child_results = self._context.Pipe(duplex=False)
+        process = self._context.Process(target=_shard_worker, name=name, daemon=True,
+                                        args=(child_commands, child_results, self._interval, self._timeout,
+                                              self._max_workers, self._open_duration))
+        process.start()
+        child_commands.close()
+        child_results.close()
+        self._workers[name] = _Worker(name, process, parent_commands, parent_results)
+        self._ring.add(name)
+        # devices whose owner changed on the ring move to the new worker
+        for device in list(self._addresses):
+            if self._ring.node(device) != self._owners.get(device):
+                self._assign(device)
+
+    def _assign(self, device: str):
+        name = self._ring.node(device)
+        previous = self._workers.get(self._owners.get(device))
+        if previous is not None and previous.name != name:
+            previous.devices.discard(device)
+            self._send(previous, ('remove', device))
+        worker = self._workers.get(name)
+        if worker is None:
+            return
+        self._owners[device] = name
+        worker.devices.add(device)
+        ip, port = self._addresses[device]
+        self._send(worker, ('add', device, ip, port))
+
+    @staticmethod
+    def _send(worker: _Worker, command: tuple):
+        try:
+            worker.commands.send(command)
+        except OSError:
+            # the worker died, its devices are reassigned when its sentinel fires
+            pass
+
+    def _rebalance(self, worker: _Worker):
+        # called with the lock held when a worker process exited
+        del self._workers[worker.name]
+        self._ring.remove(worker.name)
+        worker.commands.close()
+        worker.results.close()
+        for device in worker.devices:
+            self._owners.pop(device, None)
+            if device in self._addresses:
+                self._assign(device)
+
+    def _receive(self):
+        while True:
+            with self._lock:
+                if self._stopping and not self._workers:
+                    return
+                waitables = {}
+                for worker in self._workers.values():
+                    waitables[worker.results] = worker
+                    waitables[worker.process.sentinel] = worker
+            if not waitables:
+                return
+            for ready in multiprocessing.connection.wait(list(waitables), timeout=self._interval):
+                worker = waitables[ready]
+                if ready is worker.results:
+                    try:
+                        self._dispatch(worker.results.recv_bytes())
+                        continue
+                    except (EOFError, OSError):
+                        pass
+                with self._lock:
+                    if not self._stopping and self._workers.get(worker.name) is worker:
+                        self._rebalance(worker)
+
+    def _dispatch(self, batch: bytes):
+        view = memoryview(batch)
+        offset = 0
+        while offset < len(view):
+            device_size, kind, timestamp, payload_size = _SHARD_RECORD_HEADER.unpack_from(view, offset)
+            offset += _SHARD_RECORD_HEADER.size
+            device = str(view[offset:offset + device_size], 'utf-8')
+            offset += device_size
+            payload = bytes(view[offset:offset + payload_size])
+            offset += payload_size
+            if kind == SHARD_RECORD_STATUS:
+                with self._lock:
+                    self._status[device] = payload
+                    self._errors.pop(device, None)
+                if self._on_status is not None:
+                    self._on_status(device, pns_get_detail_data_decode(payload), timestamp)
+            else:
+                error = payload.decode('utf-8')
+                with self._lock:
+                    self._errors[device] = error
+                if self._on_error is not None:
+                    self._on_error(device, error, timestamp)
@@ -0,0 +1,276 @@
+import socketserver
+import struct
+import threading
+
+from colors import NOMINAL_COLOR_RGB
+from main import (
+    PNS_PRODUCT_ID,
+    PNS_SMART_MODE_COMMAND,
+    PNS_MUTE_COMMAND,
+    PNS_STOP_PULSE_INPUT_COMMAND,
+    PNS_RUN_CONTROL_COMMAND,
+    PNS_DETAIL_RUN_CONTROL_COMMAND,
+    PNS_CLEAR_COMMAND,
+    PNS_REBOOT_COMMAND,
+    PNS_GET_DATA_COMMAND,
+    PNS_GET_DETAIL_DATA_COMMAND,
+    PNS_ACK,
+    PNS_NAK,
+    PNS_LED_MODE,
+    PNS_SMART_MODE,
+    PNS_RUN_CONTROL_LED_OFF,
+    PNS_RUN_CONTROL_LED_ON,
+    PNS_RUN_CONTROL_LED_BLINKING,
+    PNS_RUN_CONTROL_LED_NO_CHANGE,
+    PNS_RUN_CONTROL_BUZZER_NO_CHANGE,
+    PNS_DETAIL_RUN_CONTROL_LED_OFF,
+    PNS_DETAIL_RUN_CONTROL_LED_COLOR_RED,
+    PNS_DETAIL_RUN_CONTROL_LED_COLOR_YELLOW,
+    PNS_DETAIL_RUN_CONTROL_LED_COLOR_GREEN,
+    PNS_DETAIL_RUN_CONTROL_LED_COLOR_BLUE,
+    PNS_DETAIL_RUN_CONTROL_LED_COLOR_WHITE,
+    PNS_DETAIL_RUN_CONTROL_BLINKING_ON,
+    PHN_WRITE_COMMAND,
+    PHN_READ_COMMAND,
+    PHN_ACK,
+    PHN_NAK,
+    pns_run_control_encode,
+)
+from phn import phn_run_data_from_patterns, run_control_data_from_phn
+
+SIMULATOR_DEFAULT_COLORS = (
+    PNS_DETAIL_RUN_CONTROL_LED_COLOR_RED,
+    PNS_DETAIL_RUN_CONTROL_LED_COLOR_YELLOW,
+    PNS_DETAIL_RUN_CONTROL_LED_COLOR_GREEN,
+    PNS_DETAIL_RUN_CONTROL_LED_COLOR_BLUE,
+    PNS_DETAIL_RUN_CONTROL_LED_COLOR_WHITE,
+)
+"""colors of the 1st to 5th LED unit used by the operation control command"""
+
+
+class LaPoeSimulator:
+    """simulated LA6-POE answering PNS/PHN commands"""
+
+    def __init__(self, mac_address: bytes = b'\x00\x00\x00\x00\x00\x00', password: str = ''):
+        """
+        simulated LA6-POE answering PNS/PHN commands
+
+        Parameters
+        ----------
+        mac_address: bytes
+            MAC address reported by the get detail status command
+        password: str
+            Password accepted by the reboot command
+        """
+        self._mac_address = bytes(mac_address)
+        self._password = password
+        self._lock = threading.Lock()
+        self._input = bytearray(8)
+        self._mode = PNS_LED_MODE
+        self._led_patterns = [PNS_RUN_CONTROL_LED_OFF] * 5
+        self._led_colors = list(SIMULATOR_DEFAULT_COLORS)
+        self._buzzer_pattern = 0
+        self._group_no = 0
+        self._mute = 0
+        self._stop_input = 0
+        self._reboot_count = 0
+
+    @property
+    def mode(self) -> int:
+        """mode"""
+        return self._mode
+
+    @property
+    def led_patterns(self) -> tuple:
+        """1st to 5th LED unit pattern"""
+        return tuple(self._led_patterns)
+
+    @property
+    def led_colors(self) -> tuple:
+        """1st to 5th LED unit color"""
+        return tuple(self._led_colors)
+
+    @property
+    def buzzer_pattern(self) -> int:
+        """buzzer pattern"""
+        return self._buzzer_pattern
+
+    @property
+    def group_no(self) -> int:
+        """group number of smart mode"""
+        return self._group_no
+
+    @property
+    def reboot_count(self) -> int:
+        """number of accepted reboot commands"""
+        return self._reboot_count
+
+    def set_input(self, input_no: int, value: int):
+        """
+        Set the state of a contact input
+
+        Parameters
+        ----------
+        input_no: int
+            Input number (1 to 8)
+        value: int
+            Input state (OFF: 0, ON: 1)
+        """
+        with self._lock:
+            self._input[input_no - 1] = 1 if value else 0
+
+    def handle(self, frame: bytes) -> bytes:
+        """
+        Process one command frame
+
+        Parameters
+        ----------
+        frame: bytes
+            PNS or PHN command
+
+        Returns
+        -------
+        response: bytes
+            response data of the command
+        """
+        with self._lock:
+            if frame[0:2] == PNS_PRODUCT_ID:
+                return self._handle_pns(frame)
+            return self._handle_phn(frame)
+
+    def _handle_pns(self, frame: bytes) -> bytes:
+        if len(frame) < 6:
+            return bytes([PNS_NAK])
+        command = frame[2:3]
+        size = struct.unpack('>H', frame[4:6])[0]
+        data = frame[6:6 + size]
+        if len(data) != size:
+            return bytes([PNS_NAK])
+
+        if command == PNS_SMART_MODE_COMMAND:
+            if size != 1 or not 0x01 <= data[0] <= 0x1F:
+                return bytes([PNS_NAK])
+            self._mode = PNS_SMART_MODE
+            self._group_no = data[0]
+        elif command == PNS_MUTE_COMMAND:
+            if size != 1:
+                return bytes([PNS_NAK])
+            self._mute = data[0]
+        elif command == PNS_STOP_PULSE_INPUT_COMMAND:
+            if size != 1:
+                return bytes([PNS_NAK])
+            self._stop_input = data[0]
+        elif command == PNS_RUN_CONTROL_COMMAND:
+            if size != 6:
+                return bytes([PNS_NAK])
+            self._mode = PNS_LED_MODE
+            for i in range(5):
+                if data[i] != PNS_RUN_CONTROL_LED_NO_CHANGE:
+                    self._led_patterns[i] = data[i]
+                    self._led_colors[i] = SIMULATOR_DEFAULT_COLORS[i]
+            if data[5] != PNS_RUN_CONTROL_BUZZER_NO_CHANGE:
+                self._buzzer_pattern = data[5]
+        elif command == PNS_DETAIL_RUN_CONTROL_COMMAND:
+            if size != 7:
+                return bytes([PNS_NAK])
+            self._mode = PNS_LED_MODE
+            for i in range(5):
+                self._led_colors[i] = data[i]
+                if data[i] == PNS_DETAIL_RUN_CONTROL_LED_OFF:
+                    self._led_patterns[i] = PNS_RUN_CONTROL_LED_OFF
+                elif data[5] == PNS_DETAIL_RUN_CONTROL_BLINKING_ON:
+                    self._led_patterns[i] = PNS_RUN_CONTROL_LED_BLINKING
+                else:
+                    self._led_patterns[i] = PNS_RUN_CONTROL_LED_ON
+            self._buzzer_pattern = data[6]
+        elif command == PNS_CLEAR_COMMAND:
+            self._mode = PNS_LED_MODE
+            self._led_patterns = [PNS_RUN_CONTROL_LED_OFF] * 5
+            self._buzzer_pattern = 0
+        elif command == PNS_REBOOT_COMMAND:
+            if data.decode('ascii', 'replace') != self._password:
+                return bytes([PNS_NAK])
+            self._reboot_count += 1
+        elif command == PNS_GET_DATA_COMMAND:
+            return self._status_bytes()
+        elif command == PNS_GET_DETAIL_DATA_COMMAND:
+            return self._detail_status_bytes()
+        else:
+            return bytes([PNS_NAK])
+
+        return bytes([PNS_ACK])
+
+    def _handle_phn(self, frame: bytes) -> bytes:
+        command = frame[0:1]
+        if command == PHN_WRITE_COMMAND and len(frame) == 2:
+            run_control_data = run_control_data_from_phn(frame[1])
+            self._handle_pns(pns_run_control_encode(run_control_data))
+            return PHN_ACK
+        if command == PHN_READ_COMMAND and len(frame) == 1:
+            return PHN_READ_COMMAND + bytes([phn_run_data_from_patterns(self._led_patterns, self._buzzer_pattern)])
+        return PHN_NAK
+
+    def _status_bytes(self) -> bytes:
+        data = bytes(self._input) + bytes([self._mode])
+        if self._mode == PNS_LED_MODE:
+            data += bytes(self._led_patterns) + bytes([self._buzzer_pattern])
+        else:
+            data += bytes([self._group_no, self._mute, self._stop_input, 1, 0, 0])
+        return data
+
+    def _detail_status_bytes(self) -> bytes:
+        data = self._mac_address + bytes(self._input) + bytes([self._mode]) + bytes(4)
+        if self._mode != PNS_LED_MODE:
+            data += bytes([self._group_no, self._mute, self._stop_input, 1, 0])
+        for i in range(5):
+            if self._led_patterns[i] == PNS_RUN_CONTROL_LED_OFF:
+                red, green, blue = 0, 0, 0
+            else:
+                red, green, blue = NOMINAL_COLOR_RGB.get(self._led_colors[i], (0, 0, 0))
+            data += bytes([self._led_patterns[i], red, green, blue])
+        data += bytes([self._buzzer_pattern])
+        return data
+
+
+class _SimulatorRequestHandler(socketserver.BaseRequestHandler):
+
+    def handle(self):
+        while True:
+            frame = self.request.recv(1024)
+            if not frame:
+                break
+            self.request.sendall(self.server.simulator.handle(frame))
+
+
+class SimulatorServer(socketserver.ThreadingTCPServer):
+    """TCP server exposing a simulated LA6-POE on the PNS port"""
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address: tuple, simulator: LaPoeSimulator = None):
+        """
+        TCP server exposing a simulated LA6-POE on the PNS port
+
+        Parameters
+        ----------
+        address: tuple
+            (IP address, port number) to listen on, port 0 selects a free port
+        simulator: LaPoeSimulator
+            Simulated device, a new one is created if omitted
+        """
+        super().__init__(address, _SimulatorRequestHandler)
+        self.simulator = simulator if simulator is not None else LaPoeSimulator()
+
+    def start(self) -> threading.Thread:
+        """
+        Serve in a background thread
+
+        Returns
+        -------
+        thread: threading.Thread
+            thread running the server
+        """
+        thread = threading.Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+        return thread
@@ -0,0 +1,194 @@
+import concurrent.futures
+import struct
+import sys
+import time
+
+from colors import ColorLookupTable
+from fleet import ConnectionPool, PNS_PORT
+from main import (
+    PNS_SMART_MODE,
+    LaPoeError,
+    PnsDetailStatusData,
+    pns_smart_mode_command,
+    pns_detail_run_control_command,
+    pns_get_detail_data_decode,
+    pns_get_detail_data_frame_command,
+)
+from mirror import detail_run_control_data_from_status
+
+SNAPSHOT_FILE_MAGIC = b'LAPS\x01'
+"""header of a snapshot file (identifier and format version)"""
+
+# entry layout: capture time, device id size, response size (device id and response data follow)
+_SNAPSHOT_ENTRY = struct.Struct('>dBH')
+
+
+def take_snapshot(pool, path: str, devices=None, max_workers: int = 64) -> dict:
+    """
+    Read the detailed status of the devices concurrently and save it to a file
+
+    Parameters
+    ----------
+    pool: ConnectionPool
+        Connections to the devices
+    path: str
+        Snapshot file
+    devices:
+        Device ids, every device of the pool if omitted
+    max_workers: int
+        Maximum number of devices read concurrently
+
+    Returns
+    -------
+    errors: dict
+        exception of each device that could not be read (not in the snapshot)
+    """
+    if devices is None:
+        devices = pool.devices
+    errors = {}
+    with concurrent.futures.ThreadPoolExecutor(max_workers) as executor:
+        futures = {device: executor.submit(pool.run, device, pns_get_detail_data_frame_command) for device in devices}
+        with open(path, 'wb') as f:
+            f.write(SNAPSHOT_FILE_MAGIC)
+            for device, future in futures.items():
+                try:
+                    recv_data = future.result()
+                except Exception as e:
+                    errors[device] = e
+                    continue
+                device_id = device.encode('utf-8')
+                f.write(_SNAPSHOT_ENTRY.pack(time.time(), len(device_id), len(recv_data)) + device_id + recv_data)
+    return errors
+
+
+def load_snapshot(path: str) -> dict:
+    """
+    Read a snapshot file
+
+    Entries whose response data is malformed are skipped, a truncated last entry ends the file
+
+    Parameters
+    ----------
+    path: str
+        Snapshot file
+
+    Returns
+    -------
+    snapshot: dict
+        (capture time, PnsDetailStatusData) of each device id
+    """
+    with open(path, 'rb') as f:
+        data = f.read()
+    if not data.startswith(SNAPSHOT_FILE_MAGIC):
+        raise ValueError('not a snapshot file')
+    snapshot = {}
+    offset = len(SNAPSHOT_FILE_MAGIC)
+    while offset + _SNAPSHOT_ENTRY.size <= len(data):
+        timestamp, device_size, size = _SNAPSHOT_ENTRY.unpack_from(data, offset)
+        offset += _SNAPSHOT_ENTRY.size
+        if offset + device_size + size > len(data):
+            break
+        device = data[offset:offset + device_size].decode('utf-8')
+        offset += device_size
+        try:
+            snapshot[device] = (timestamp, pns_get_detail_data_decode(data[offset:offset + size]))
+        except LaPoeError:
+            pass
+        offset += size
+    return snapshot
+
+
+def restore_command(status: PnsDetailStatusData, color_table=None) -> tuple:
+    """
+    Get the cheapest command reproducing a detailed status
+
+    Parameters
+    ----------
+    status: PnsDetailStatusData
+        Received data of detail status acquisition command
+    color_table: dict
+        RGB per color code or ColorLookupTable used to match the reported RGB, NOMINAL_COLOR_RGB if omitted
+
+    Returns
+    -------
+    command: tuple
+        (command function, arguments): the smart mode command for a device in smart mode,
+        the detailed operation control command otherwise
+    """
+    if status.mode == PNS_SMART_MODE:
+        return pns_smart_mode_command, (status.smart_mode_detail_data.smart_mode_data.group_no,)
+    return pns_detail_run_control_command, (detail_run_control_data_from_status(status, color_table),)
+
+
+def restore_snapshot(pool, path: str, devices=None, max_workers: int = 64, color_table: dict = None,
+                     progress=None) -> dict:
+    """
+    Restore the devices of a snapshot concurrently
+
+    Parameters
+    ----------
+    pool: ConnectionPool
+        Connections to the devices
+    path: str
+        Snapshot file
+    devices:
+        Device ids to restore, every device of the snapshot if omitted
+    max_workers: int
+        Maximum number of devices written concurrently
+    color_table: dict
+        RGB per color code used to match the reported RGB, NOMINAL_COLOR_RGB if omitted
+    progress: callable
+        Called with (device, exception or None, number done, total) as each device completes
+
+    Returns
+    -------
+    results: dict
+        None or the raised exception of each device id, KeyError for a requested device
+        missing from the snapshot (its capture failed)
+    """
+    snapshot = load_snapshot(path)
+    if devices is None:
+        devices = list(snapshot)
+    color_table = ColorLookupTable(color_table)
+    results = {}
+    total = len(devices)
+
+    def done(device: str, error):
+        results[device] = error
+        if progress is not None:
+            progress(device, error, len(results), total)
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers) as executor:
+        futures = {}
+        for device in devices:
+            if device not in snapshot:
+                done(device, KeyError('not in the snapshot: %s' % device))
+                continue
+            command, args = restore_command(snapshot[device][1], color_table)
+            futures[executor.submit(pool.run, device, command, *args)] = device
+        for future in concurrent.futures.as_completed(futures):
+            done(futures[future], future.exception())
+    return results
+
+
+def main():
+    args = sys.argv
+    if len(args) < 4 or args[1] not in ('save', 'restore'):
+        print('usage: snapshot.py save|restore file ip[:port] ...')
+        return
+    pool = ConnectionPool(timeout=2.0)
+    for address in args[3:]:
+        ip, _, port = address.partition(':')
+        pool.add(address, ip, int(port) if port else PNS_PORT)
+    with pool:
+        if args[1] == 'save':
+            for device, error in take_snapshot(pool, args[2]).items():
+                print(device + " : " + str(error))
+        else:
+            def progress(device, error, done, total):
+                print('[%d/%d] %s : %s' % (done, total, device, 'ok' if error is None else error))
+            restore_snapshot(pool, args[2], progress=progress)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,302 @@
+import mmap
+import struct
+import threading
+import time
+
+from main import (
+    PNS_GET_DATA_COMMAND,
+    PNS_GET_DETAIL_DATA_COMMAND,
+    pns_get_data_decode,
+    pns_get_data_frame_command,
+    pns_get_detail_data_decode,
+    pns_get_detail_data_frame_command,
+)
+
+STATUS_TABLE_MAGIC = b'LAPT\x01'
+"""header of a status table file (identifier and format version)"""
+
+STATUS_TABLE_FRAME_SIZE = 64
+"""maximum size of the response data held by a slot"""
+
+# table header: magic, number of slots, slot size
+_TABLE_HEADER = struct.Struct('>5sIH')
+_TABLE_HEADER_SIZE = 64
+
+# slot header: sequence (odd while written), time, command (G/E), device id, response size (response data follows)
+_SLOT_HEADER = struct.Struct('>Id1s32sH')
+_SLOT_SEQUENCE = struct.Struct('>I')
+_SLOT_SIZE = 128
+_READ_RETRIES = 1000
+
+
+class StatusTable:
+    """fixed-layout table in a memory-mapped file holding the last status response of each device"""
+
+    def __init__(self, path: str, slot_count: int = 1024, create: bool = False):
+        """
+        fixed-layout table in a memory-mapped file holding the last status response of each device
+
+        A single writer fills the slots, any number of processes map the same file and read them.
+        Each slot is guarded by a sequence number (seqlock): readers retry while a slot is being written
+
+        Parameters
+        ----------
+        path: str
+            File of the table (a file on /dev/shm stays in memory)
+        slot_count: int
+            Number of devices held by a new table
+        create: bool
+            Create (or reset) the table, otherwise open an existing one
+        """
+        if create:
+            with open(path, 'wb') as f:
+                f.truncate(_TABLE_HEADER_SIZE + slot_count * _SLOT_SIZE)
+                f.write(_TABLE_HEADER.pack(STATUS_TABLE_MAGIC, slot_count, _SLOT_SIZE))
+        self._file = open(path, 'r+b')
+        self._map = mmap.mmap(self._file.fileno(), 0)
+        magic, self._slot_count, slot_size = _TABLE_HEADER.unpack_from(self._map, 0)
+        if magic != STATUS_TABLE_MAGIC or slot_size != _SLOT_SIZE:
+            self.close()
+            raise ValueError('not a status table')
+        self._lock = threading.Lock()
+        self._slots = {}
+        self._sequences = {}
+
+    @property
+    def slot_count(self) -> int:
+        """number of slots"""
+        return self._slot_count
+
+    @property
+    def devices(self) -> list:
+        """device ids holding a slot"""
+        devices = []
+        for slot in range(self._slot_count):
+            device = self._device(slot)
+            if device:
+                devices.append(device)
+        return devices
+
+    def _device(self, slot: int) -> str:
+        offset = _TABLE_HEADER_SIZE + slot * _SLOT_SIZE + 13
+        return bytes(self._map[offset:offset + 32]).rstrip(b'\x00').decode('utf-8', 'replace')
+
+    def _find(self, device: str, allocate: bool) -> int:
+        slot = self._slots.get(device)
+        if slot is not None and self._device(slot) == device:
+            return slot
+        free = None
+        for slot in range(self._slot_count):
+            name = self._device(slot)
+            if name == device:
+                self._slots[device] = slot
+                return slot
+            if not name and free is None:
+                free = slot
+        if not allocate:
+            return None
+        if free is None:
+            raise ValueError('status table full')
+        self._slots[device] = free
+        return free
+
+    def write(self, device: str, recv_data: bytes, command: bytes = PNS_GET_DATA_COMMAND, timestamp: float = None):
+        """
+        Store the response of a device (single writer)
+
+        Parameters
+        ----------
+        device: str
+            Device id (32 bytes of UTF-8 at most)
+        recv_data: bytes
+            Response data of the get status (G) or get detail status (E) command
+        command: bytes
+            Command identifier of the response (G or E)
+        timestamp: float
+            Time of the response, now if omitted
+        """
+        if len(recv_data) > STATUS_TABLE_FRAME_SIZE:
+            raise ValueError('response data too long')
+        device_id = device.encode('utf-8')
+        if len(device_id) > 32:
+            raise ValueError('device id too long')
+        if timestamp is None:
+            timestamp = time.time()
+        with self._lock:
+            slot = self._find(device, True)
+            offset = _TABLE_HEADER_SIZE + slot * _SLOT_SIZE
+            sequence = self._sequences.get(slot)
+            if sequence is None:
+                sequence = _SLOT_SEQUENCE.unpack_from(self._map, offset)[0] & ~1
+            # odd sequence: readers retry until the slot is consistent
+            _SLOT_SEQUENCE.pack_into(self._map, offset, (sequence + 1) & 0xFFFFFFFF)
+            _SLOT_HEADER.pack_into(self._map, offset, (sequence + 1) & 0xFFFFFFFF, timestamp, command, device_id,
+                                   len(recv_data))
+            self._map[offset + _SLOT_HEADER.size:offset + _SLOT_HEADER.size + len(recv_data)] = recv_data
+            sequence = (sequence + 2) & 0xFFFFFFFF
+            _SLOT_SEQUENCE.pack_into(self._map, offset, sequence)
+            self._sequences[slot] = sequence
+
+    def remove(self, device: str):
+        """
+        Free the slot of a device (single writer)
+
+        Parameters
+        ----------
+        device: str
+            Device id
+        """
+        with self._lock:
+            slot = self._find(device, False)
+            if slot is None:
+                return
+            offset = _TABLE_HEADER_SIZE + slot * _SLOT_SIZE
+            sequence = _SLOT_SEQUENCE.unpack_from(self._map, offset)[0] & ~1
+            _SLOT_SEQUENCE.pack_into(self._map, offset, (sequence + 1) & 0xFFFFFFFF)
+            self._map[offset + 4:offset + _SLOT_SIZE] = bytes(_SLOT_SIZE - 4)
+            sequence = (sequence + 2) & 0xFFFFFFFF
+            _SLOT_SEQUENCE.pack_into(self._map, offset, sequence)
+            self._sequences[slot] = sequence
+            del self._slots[device]
+
+    def read(self, device: str) -> tuple:
+        """
+        Read the raw response of a device
+
+        Parameters
+        ----------
+        device: str
+            Device id
+
+        Returns
+        -------
+        entry: tuple
+            (response data, command identifier, time), None if the device has no consistent slot
+        """
+        slot = self._find(device, False)
+        if slot is None:
+            return None
+        offset = _TABLE_HEADER_SIZE + slot * _SLOT_SIZE
+        for _ in range(_READ_RETRIES):
+            sequence, timestamp, command, device_id, size = _SLOT_HEADER.unpack_from(self._map, offset)
+            if sequence & 1:
+                time.sleep(0)
+                continue
+            recv_data = self._map[offset + _SLOT_HEADER.size:offset + _SLOT_HEADER.size + size]
+            if _SLOT_SEQUENCE.unpack_from(self._map, offset)[0] != sequence:
+                continue
+            if device_id.rstrip(b'\x00').decode('utf-8') != device:
+                # the slot was freed and reused meanwhile
+                return None
+            return recv_data, command, timestamp
+        # the writer stopped in the middle of the slot
+        return None
+
+    def status(self, device: str):
+        """
+        Decode the last status of a device
+
+        Parameters
+        ----------
+        device: str
+            Device id
+
+        Returns
+        -------
+        status: PnsStatusData or PnsDetailStatusData
+            decoded status depending on the command written, None if the device has no slot
+        """
+        entry = self.read(device)
+        if entry is None:
+            return None
+        recv_data, command, _ = entry
+        if command == PNS_GET_DETAIL_DATA_COMMAND:
+            return pns_get_detail_data_decode(recv_data)
+        return pns_get_data_decode(recv_data)
+
+    def close(self):
+        """
+        Unmap the table.
+        """
+        self._map.close()
+        self._file.close()
+
+    def __enter__(self) -> 'StatusTable':
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class StatusTablePoller:
+    """single poller filling a status table for local consumers"""
+
+    def __init__(self, pool, table: StatusTable, interval: float = 0.5, detail: bool = False):
+        """
+        single poller filling a status table for local consumers
+
+        Parameters
+        ----------
+        pool: ConnectionPool
+            Connections to the devices, every device of the pool is polled
+        table: StatusTable
+            Table written
+        interval: float
+            Poll interval in seconds
+        detail: bool
+            Poll with the get detail status command (E) instead of the get status command (G)
+        """
+        self._pool = pool
+        self._table = table
+        self._interval = interval
+        self._detail = detail
+        self._errors = {}
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def errors(self) -> dict:
+        """last error of each device whose last poll failed or found no free slot in the table"""
+        return dict(self._errors)
+
+    def poll_once(self):
+        """
+        Poll every device of the pool once and write the responses
+        """
+        if self._detail:
+            command, read = PNS_GET_DETAIL_DATA_COMMAND, pns_get_detail_data_frame_command
+        else:
+            command, read = PNS_GET_DATA_COMMAND, pns_get_data_frame_command
+        for device in self._pool.devices:
+            try:
+                recv_data = self._pool.run(device, read)
+                # raises ValueError when no slot is left for a new device
+                self._table.write(device, recv_data, command)
+            except Exception as e:
+                self._errors[device] = e
+                continue
+            self._errors.pop(device, None)
+
+    def start(self):
+        """
+        Start polling in a background thread
+        """
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stop polling
+        """
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _loop(self):
+        while True:
+            started = time.monotonic()
+            self.poll_once()
+            if self._stop.wait(max(0.0, self._interval - (time.monotonic() - started))):
+                return
@@ -0,0 +1,315 @@
+import asyncio
+import typing
+
+from main import (
+    LaPoeTimeoutError,
+    LaPoeConnectionError,
+    pns_response_decode,
+    pns_smart_mode_encode,
+    pns_smart_mode_command,
+    pns_mute_encode,
+    pns_mute_command,
+    pns_stop_pulse_input_encode,
+    pns_stop_pulse_input_command,
+    pns_run_control_encode,
+    pns_run_control_command,
+    pns_detail_run_control_encode,
+    pns_detail_run_control_command,
+    pns_clear_encode,
+    pns_clear_command,
+    pns_reboot_encode,
+    pns_reboot_command,
+    pns_get_data_encode,
+    pns_get_data_decode,
+    pns_get_data_command,
+    pns_get_detail_data_encode,
+    pns_get_detail_data_decode,
+    pns_get_detail_data_command,
+    phn_write_encode,
+    phn_write_decode,
+    phn_write_command,
+    phn_read_encode,
+    phn_read_decode,
+    phn_read_command,
+)
+from recorder import RECORD_DIRECTION_SEND, RECORD_DIRECTION_RECV
+
+COMMAND_CODECS = {
+    pns_smart_mode_command: (pns_smart_mode_encode, pns_response_decode),
+    pns_mute_command: (pns_mute_encode, pns_response_decode),
+    pns_stop_pulse_input_command: (pns_stop_pulse_input_encode, pns_response_decode),
+    pns_run_control_command: (pns_run_control_encode, pns_response_decode),
+    pns_detail_run_control_command: (pns_detail_run_control_encode, pns_response_decode),
+    pns_clear_command: (pns_clear_encode, pns_response_decode),
+    pns_reboot_command: (pns_reboot_encode, pns_response_decode),
+    pns_get_data_command: (pns_get_data_encode, pns_get_data_decode),
+    pns_get_detail_data_command: (pns_get_detail_data_encode, pns_get_detail_data_decode),
+    phn_write_command: (phn_write_encode, phn_write_decode),
+    phn_read_command: (phn_read_encode, phn_read_decode),
+}
+"""(encode, decode) functions of each command function of main.py"""
+
+
+class Transport(typing.Protocol):
+    """
+    transport accepted as sock by the command functions of main.py
+
+    socket.socket, ModbusTransport, HttpTransport and the transports of this module implement it
+    """
+
+    def send(self, data: bytes) -> int:
+        ...
+
+    def recv(self, bufsize: int) -> bytes:
+        ...
+
+    def getpeername(self) -> tuple:
+        ...
+
+
+class LoopbackTransport:
+    """in-memory transport answering commands with a function"""
+
+    def __init__(self, handler, peername: tuple = ('loopback', 0)):
+        """
+        in-memory transport answering commands with a function
+
+        Parameters
+        ----------
+        handler: callable
+            Called with each command frame, returns the response data (LaPoeSimulator.handle, ...)
+        peername: tuple
+            Address reported by getpeername
+        """
+        self._handler = handler
+        self._peername = peername
+        self._response = b''
+
+    def send(self, data: bytes) -> int:
+        """
+        Send a command frame
+
+        Parameters
+        ----------
+        data: bytes
+            command frame
+
+        Returns
+        -------
+        size: int
+            number of bytes sent
+        """
+        self._response = self._handler(data)
+        return len(data)
+
+    def recv(self, bufsize: int) -> bytes:
+        """
+        Receive the response of the last command
+
+        Parameters
+        ----------
+        bufsize: int
+            Maximum number of bytes
+
+        Returns
+        -------
+        recv_data: bytes
+            response data, the same object returned by the handler when it fits
+        """
+        response, self._response = self._response, b''
+        if len(response) > bufsize:
+            return response[:bufsize]
+        return response
+
+    def getpeername(self) -> tuple:
+        """
+        Get the address of the device
+
+        Returns
+        -------
+        address: tuple
+            address given to the constructor
+        """
+        return self._peername
+
+
+class RecordingTransport:
+    """transport capturing the frames of another transport"""
+
+    def __init__(self, transport, recorder, device: str = None):
+        """
+        transport capturing the frames of another transport
+
+        Parameters
+        ----------
+        transport: Transport
+            Transport carrying the frames
+        recorder: Recorder
+            Recorder receiving the frames
+        device: str
+            Device id of the records, the address of the transport if omitted
+        """
+        self._transport = transport
+        self._recorder = recorder
+        self._device = device if device is not None else '%s:%d' % tuple(transport.getpeername()[:2])
+
+    def send(self, data: bytes) -> int:
+        """
+        Send and record a command frame
+
+        Parameters
+        ----------
+        data: bytes
+            command frame
+
+        Returns
+        -------
+        size: int
+            number of bytes sent
+        """
+        self._recorder.record(RECORD_DIRECTION_SEND, self._device, data)
+        return self._transport.send(data)
+
+    def recv(self, bufsize: int) -> bytes:
+        """
+        Receive and record response data
+
+        Parameters
+        ----------
+        bufsize: int
+            Maximum number of bytes
+
+        Returns
+        -------
+        recv_data: bytes
+            response data
+        """
+        data = self._transport.recv(bufsize)
+        self._recorder.record(RECORD_DIRECTION_RECV, self._device, data)
+        return data
+
+    def getpeername(self) -> tuple:
+        """
+        Get the address of the device
+
+        Returns
+        -------
+        address: tuple
+            address of the wrapped transport
+        """
+        return self._transport.getpeername()
+
+
+class AsyncTransport:
+    """asyncio transport to an LA-POE"""
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """
+        asyncio transport to an LA-POE, use AsyncTransport.open to connect
+
+        Parameters
+        ----------
+        reader: asyncio.StreamReader
+            Stream reading the responses
+        writer: asyncio.StreamWriter
+            Stream writing the commands
+        """
+        self._reader = reader
+        self._writer = writer
+        self._lock = asyncio.Lock()
+
+    @classmethod
+    async def open(cls, ip: str, port: int, timeout: float = None) -> 'AsyncTransport':
+        """
+        Connect to LA-POE
+
+        Parameters
+        ----------
+        ip: str
+            IP address
+        port: int
+            port number
+        timeout: float
+            Connect timeout in seconds, no timeout if omitted
+
+        Returns
+        -------
+        transport: AsyncTransport
+            connected transport
+        """
+        reader, writer = await asyncio.wait_for(asyncio.open_connection(ip, port), timeout)
+        return cls(reader, writer)
+
+    async def exchange(self, send_data: bytes, timeout: float = None) -> bytes:
+        """
+        Send a command frame and receive its response
+
+        Parameters
+        ----------
+        send_data: bytes
+            command frame
+        timeout: float
+            Response timeout in seconds, no timeout if omitted
+
+        Returns
+        -------
+        recv_data: bytes
+            response data
+        """
+        async with self._lock:
+            try:
+                self._writer.write(send_data)
+                recv_data = await asyncio.wait_for(self._reader.read(1024), timeout)
+            except asyncio.TimeoutError as e:
+                raise LaPoeTimeoutError('no response') from e
+            except ConnectionError as e:
+                raise LaPoeConnectionError(str(e)) from e
+        if not recv_data:
+            raise LaPoeConnectionError('connection closed')
+        return recv_data
+
+    def getpeername(self) -> tuple:
+        """
+        Get the address of the device
+
+        Returns
+        -------
+        address: tuple
+            (IP address, port number)
+        """
+        return self._writer.get_extra_info('peername')
+
+    async def close(self):
+        """
+        Close the connection.
+        """
+        self._writer.close()
+        try:
+            await self._writer.wait_closed()
+        except OSError:
+            pass
+
+
+async def async_run(transport: AsyncTransport, command, *args, timeout: float = None):
+    """
+    Send a command through an asyncio transport
+
+    Parameters
+    ----------
+    transport: AsyncTransport
+        Connected transport
+    command: callable
+        Command function of main.py (pns_get_detail_data_command, ...)
+    args:
+        Arguments of the command other than sock
+    timeout: float
+        Response timeout in seconds, no timeout if omitted
+
+    Returns
+    -------
+    result:
+        return value of the command
+    """
+    encode, decode = COMMAND_CODECS[command]
+    recv_data = await transport.exchange(encode(*args), timeout)
+    return decode(recv_data)
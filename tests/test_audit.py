@@ -0,0 +1,88 @@
+import sqlite3
+import time
+
+import pytest
+
+import main
+from audit import AUDIT_POLICY_BLOCK, AuditLog, audit_actor
+from fleet import ConnectionPool
+from main import (
+    PnsRunControlData,
+    pns_get_data_command,
+    pns_reboot_command,
+    pns_run_control_command,
+    pns_run_control_encode,
+)
+from simulator import LaPoeSimulator, SimulatorServer
+
+
+@pytest.fixture
+def pool():
+    server = SimulatorServer(('127.0.0.1', 0), LaPoeSimulator(password='secret'))
+    server.start()
+    pool = ConnectionPool(timeout=2.0)
+    pool.add('lamp', *server.server_address)
+    yield pool
+    pool.close()
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def log(tmp_path):
+    log = AuditLog(str(tmp_path / 'audit.db'), interval=0.05)
+    main.set_auditor(log)
+    yield log
+    main.set_auditor(None)
+    log.close()
+
+
+def test_changes_are_audited_with_their_actor(pool, log):
+    with audit_actor('operator'):
+        pool.run('lamp', pns_run_control_command, PnsRunControlData(1, 0, 0, 0, 0, 0))
+    pool.run('lamp', pns_get_data_command)
+    log.flush()
+    records = log.query()
+    assert [(record.verb, record.actor) for record in records] == [('S', 'operator')]
+    assert records[0].frame == pns_run_control_encode(PnsRunControlData(1, 0, 0, 0, 0, 0))
+    assert records[0].error is None
+
+
+def test_reboot_password_is_not_logged(pool, log):
+    pool.run('lamp', pns_reboot_command, 'secret')
+    log.flush()
+    record = log.query()[0]
+    assert record.verb == 'B'
+    assert b'secret' not in record.frame
+    # header with the data length
+    assert record.frame == b'ABB\x00\x00\x06'
+
+
+def test_drop_policy_counts_the_records_of_a_full_queue(tmp_path):
+    path = str(tmp_path / 'audit.db')
+    log = AuditLog(path, maxsize=2, interval=0.01)
+    blocker = sqlite3.connect(path, isolation_level=None)
+    try:
+        # the writer waits for the lock with its first record, the queue fills up
+        blocker.execute('BEGIN EXCLUSIVE')
+        log.audit('lamp', b'W\x01', b'\x06', None, 0.001)
+        time.sleep(0.1)
+        for _ in range(10):
+            log.audit('lamp', b'W\x01', b'\x06', None, 0.001)
+        assert log.dropped == 8
+    finally:
+        blocker.execute('COMMIT')
+        blocker.close()
+    log.flush()
+    assert len(log.query()) == 3
+    log.close()
+
+
+def test_closed_log_does_not_block(tmp_path):
+    log = AuditLog(str(tmp_path / 'audit.db'), maxsize=1, policy=AUDIT_POLICY_BLOCK, interval=0.01)
+    log.close()
+    started = time.monotonic()
+    for _ in range(3):
+        log.audit('lamp', b'W\x01', b'\x06', None, 0.001)
+    assert time.monotonic() - started < 1.0
+    assert log.dropped == 3
@@ -0,0 +1,122 @@
+import json
+import queue
+import threading
+import time
+
+import pytest
+
+from bridge import BrokerClient, BrokerStandInServer, StatusBridge, topic_matches
+from fleet import ConnectionPool
+from main import pns_get_data_command
+from simulator import SimulatorServer
+
+
+@pytest.fixture
+def device():
+    server = SimulatorServer(('127.0.0.1', 0))
+    server.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def pool(device):
+    pool = ConnectionPool(timeout=2.0)
+    pool.add('lamp', *device.server_address)
+    yield pool
+    pool.close()
+
+
+@pytest.fixture
+def broker():
+    server = BrokerStandInServer(('127.0.0.1', 0))
+    server.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def client(broker):
+    client = BrokerClient(broker.server_address)
+    yield client
+    client.close()
+
+
+def subscribe(client, pattern):
+    messages = queue.Queue()
+    client.subscribe(pattern, lambda topic, payload: messages.put((topic, json.loads(payload))))
+    return messages
+
+
+def test_topic_matches():
+    assert topic_matches('lapoe/+/status/#', 'lapoe/lamp/status/led1')
+    assert topic_matches('lapoe/#', 'lapoe')
+    assert not topic_matches('lapoe/+/status/+', 'lapoe/lamp/status')
+    assert not topic_matches('lapoe/+/command/+', 'lapoe/lamp/status/mode')
+
+
+def test_status_round_trip(pool, client):
+    messages = subscribe(client, 'lapoe/+/status/#')
+    bridge = StatusBridge(pool, client)
+    bridge.start()
+    try:
+        changed = bridge.update('lamp', pool.run('lamp', pns_get_data_command))
+        received = dict(messages.get(timeout=2.0) for _ in changed)
+        assert received['lapoe/lamp/status/mode'] == 0
+        assert received['lapoe/lamp/status/input'] == [0] * 8
+        # an unchanged status publishes nothing
+        assert bridge.update('lamp', pool.run('lamp', pns_get_data_command)) == []
+    finally:
+        bridge.stop()
+
+
+def test_command_round_trip(device, pool, client):
+    results = subscribe(client, 'lapoe/+/result/+')
+    bridge = StatusBridge(pool, client)
+    bridge.start()
+    try:
+        client.publish([('lapoe/lamp/command/run_control', json.dumps([1, 2, 0, 0, 1, 3]).encode('utf-8'))])
+        assert results.get(timeout=2.0) == ('lapoe/lamp/result/run_control', {'error': None})
+        assert device.simulator.led_patterns == (1, 2, 0, 0, 1)
+
+        client.publish([('lapoe/lamp/command/mute', b'"x"')])
+        topic, result = results.get(timeout=2.0)
+        assert topic == 'lapoe/lamp/result/mute'
+        assert result['error'].startswith('invalid arguments')
+    finally:
+        bridge.stop()
+
+
+class _FailingBroker:
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.attempts = 0
+
+    def subscribe(self, pattern, callback):
+        pass
+
+    def unsubscribe(self, pattern, callback):
+        pass
+
+    def publish(self, messages):
+        with self.lock:
+            self.attempts += 1
+        raise ConnectionError('broker down')
+
+
+def test_failing_broker_backs_off(pool):
+    broker = _FailingBroker()
+    errors = []
+    bridge = StatusBridge(pool, broker, batch_size=2, interval=0.01, max_retry_delay=0.1, on_error=errors.append)
+    bridge.update('lamp', pool.run('lamp', pns_get_data_command))
+    bridge.start()
+    time.sleep(0.5)
+    bridge.stop()
+    # 0.01 + 0.02 + 0.04 + 0.08 + 0.1 ... about 8 attempts in 0.5 s (and one by stop), not a busy loop
+    assert 2 <= broker.attempts <= 15
+    assert len(errors) == broker.attempts
+    # the messages are kept for the next publish
+    assert bridge.pending > 2
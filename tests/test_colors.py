@@ -0,0 +1,59 @@
+import random
+
+import pytest
+
+import colors
+from colors import NOMINAL_COLOR_RGB, ColorLookupTable, calibrate_color_table, nearest_detail_color
+from main import (
+    PNS_DETAIL_RUN_CONTROL_LED_COLOR_BLUE,
+    PNS_DETAIL_RUN_CONTROL_LED_COLOR_RED,
+    PNS_DETAIL_RUN_CONTROL_LED_COLOR_YELLOW,
+    PNS_DETAIL_RUN_CONTROL_LED_OFF,
+    PnsDetailRunControlData,
+    pns_detail_run_control_encode,
+    pns_get_detail_data_decode,
+    pns_get_detail_data_encode,
+)
+from simulator import LaPoeSimulator
+
+# towers x LED units x RGB
+FLEET_FRAME = [[[random.Random(tower * 5 + unit).randrange(256) for _ in range(3)] for unit in range(5)]
+               for tower in range(20)]
+
+
+def test_nearest():
+    table = ColorLookupTable()
+    assert table.nearest(250, 10, 5) == PNS_DETAIL_RUN_CONTROL_LED_COLOR_RED
+    assert table.nearest(240, 120, 10) == PNS_DETAIL_RUN_CONTROL_LED_COLOR_YELLOW
+    assert table.nearest(3, 2, 1) == PNS_DETAIL_RUN_CONTROL_LED_OFF
+    assert nearest_detail_color(10, 10, 240) == PNS_DETAIL_RUN_CONTROL_LED_COLOR_BLUE
+    # a plain dict and the lookup table agree
+    for rgb in FLEET_FRAME[0]:
+        assert nearest_detail_color(*rgb, NOMINAL_COLOR_RGB) == table.nearest(*rgb)
+
+
+def test_nearest_many_with_numpy():
+    numpy = pytest.importorskip('numpy')
+    table = ColorLookupTable()
+    result = table.nearest_many(numpy.array(FLEET_FRAME))
+    assert result.shape == (20, 5)
+    assert result.dtype == numpy.uint8
+    assert result.tolist() == [[table.nearest(*rgb) for rgb in tower] for tower in FLEET_FRAME]
+
+
+def test_nearest_many_without_numpy(monkeypatch):
+    monkeypatch.setattr(colors, 'numpy', None)
+    table = ColorLookupTable()
+    assert table.nearest_many(FLEET_FRAME) == [[table.nearest(*rgb) for rgb in tower] for tower in FLEET_FRAME]
+    assert table.nearest_many([255, 0, 0]) == PNS_DETAIL_RUN_CONTROL_LED_COLOR_RED
+
+
+def test_calibrated_table():
+    simulator = LaPoeSimulator()
+    sent = PnsDetailRunControlData(PNS_DETAIL_RUN_CONTROL_LED_COLOR_RED, 0, 0, 0, 0, 0, 0)
+    simulator.handle(pns_detail_run_control_encode(sent))
+    status = pns_get_detail_data_decode(simulator.handle(pns_get_detail_data_encode()))
+    color_table = calibrate_color_table(status, sent)
+    unit = status.led_mode_detail_data.led_unit1_data
+    assert color_table[PNS_DETAIL_RUN_CONTROL_LED_COLOR_RED] == (unit.red, unit.green, unit.blue)
+    assert ColorLookupTable(color_table).color_table == color_table
@@ -0,0 +1,121 @@
+import threading
+import time
+
+import pytest
+
+from command_queue import COMMAND_PRIORITY_POLL, CommandQueue
+from fleet import ConnectionPool
+from main import (
+    PnsRunControlData,
+    pns_clear_command,
+    pns_get_data_command,
+    pns_mute_command,
+    pns_run_control_command,
+    pns_smart_mode_command,
+)
+from simulator import SimulatorServer
+
+
+@pytest.fixture
+def device():
+    server = SimulatorServer(('127.0.0.1', 0))
+    server.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+class _RecordingPool:
+
+    def __init__(self, pool):
+        self.pool = pool
+        self.lock = threading.Lock()
+        self.sent = []
+
+    def run(self, device, command, *args):
+        with self.lock:
+            self.sent.append((device, command.__name__, time.monotonic()))
+        return self.pool.run(device, command, *args)
+
+
+@pytest.fixture
+def pool(device):
+    pool = ConnectionPool(timeout=2.0)
+    pool.add('lamp', *device.server_address)
+    pool.add('other', *device.server_address)
+    yield _RecordingPool(pool)
+    pool.close()
+
+
+def test_rate_limit(pool):
+    queue = CommandQueue(pool, rate=20.0, burst=1.0)
+    try:
+        start = time.monotonic()
+        futures = [queue.submit('lamp', pns_mute_command, i % 2) for i in range(5)]
+        for future in futures:
+            future.result(timeout=2.0)
+        # one command back to back, then one every 0.05 s
+        assert time.monotonic() - start >= 0.19
+        assert queue.pending('lamp') == 0
+    finally:
+        queue.close()
+
+
+def test_lanes_and_supersede(device, pool):
+    queue = CommandQueue(pool, rate=10.0, burst=1.0)
+    try:
+        # the first command takes the token, the others wait in their lanes
+        first = queue.submit('lamp', pns_mute_command, 1)
+        first.result(timeout=2.0)
+        poll = queue.submit('lamp', pns_get_data_command)
+        write = queue.submit('lamp', pns_run_control_command, PnsRunControlData(1, 0, 0, 0, 0, 0))
+        smart = queue.submit('lamp', pns_smart_mode_command, 2)
+        clear = queue.submit('lamp', pns_clear_command)
+        assert queue.pending('lamp') == 3
+        for future in (poll, write, smart, clear):
+            future.result(timeout=2.0)
+
+        # the clear replaced the queued smart mode command and took the urgent lane
+        assert [command for _, command, _ in pool.sent] == [
+            'pns_mute_command', 'pns_clear_command', 'pns_run_control_command', 'pns_get_data_command']
+        assert smart.result() is clear.result()
+        assert device.simulator.led_patterns == (1, 0, 0, 0, 0)
+    finally:
+        queue.close()
+
+
+def test_priority_override(pool):
+    queue = CommandQueue(pool, rate=10.0, burst=1.0)
+    try:
+        first = queue.submit('lamp', pns_mute_command, 1)
+        later = queue.submit('lamp', pns_mute_command, 0, priority=COMMAND_PRIORITY_POLL)
+        sooner = queue.submit('lamp', pns_get_data_command, priority=0)
+        for future in (first, later, sooner):
+            future.result(timeout=2.0)
+        assert [command for _, command, _ in pool.sent] == [
+            'pns_mute_command', 'pns_get_data_command', 'pns_mute_command']
+    finally:
+        queue.close()
+
+
+def test_waiting_device_does_not_hold_the_worker(pool):
+    queue = CommandQueue(pool, rate=1.0, burst=1.0, max_workers=1)
+    try:
+        queue.submit('lamp', pns_mute_command, 1).result(timeout=2.0)
+        waiting = queue.submit('lamp', pns_mute_command, 0)
+        other = queue.submit('other', pns_mute_command, 1)
+        # the only worker serves the other device while the lamp waits about 1 s for its token
+        other.result(timeout=0.5)
+        assert not waiting.done()
+        waiting.result(timeout=2.0)
+    finally:
+        queue.close()
+
+
+def test_failure_is_set_on_the_future(pool):
+    queue = CommandQueue(pool)
+    try:
+        with pytest.raises(KeyError):
+            queue.submit('unknown', pns_clear_command).result(timeout=2.0)
+    finally:
+        queue.close()
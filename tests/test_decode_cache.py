@@ -0,0 +1,55 @@
+import pytest
+
+from main import (
+    PNS_NAK,
+    LaPoeNakError,
+    decode_cache_info,
+    pns_get_data_decode,
+    pns_get_data_encode,
+    pns_get_detail_data_decode,
+    pns_get_detail_data_encode,
+    set_decode_cache,
+)
+from simulator import LaPoeSimulator
+
+
+@pytest.fixture
+def cache():
+    set_decode_cache(4)
+    yield
+    set_decode_cache(None)
+
+
+def test_identical_responses_share_the_status(cache):
+    simulator = LaPoeSimulator()
+    recv_data = simulator.handle(pns_get_data_encode())
+    status = pns_get_data_decode(recv_data)
+    assert pns_get_data_decode(bytearray(recv_data)) is status
+    assert decode_cache_info().hits == 1
+
+    simulator.set_input(1, True)
+    changed = pns_get_data_decode(simulator.handle(pns_get_data_encode()))
+    assert changed is not status
+    assert changed.input[0] == 1
+    assert decode_cache_info().misses == 2
+
+
+def test_status_classes_are_cached_apart(cache):
+    simulator = LaPoeSimulator()
+    status = pns_get_data_decode(simulator.handle(pns_get_data_encode()))
+    detail = pns_get_detail_data_decode(simulator.handle(pns_get_detail_data_encode()))
+    assert type(detail) is not type(status)
+    assert pns_get_detail_data_decode(simulator.handle(pns_get_detail_data_encode())) is detail
+
+
+def test_errors_are_not_cached(cache):
+    for _ in range(2):
+        with pytest.raises(LaPoeNakError):
+            pns_get_data_decode(bytes([PNS_NAK]))
+    assert decode_cache_info().currsize == 0
+
+
+def test_disabled_cache():
+    assert decode_cache_info() is None
+    recv_data = LaPoeSimulator().handle(pns_get_data_encode())
+    assert pns_get_data_decode(recv_data) is not pns_get_data_decode(recv_data)
@@ -0,0 +1,68 @@
+import asyncio
+
+import pytest
+
+from discovery import Inventory, InventoryEntry, format_mac_address, probe, scan
+from fleet import ConnectionPool
+from main import pns_clear_command
+from simulator import LaPoeSimulator, SimulatorServer
+
+MAC = b'\x00\x0a\x0b\x0c\x0d\x0e'
+
+
+@pytest.fixture
+def device():
+    server = SimulatorServer(('127.0.0.1', 0), LaPoeSimulator(mac_address=MAC))
+    server.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_format_mac_address():
+    assert format_mac_address(MAC) == '00-0a-0b-0c-0d-0e'
+
+
+def test_probe(device):
+    entry = asyncio.run(probe(*device.server_address))
+    assert (entry.mac, entry.ip, entry.port) == ('00-0a-0b-0c-0d-0e',) + device.server_address
+
+
+def test_probe_without_tower():
+    server = SimulatorServer(('127.0.0.1', 0))
+    port = server.server_address[1]
+    server.server_close()
+    assert asyncio.run(probe('127.0.0.1', port, 0.2)) is None
+
+
+def test_scan(device):
+    entries = asyncio.run(scan('127.0.0.1/32', device.server_address[1]))
+    assert [entry.mac for entry in entries] == ['00-0a-0b-0c-0d-0e']
+
+
+def test_inventory_tracks_moves_and_re_leases():
+    inventory = Inventory()
+    a = InventoryEntry('00-00-00-00-00-0a', '10.0.0.1', 10000, 1.0)
+    b = InventoryEntry('00-00-00-00-00-0b', '10.0.0.2', 10000, 1.0)
+    assert inventory.update([a, b]) == {'added': [a, b], 'moved': []}
+    assert inventory.by_mac('00:00:00:00:00:0A') is a
+
+    # a moves to a new address, then its old address is re-leased to c
+    moved_a = InventoryEntry(a.mac, '10.0.0.3', 10000, 2.0)
+    assert inventory.update([moved_a]) == {'added': [], 'moved': [(a, moved_a)]}
+    assert inventory.by_ip('10.0.0.1') is None
+    c = InventoryEntry('00-00-00-00-00-0c', '10.0.0.2', 10000, 3.0)
+    inventory.update([c])
+    assert inventory.by_mac(b.mac) is None
+    assert inventory.by_ip('10.0.0.2') is c
+
+    assert inventory.missing(['10.0.0.2', '10.0.0.3'], [c]) == [moved_a]
+
+
+def test_register(device):
+    inventory = Inventory()
+    inventory.update(asyncio.run(scan('127.0.0.1/32', device.server_address[1])))
+    with ConnectionPool(timeout=2.0) as pool:
+        inventory.register(pool)
+        assert pool.devices == ['00-0a-0b-0c-0d-0e']
+        pool.run('00-0a-0b-0c-0d-0e', pns_clear_command)
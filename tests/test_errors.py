@@ -0,0 +1,118 @@
+import socket
+
+import pytest
+
+from main import (
+    PNS_ACK,
+    PNS_NAK,
+    LaPoeConnectionError,
+    LaPoeError,
+    LaPoeFrameError,
+    LaPoeNakError,
+    LaPoeTimeoutError,
+    pns_clear_command,
+    pns_get_data_command,
+    pns_reboot_command,
+    pns_stop_pulse_input_command,
+)
+from retry import DEFAULT_RETRY_POLICY, NO_RETRY, RetryPolicy, retry_policy
+
+
+@pytest.fixture
+def sockets():
+    client, device = socket.socketpair()
+    client.settimeout(0.2)
+    yield client, device
+    client.close()
+    device.close()
+
+
+def test_nak(sockets):
+    client, device = sockets
+    device.send(bytes([PNS_NAK]))
+    with pytest.raises(LaPoeNakError):
+        pns_clear_command(client)
+
+
+def test_unexpected_response(sockets):
+    client, device = sockets
+    device.send(b'\x00')
+    with pytest.raises(LaPoeFrameError):
+        pns_clear_command(client)
+
+
+def test_short_response(sockets):
+    client, device = sockets
+    device.send(bytes([PNS_ACK, 0]))
+    with pytest.raises(LaPoeFrameError):
+        pns_get_data_command(client)
+
+
+def test_no_response(sockets):
+    client, device = sockets
+    with pytest.raises(LaPoeTimeoutError):
+        pns_clear_command(client)
+
+
+def test_connection_closed(sockets):
+    client, device = sockets
+    device.close()
+    with pytest.raises(LaPoeConnectionError):
+        pns_clear_command(client)
+
+
+def test_hierarchy():
+    # callers catching the built-in types keep working
+    assert issubclass(LaPoeNakError, ValueError)
+    assert issubclass(LaPoeFrameError, ValueError)
+    assert issubclass(LaPoeTimeoutError, TimeoutError)
+    assert issubclass(LaPoeConnectionError, ConnectionError)
+    for error in (LaPoeNakError, LaPoeFrameError, LaPoeTimeoutError, LaPoeConnectionError):
+        assert issubclass(error, LaPoeError)
+
+
+class _Flaky:
+
+    def __init__(self, errors):
+        self.errors = list(errors)
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return 'ok'
+
+
+def test_transient_errors_are_retried():
+    policy = RetryPolicy(attempts=3, base_delay=0.001)
+    function = _Flaky([LaPoeTimeoutError(), LaPoeFrameError()])
+    assert policy.call(function) == 'ok'
+    assert function.calls == 3
+
+    function = _Flaky([LaPoeConnectionError()] * 3)
+    with pytest.raises(LaPoeConnectionError):
+        policy.call(function)
+    assert function.calls == 3
+
+
+def test_nak_is_not_retried():
+    function = _Flaky([LaPoeNakError()])
+    with pytest.raises(LaPoeNakError):
+        RetryPolicy(base_delay=0.001).call(function)
+    assert function.calls == 1
+
+
+def test_policies():
+    assert retry_policy(pns_clear_command) is DEFAULT_RETRY_POLICY
+    assert retry_policy(pns_reboot_command) is NO_RETRY
+    assert retry_policy(pns_stop_pulse_input_command) is NO_RETRY
+    assert retry_policy(print) is NO_RETRY
+    assert retry_policy(pns_clear_command, {}) is NO_RETRY
+    with pytest.raises(ValueError):
+        RetryPolicy(attempts=0)
+
+
+def test_delay_is_capped():
+    policy = RetryPolicy(base_delay=0.1, max_delay=0.3)
+    assert all(0.0 <= policy.delay(retry) <= 0.3 for retry in range(10) for _ in range(20))
@@ -0,0 +1,65 @@
+import os
+import time
+
+import pytest
+
+pyarrow = pytest.importorskip('pyarrow')
+import pyarrow.parquet  # noqa: E402
+
+from export import StatusExporter, export_capture  # noqa: E402
+from main import (  # noqa: E402
+    pns_get_data_decode,
+    pns_get_data_encode,
+    pns_get_detail_data_decode,
+    pns_get_detail_data_encode,
+)
+from recorder import Recorder  # noqa: E402
+from simulator import LaPoeSimulator  # noqa: E402
+
+SIMULATOR = LaPoeSimulator()
+STATUS = pns_get_data_decode(SIMULATOR.handle(pns_get_data_encode()))
+DETAIL = pns_get_detail_data_decode(SIMULATOR.handle(pns_get_detail_data_encode()))
+
+
+def rows(files: list) -> list:
+    return [pyarrow.parquet.read_table(path).num_rows for path in files]
+
+
+def test_row_groups_and_file_rows(tmp_path):
+    with StatusExporter(str(tmp_path), row_group_size=2, file_rows=4) as exporter:
+        for i in range(9):
+            exporter.write('lamp%d' % (i % 2), STATUS if i % 3 else DETAIL, 1700000000.0 + i)
+    assert rows(exporter.files) == [4, 4, 1]
+    table = pyarrow.parquet.read_table(exporter.files[0])
+    assert table.column('device').to_pylist() == ['lamp0', 'lamp1', 'lamp0', 'lamp1']
+    # RGB is reported by the detailed status only
+    assert table.column('led1_red').to_pylist()[0] is not None
+    assert table.column('led1_red').to_pylist()[1] is None
+    assert not [name for name in os.listdir(tmp_path) if name.endswith('.tmp')]
+
+
+def test_expired_file_is_finished_without_new_rows(tmp_path):
+    exporter = StatusExporter(str(tmp_path), row_group_size=1000, file_duration=0.2)
+    try:
+        exporter.write('lamp', STATUS)
+        exporter.write('lamp', STATUS)
+        assert exporter.files == []
+        deadline = time.monotonic() + 2.0
+        while not exporter.files and time.monotonic() < deadline:
+            time.sleep(0.02)
+        assert rows(exporter.files) == [2]
+
+        # a row after the expiry starts a new file
+        exporter.write('lamp', STATUS)
+    finally:
+        exporter.close()
+    assert rows(exporter.files) == [2, 1]
+
+
+def test_export_capture(tmp_path):
+    capture = str(tmp_path / 'capture.bin')
+    with Recorder(capture) as recorder:
+        recorder.record(0, 'lamp', pns_get_data_encode())
+        recorder.record(1, 'lamp', SIMULATOR.handle(pns_get_data_encode()))
+    files = export_capture(capture, str(tmp_path / 'export'))
+    assert rows(files) == [1]
@@ -0,0 +1,109 @@
+import time
+
+import pytest
+
+from fleet import ConnectionPool
+from health import HEALTH_DEGRADED, HEALTH_HEALTHY, HEALTH_OPEN, CircuitOpenError, HealthMonitor, HealthTracker
+from main import LaPoeNakError, pns_clear_command, pns_reboot_command
+from retry import RETRY_POLICIES
+from simulator import LaPoeSimulator, SimulatorServer
+
+
+def start_server(port: int = 0, simulator: LaPoeSimulator = None) -> SimulatorServer:
+    server = SimulatorServer(('127.0.0.1', port), simulator)
+    server.start()
+    return server
+
+
+def stop_server(server: SimulatorServer):
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def outage():
+    # port of a stopped simulator, connections are refused until a server is started on it
+    server = start_server()
+    port = server.server_address[1]
+    stop_server(server)
+    servers = []
+    yield port, servers
+    for server in servers:
+        stop_server(server)
+
+
+def test_retries_count_as_one_failure(outage):
+    port, _ = outage
+    tracker = HealthTracker(failure_threshold=2)
+    with ConnectionPool(1.0, RETRY_POLICIES, tracker) as pool:
+        pool.add('lamp', '127.0.0.1', port)
+        with pytest.raises(ConnectionRefusedError):
+            pool.run('lamp', pns_clear_command)
+        # three attempts, one failure
+        assert tracker.health('lamp').failures == 1
+        assert tracker.health('lamp').state == HEALTH_DEGRADED
+        with pytest.raises(ConnectionRefusedError):
+            pool.run('lamp', pns_clear_command)
+        assert tracker.health('lamp').state == HEALTH_OPEN
+        with pytest.raises(CircuitOpenError):
+            pool.run('lamp', pns_clear_command)
+
+
+def test_half_open_trial_closes_the_circuit(outage):
+    port, servers = outage
+    tracker = HealthTracker(failure_threshold=1, open_duration=0.2)
+    with ConnectionPool(1.0, RETRY_POLICIES, tracker) as pool:
+        pool.add('lamp', '127.0.0.1', port)
+        with pytest.raises(ConnectionRefusedError):
+            pool.run('lamp', pns_clear_command)
+        with pytest.raises(CircuitOpenError):
+            pool.run('lamp', pns_clear_command)
+
+        # a failed trial opens the circuit again
+        time.sleep(0.25)
+        with pytest.raises(ConnectionRefusedError):
+            pool.run('lamp', pns_clear_command)
+        with pytest.raises(CircuitOpenError):
+            pool.run('lamp', pns_clear_command)
+
+        servers.append(start_server(port))
+        time.sleep(0.25)
+        pool.run('lamp', pns_clear_command)
+        assert tracker.health('lamp').state == HEALTH_HEALTHY
+        pool.run('lamp', pns_clear_command)
+
+
+def test_only_one_trial_while_half_open():
+    tracker = HealthTracker(failure_threshold=1, open_duration=0.1)
+    tracker.record_failure('lamp', ConnectionRefusedError())
+    assert not tracker.allow('lamp')
+    time.sleep(0.15)
+    assert tracker.allow('lamp')
+    assert not tracker.allow('lamp')
+
+
+def test_nak_is_not_a_failure():
+    server = start_server(simulator=LaPoeSimulator(password='secret'))
+    tracker = HealthTracker(failure_threshold=1)
+    try:
+        with ConnectionPool(1.0, RETRY_POLICIES, tracker) as pool:
+            pool.add('lamp', *server.server_address)
+            with pytest.raises(LaPoeNakError):
+                pool.run('lamp', pns_reboot_command, 'wrong')
+            assert tracker.health('lamp').state == HEALTH_HEALTHY
+    finally:
+        stop_server(server)
+
+
+def test_monitor_probe_closes_the_circuit(outage):
+    port, servers = outage
+    tracker = HealthTracker(failure_threshold=1, open_duration=0.0)
+    with ConnectionPool(1.0, None, tracker) as pool:
+        pool.add('lamp', '127.0.0.1', port)
+        with pytest.raises(ConnectionRefusedError):
+            pool.run('lamp', pns_clear_command)
+        monitor = HealthMonitor(pool, tracker)
+        assert monitor.probe_once() == []
+        servers.append(start_server(port))
+        assert monitor.probe_once() == ['lamp']
+        assert tracker.health('lamp').state == HEALTH_HEALTHY
@@ -0,0 +1,143 @@
+import socket
+import threading
+
+import pytest
+
+from http_transport import HttpCommandMap, HttpConnectionPool, HttpStandInServer, HttpTransport
+from main import (
+    PNS_LED_MODE,
+    PNS_SMART_MODE,
+    LaPoeFrameError,
+    LaPoeTimeoutError,
+    PnsRunControlData,
+    PnsDetailRunControlData,
+    pns_clear_command,
+    pns_detail_run_control_command,
+    pns_get_data_command,
+    pns_get_detail_data_command,
+    pns_mute_command,
+    pns_reboot_command,
+    pns_run_control_command,
+    pns_smart_mode_command,
+    phn_read_command,
+    phn_write_command,
+)
+
+# arbitrary paths and parameters, shared by the client and the stand-in
+COMMAND_MAP = HttpCommandMap(control_path='/control', status_path='/status', run_control='alert',
+                             detail_run_control='detail', smart_mode='smart', mute='mute', stop_pulse_input='stop',
+                             clear='clear')
+
+
+@pytest.fixture
+def server():
+    server = HttpStandInServer(('127.0.0.1', 0), COMMAND_MAP)
+    server.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def transport(server):
+    pool = HttpConnectionPool(*server.server_address, timeout=2.0)
+    yield HttpTransport(pool, COMMAND_MAP)
+    pool.close()
+
+
+def test_run_control_round_trip(server, transport):
+    pns_run_control_command(PnsRunControlData(1, 2, 0, 0, 1, 3), sock=transport)
+    assert server.simulator.led_patterns == (1, 2, 0, 0, 1)
+    assert server.simulator.buzzer_pattern == 3
+
+    status = pns_get_data_command(sock=transport)
+    assert status.mode == PNS_LED_MODE
+    led = status.led_mode_data
+    assert (led.led1_pattern, led.led2_pattern, led.led5_pattern, led.buzzer_pattern) == (1, 2, 1, 3)
+
+
+def test_detail_run_control_round_trip(server, transport):
+    pns_detail_run_control_command(PnsDetailRunControlData(1, 4, 6, 0, 0, 0, 2), sock=transport)
+    detail = pns_get_detail_data_command(sock=transport).led_mode_detail_data
+    assert detail.led_unit1_data.red == 255
+    assert detail.led_unit3_data.blue == 255
+    assert detail.buzzer_pattern == 2
+
+    pns_clear_command(sock=transport)
+    assert server.simulator.led_patterns == (0, 0, 0, 0, 0)
+
+
+def test_smart_mode_and_mute(transport):
+    pns_smart_mode_command(3, sock=transport)
+    pns_mute_command(1, sock=transport)
+    status = pns_get_data_command(sock=transport)
+    assert status.mode == PNS_SMART_MODE
+    assert status.smart_mode_data.group_no == 3
+
+
+def test_phn_round_trip(transport):
+    phn_write_command(0x01 | 0x20, sock=transport)
+    assert phn_read_command(sock=transport) == 0x01 | 0x20
+
+
+def test_unsupported_command_is_refused(transport):
+    with pytest.raises(ValueError):
+        pns_reboot_command('secret', sock=transport)
+
+
+def test_keep_alive_connections_are_reused(server):
+    pool = HttpConnectionPool(*server.server_address, max_connections=2, timeout=2.0)
+    connections = set()
+    handle = server.RequestHandlerClass.handle
+
+    def counting_handle(handler):
+        connections.add(handler.client_address)
+        handle(handler)
+
+    server.RequestHandlerClass.handle = counting_handle
+    try:
+        futures = [pool.submit(COMMAND_MAP.status_path) for _ in range(20)]
+        assert all(future.result(2.0) for future in futures)
+        assert 1 <= len(connections) <= 2
+    finally:
+        server.RequestHandlerClass.handle = handle
+        pool.close()
+
+
+def test_malformed_status_does_not_hang(server, transport):
+    json_from_detail = server.RequestHandlerClass.__dict__['_json_from_detail']
+    server.RequestHandlerClass._json_from_detail = staticmethod(lambda detail: {'mode': 0})
+    try:
+        with pytest.raises(LaPoeFrameError):
+            pns_get_data_command(sock=transport)
+    finally:
+        server.RequestHandlerClass._json_from_detail = json_from_detail
+
+
+@pytest.fixture
+def silent_server():
+    # accepts connections and never answers
+    listener = socket.create_server(('127.0.0.1', 0))
+    connections = []
+
+    def accept():
+        while True:
+            try:
+                connections.append(listener.accept()[0])
+            except OSError:
+                return
+
+    threading.Thread(target=accept, daemon=True).start()
+    yield listener.getsockname()
+    listener.close()
+    for connection in connections:
+        connection.close()
+
+
+def test_no_response_times_out(silent_server):
+    pool = HttpConnectionPool(*silent_server, timeout=0.2)
+    try:
+        with pytest.raises(LaPoeTimeoutError):
+            pns_get_data_command(sock=HttpTransport(pool, COMMAND_MAP))
+    finally:
+        pool.close()
@@ -0,0 +1,142 @@
+import asyncio
+import threading
+
+import pytest
+
+from fleet import ConnectionPool
+from inputs import INPUT_EDGE_FALLING, INPUT_EDGE_RISING, InputEdgeDetector, InputPoller
+from main import LaPoeTimeoutError, pns_get_data_command
+from simulator import SimulatorServer
+
+OPEN = bytes(8)
+CLOSED_1 = bytes([1, 0, 0, 0, 0, 0, 0, 0])
+
+
+def edges(events) -> list:
+    return [(event.device, event.input_no, event.edge, event.timestamp) for event in events]
+
+
+def test_edges():
+    detector = InputEdgeDetector()
+    assert detector.state('lamp') is None
+    # the first poll sets the initial state
+    assert detector.update('lamp', CLOSED_1, 0.0) == []
+    assert detector.update('lamp', OPEN, 1.0)[0].edge == INPUT_EDGE_FALLING
+    assert edges(detector.update('lamp', bytes([1, 0, 0, 0, 0, 0, 0, 1]), 2.0)) == [
+        ('lamp', 1, INPUT_EDGE_RISING, 2.0), ('lamp', 8, INPUT_EDGE_RISING, 2.0)]
+    assert detector.state('lamp') == bytes([1, 0, 0, 0, 0, 0, 0, 1])
+
+    detector.forget('lamp')
+    assert detector.update('lamp', OPEN, 3.0) == []
+
+
+def test_debounce():
+    detector = InputEdgeDetector(debounce=0.5)
+    detector.update('lamp', OPEN, 0.0)
+    assert detector.update('lamp', CLOSED_1, 1.0) == []
+    # a bounce back restarts the wait
+    assert detector.update('lamp', OPEN, 1.2) == []
+    assert detector.update('lamp', CLOSED_1, 1.4) == []
+    assert detector.update('lamp', CLOSED_1, 1.7) == []
+    # the edge carries the time the new state was first seen
+    assert edges(detector.update('lamp', CLOSED_1, 1.9)) == [('lamp', 1, INPUT_EDGE_RISING, 1.4)]
+
+
+def test_glitch_count():
+    detector = InputEdgeDetector(glitch_count=3)
+    detector.update('lamp', OPEN, 0.0)
+    detector.update('lamp', CLOSED_1, 1.0)
+    detector.update('lamp', CLOSED_1, 2.0)
+    assert detector.update('lamp', OPEN, 3.0) == []
+    assert detector.state('lamp') == OPEN
+    for timestamp in (4.0, 5.0):
+        assert detector.update('lamp', CLOSED_1, timestamp) == []
+    assert len(detector.update('lamp', CLOSED_1, 6.0)) == 1
+
+
+def test_stream():
+    detector = InputEdgeDetector()
+    detector.update('lamp', OPEN, 0.0)
+
+    async def consume():
+        stream = detector.stream()
+        thread = threading.Thread(target=lambda: (detector.update('lamp', CLOSED_1, 1.0),
+                                                  detector.update('lamp', OPEN, 2.0), stream.close()))
+        thread.start()
+        events = [event async for event in stream]
+        thread.join()
+        return events
+
+    assert [event.edge for event in asyncio.run(consume())] == [INPUT_EDGE_RISING, INPUT_EDGE_FALLING]
+
+
+def test_stream_drops_the_oldest_event_when_full():
+    detector = InputEdgeDetector()
+    detector.update('lamp', OPEN, 0.0)
+
+    async def consume():
+        stream = detector.stream(maxsize=1)
+        detector.update('lamp', CLOSED_1, 1.0)
+        detector.update('lamp', OPEN, 2.0)
+        await asyncio.sleep(0)
+        stream.close()
+        return [event async for event in stream]
+
+    assert [event.edge for event in asyncio.run(consume())] == [INPUT_EDGE_FALLING]
+
+
+@pytest.fixture
+def device():
+    server = SimulatorServer(('127.0.0.1', 0))
+    server.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_poller(device):
+    pool = ConnectionPool(timeout=2.0)
+    pool.add('lamp', *device.server_address)
+    detector = InputEdgeDetector()
+    received = threading.Event()
+    detector.subscribe(lambda event: received.set())
+    polled = threading.Event()
+
+    def read_input():
+        input_data = pool.run('lamp', pns_get_data_command).input
+        polled.set()
+        return input_data
+
+    poller = InputPoller(detector, 'lamp', interval=0.02, read_input=read_input)
+    poller.start()
+    try:
+        # the first poll sets the initial state
+        assert polled.wait(2.0)
+        device.simulator.set_input(3, True)
+        assert received.wait(2.0)
+        assert detector.state('lamp')[2] == 1
+        assert poller.error is None
+    finally:
+        poller.stop()
+        pool.close()
+
+
+def test_poller_reports_failures():
+    errors = []
+    failed = threading.Event()
+
+    def read_input():
+        raise LaPoeTimeoutError('no response')
+
+    def on_error(e):
+        errors.append(e)
+        failed.set()
+
+    poller = InputPoller(InputEdgeDetector(), 'lamp', interval=0.02, read_input=read_input, on_error=on_error)
+    poller.start()
+    try:
+        assert failed.wait(2.0)
+    finally:
+        poller.stop()
+    assert isinstance(poller.error, LaPoeTimeoutError)
+    assert isinstance(errors[0], LaPoeTimeoutError)
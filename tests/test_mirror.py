@@ -0,0 +1,98 @@
+import concurrent.futures
+
+import pytest
+
+from fleet import ConnectionPool
+from main import (
+    PnsDetailRunControlData,
+    pns_detail_run_control_encode,
+    pns_get_detail_data_decode,
+    pns_get_detail_data_encode,
+)
+from mirror import MirrorService, detail_run_control_data_from_status
+from simulator import LaPoeSimulator, SimulatorServer
+
+SLAVES = 10
+ALARM = PnsDetailRunControlData(1, 2, 0, 0, 0, 1, 0)
+
+
+def start_server() -> SimulatorServer:
+    server = SimulatorServer(('127.0.0.1', 0))
+    server.start()
+    return server
+
+
+@pytest.fixture
+def fleet():
+    servers = {'master': start_server()}
+    for i in range(SLAVES):
+        servers['slave%d' % i] = start_server()
+    pool = ConnectionPool(timeout=2.0)
+    for device, server in servers.items():
+        pool.add(device, *server.server_address)
+    yield servers, pool
+    pool.close()
+    # each shutdown waits for the poll interval of its server
+    with concurrent.futures.ThreadPoolExecutor(len(servers)) as executor:
+        executor.map(SimulatorServer.shutdown, servers.values())
+    for server in servers.values():
+        server.server_close()
+
+
+def slaves() -> list:
+    return ['slave%d' % i for i in range(SLAVES)]
+
+
+def test_status_to_detail_run_control_data():
+    simulator = LaPoeSimulator()
+    simulator.handle(pns_detail_run_control_encode(ALARM))
+    status = pns_get_detail_data_decode(simulator.handle(pns_get_detail_data_encode()))
+    assert detail_run_control_data_from_status(status).get_bytes() == ALARM.get_bytes()
+
+
+def test_master_state_reaches_every_slave(fleet):
+    servers, pool = fleet
+    mirror = MirrorService(pool, 'master', slaves(), max_workers=4)
+    try:
+        servers['master'].simulator.handle(pns_detail_run_control_encode(ALARM))
+        assert mirror.sync_once()
+        assert mirror.pending == []
+        assert set(mirror.lags) == set(slaves())
+        for slave in slaves():
+            assert servers[slave].simulator.led_colors == servers['master'].simulator.led_colors
+            assert servers[slave].simulator.led_patterns == servers['master'].simulator.led_patterns
+
+        # an unchanged master writes nothing
+        servers['slave0'].simulator.handle(pns_detail_run_control_encode(PnsDetailRunControlData(0, 0, 0, 0, 0, 0, 0)))
+        assert not mirror.sync_once()
+        assert servers['slave0'].simulator.led_patterns == (0, 0, 0, 0, 0)
+    finally:
+        mirror.stop()
+
+
+def test_unreachable_slave_is_retried(fleet):
+    servers, pool = fleet
+    server = start_server()
+    port = server.server_address[1]
+    server.shutdown()
+    server.server_close()
+    pool.add('gone', '127.0.0.1', port)
+
+    mirror = MirrorService(pool, 'master', slaves() + ['gone'])
+    try:
+        servers['master'].simulator.handle(pns_detail_run_control_encode(ALARM))
+        mirror.sync_once()
+        assert mirror.pending == ['gone']
+        assert list(mirror.errors) == ['gone']
+        assert 'gone' not in mirror.lags
+    finally:
+        mirror.stop()
+
+
+def test_unreachable_master(fleet):
+    servers, pool = fleet
+    mirror = MirrorService(pool, 'unknown', slaves())
+    with pytest.raises(KeyError):
+        mirror.sync_once()
+    assert isinstance(mirror.master_error, KeyError)
+    mirror.stop()
@@ -0,0 +1,171 @@
+import concurrent.futures
+import socket
+import threading
+import time
+
+import pytest
+
+from main import (
+    PNS_LED_MODE,
+    PNS_SMART_MODE,
+    LaPoeFrameError,
+    LaPoeTimeoutError,
+    PnsRunControlData,
+    PnsDetailRunControlData,
+    pns_clear_command,
+    pns_detail_run_control_command,
+    pns_get_data_command,
+    pns_get_detail_data_command,
+    pns_mute_command,
+    pns_reboot_command,
+    pns_run_control_command,
+    pns_smart_mode_command,
+    phn_read_command,
+    phn_write_command,
+)
+from modbus import ModbusClient, ModbusRegisterMap, ModbusStandInServer, ModbusTransport
+
+# arbitrary addresses, shared by the client and the stand-in
+REGISTER_MAP = ModbusRegisterMap(run_control=0x100, detail_run_control=0x110, smart_mode=0x120, mute=0x121,
+                                 stop_pulse_input=0x122, clear=0x123, detail_status=0x200)
+
+
+@pytest.fixture
+def server():
+    server = ModbusStandInServer(('127.0.0.1', 0), REGISTER_MAP)
+    server.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def transport(server):
+    client = ModbusClient(*server.server_address, timeout=2.0)
+    yield ModbusTransport(client, REGISTER_MAP)
+    client.close()
+
+
+def test_run_control_round_trip(server, transport):
+    pns_run_control_command(PnsRunControlData(1, 2, 0, 0, 1, 3), sock=transport)
+    assert server.simulator.led_patterns == (1, 2, 0, 0, 1)
+    assert server.simulator.buzzer_pattern == 3
+
+    status = pns_get_data_command(sock=transport)
+    assert status.mode == PNS_LED_MODE
+    led = status.led_mode_data
+    assert (led.led1_pattern, led.led2_pattern, led.led5_pattern, led.buzzer_pattern) == (1, 2, 1, 3)
+
+
+def test_detail_run_control_round_trip(server, transport):
+    pns_detail_run_control_command(PnsDetailRunControlData(1, 4, 6, 0, 0, 0, 2), sock=transport)
+    detail = pns_get_detail_data_command(sock=transport).led_mode_detail_data
+    assert detail.led_unit1_data.red == 255
+    assert detail.led_unit3_data.blue == 255
+    assert detail.buzzer_pattern == 2
+
+    pns_clear_command(sock=transport)
+    assert server.simulator.led_patterns == (0, 0, 0, 0, 0)
+
+
+def test_smart_mode_and_mute(server, transport):
+    pns_smart_mode_command(3, sock=transport)
+    pns_mute_command(1, sock=transport)
+    status = pns_get_data_command(sock=transport)
+    assert status.mode == PNS_SMART_MODE
+    assert status.smart_mode_data.group_no == 3
+
+
+def test_phn_round_trip(transport):
+    phn_write_command(0x01 | 0x20, sock=transport)
+    assert phn_read_command(sock=transport) == 0x01 | 0x20
+
+
+def test_unsupported_command_is_refused(transport):
+    with pytest.raises(ValueError):
+        pns_reboot_command('secret', sock=transport)
+
+
+def test_pipelined_requests(server):
+    client = ModbusClient(*server.server_address, timeout=2.0)
+    try:
+        futures = [client.read_input_registers(REGISTER_MAP.detail_status, 45) for _ in range(64)]
+        assert all(len(future.result(2.0)) == 45 for future in futures)
+    finally:
+        client.close()
+
+
+@pytest.fixture
+def silent_server():
+    # accepts connections and never answers
+    listener = socket.create_server(('127.0.0.1', 0))
+    connections = []
+
+    def accept():
+        while True:
+            try:
+                connections.append(listener.accept()[0])
+            except OSError:
+                return
+
+    threading.Thread(target=accept, daemon=True).start()
+    yield listener.getsockname()
+    listener.close()
+    for connection in connections:
+        connection.close()
+
+
+def test_no_response_times_out(silent_server):
+    client = ModbusClient(*silent_server, timeout=0.2)
+    try:
+        with pytest.raises(LaPoeTimeoutError):
+            pns_get_data_command(sock=ModbusTransport(client, REGISTER_MAP))
+    finally:
+        client.close()
+
+
+def test_malformed_response_does_not_hang(server):
+    server.handle_pdu = lambda pdu: bytes([pdu[0], 0])
+    client = ModbusClient(*server.server_address, timeout=2.0)
+    try:
+        with pytest.raises(LaPoeFrameError):
+            pns_get_data_command(sock=ModbusTransport(client, REGISTER_MAP))
+    finally:
+        client.close()
+
+
+def test_timed_out_request_is_discarded(silent_server):
+    client = ModbusClient(*silent_server, timeout=0.2)
+    try:
+        for _ in range(3):
+            with pytest.raises(LaPoeTimeoutError):
+                pns_get_data_command(sock=ModbusTransport(client, REGISTER_MAP))
+        assert client.pending == 0
+    finally:
+        client.close()
+
+
+def test_late_response_is_ignored(server):
+    handle_pdu = server.handle_pdu
+    delays = [0.4]
+
+    def slow_handle_pdu(pdu):
+        if delays:
+            time.sleep(delays.pop())
+        return handle_pdu(pdu)
+
+    server.handle_pdu = slow_handle_pdu
+    client = ModbusClient(*server.server_address, timeout=2.0)
+    try:
+        write = client.write_registers(REGISTER_MAP.run_control, [1, 0, 0, 0, 0, 0])
+        with pytest.raises(concurrent.futures.TimeoutError):
+            write.result(0.1)
+        assert write.cancel()
+        assert client.pending == 0
+        # sent before the late response of the write arrives
+        read = client.read_input_registers(REGISTER_MAP.detail_status, 45)
+        assert len(read.result(2.0)) == 45
+        assert server.simulator.led_patterns[0] == 1
+        assert client.pending == 0
+    finally:
+        client.close()
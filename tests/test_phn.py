@@ -0,0 +1,63 @@
+import pytest
+
+from fleet import ConnectionPool
+from main import (
+    PHN_BUZZER_PATTERN1,
+    PHN_LED_UNIT1_BLINKING,
+    PHN_LED_UNIT1_LIGHTING,
+    PHN_LED_UNIT2_LIGHTING,
+    PHN_LED_UNIT3_LIGHTING,
+)
+from phn import PhnState, phn_read_all, phn_update, phn_update_all, phn_write_all, run_control_data_from_phn
+from simulator import SimulatorServer
+
+
+@pytest.fixture
+def pool():
+    servers = [SimulatorServer(('127.0.0.1', 0)) for _ in range(2)]
+    pool = ConnectionPool(timeout=2.0)
+    for i, server in enumerate(servers):
+        server.start()
+        pool.add('lamp%d' % i, *server.server_address)
+    yield pool
+    pool.close()
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def test_state():
+    state = PhnState.from_patterns((2, 1, 0), 1)
+    assert state.run_data == PHN_LED_UNIT1_LIGHTING | PHN_LED_UNIT1_BLINKING | PHN_LED_UNIT2_LIGHTING | \
+        PHN_BUZZER_PATTERN1
+    assert state.led_patterns == (2, 1, 0)
+    assert state.buzzer_pattern == 1
+    assert state.with_led(1, 0).with_led(3, 1).led_patterns == (0, 1, 1)
+    assert state.with_buzzer(0).buzzer_pattern == 0
+    assert state.clear(PHN_LED_UNIT1_BLINKING).set(PHN_LED_UNIT3_LIGHTING).led_patterns == (1, 1, 1)
+    assert state.is_set(PHN_LED_UNIT2_LIGHTING | PHN_BUZZER_PATTERN1)
+    assert PhnState(0).merge(state, PHN_LED_UNIT2_LIGHTING) == PhnState(PHN_LED_UNIT2_LIGHTING)
+    assert len({PhnState(1), PhnState(1), PhnState(2)}) == 2
+    with pytest.raises(AttributeError):
+        state.run_data = 0
+    with pytest.raises(ValueError):
+        PhnState(0x100)
+
+
+def test_run_control_data():
+    data = run_control_data_from_phn(PhnState.from_patterns((2, 1, 0), 1).run_data)
+    # the 4th and 5th LED unit are left unchanged
+    assert data.get_bytes() == bytes([2, 1, 0, 9, 9, 1])
+
+
+def test_batch_operations(pool):
+    states = {'lamp0': PhnState.from_patterns((1, 0, 0), 0), 'lamp1': PhnState.from_patterns((0, 2, 0), 0)}
+    assert phn_write_all(pool, states) == {'lamp0': None, 'lamp1': None}
+    assert phn_read_all(pool, ['lamp0', 'lamp1']) == states
+
+    results = phn_update_all(pool, ['lamp0', 'lamp1', 'unknown'], set_bits=PHN_BUZZER_PATTERN1,
+                             clear_bits=PHN_LED_UNIT1_LIGHTING)
+    assert results['lamp0'] == PhnState(PHN_BUZZER_PATTERN1)
+    assert results['lamp1'] == states['lamp1'].set(PHN_BUZZER_PATTERN1)
+    assert isinstance(results['unknown'], KeyError)
+    assert phn_update(pool, 'lamp0') == PhnState(PHN_BUZZER_PATTERN1)
@@ -0,0 +1,83 @@
+import concurrent.futures
+import threading
+
+import pytest
+
+from fleet import ConnectionPool
+from main import LaPoeNakError, PnsDetailRunControlData, pns_detail_run_control_command
+from reboot import RollingReboot
+from simulator import LaPoeSimulator, SimulatorServer
+
+DEVICES = 4
+
+
+@pytest.fixture
+def fleet():
+    servers = {'lamp%d' % i: SimulatorServer(('127.0.0.1', 0), LaPoeSimulator(password='secret'))
+               for i in range(DEVICES)}
+    pool = ConnectionPool(timeout=2.0)
+    for device, server in servers.items():
+        server.start()
+        pool.add(device, *server.server_address)
+    yield servers, pool
+    pool.close()
+    # each shutdown waits for the poll interval of its server
+    with concurrent.futures.ThreadPoolExecutor(len(servers)) as executor:
+        executor.map(SimulatorServer.shutdown, servers.values())
+    for server in servers.values():
+        server.server_close()
+
+
+class _CountingReboot(RollingReboot):
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.lock = threading.Lock()
+        self.dark = 0
+        self.max_dark = 0
+
+    def reboot(self, device):
+        with self.lock:
+            self.dark += 1
+            self.max_dark = max(self.max_dark, self.dark)
+        try:
+            return super().reboot(device)
+        finally:
+            with self.lock:
+                self.dark -= 1
+
+
+def test_rolling_waves_keep_the_zone_lit(fleet):
+    servers, pool = fleet
+    pool.run('lamp0', pns_detail_run_control_command, PnsDetailRunControlData(1, 0, 0, 0, 0, 1, 0))
+    progress = []
+    # the simulator keeps answering, so each device is dark for down_timeout
+    reboot = _CountingReboot(pool, 'secret', max_fraction=0.5, probe_interval=0.05, down_timeout=0.2)
+    results = reboot.run(progress=lambda result, done, total: progress.append((done, total)))
+
+    assert reboot.max_dark == 2
+    assert [done for done, _ in progress] == [1, 2, 3, 4]
+    for device, result in results.items():
+        assert result.error is None
+        assert result.restored
+        assert result.downtime >= 0.2
+        assert servers[device].simulator.reboot_count == 1
+    assert servers['lamp0'].simulator.led_patterns[0] == 2
+
+
+def test_zones_are_limited_apart(fleet):
+    servers, pool = fleet
+    zones = {'lamp0': 'a', 'lamp1': 'a', 'lamp2': 'b', 'lamp3': 'b'}
+    reboot = _CountingReboot(pool, 'secret', zones, max_fraction=0.25, probe_interval=0.05, down_timeout=0.2,
+                             restore=False)
+    results = reboot.run()
+    # one device of each zone at a time
+    assert reboot.max_dark == 2
+    assert not any(result.restored for result in results.values())
+
+
+def test_wrong_password(fleet):
+    servers, pool = fleet
+    results = RollingReboot(pool, 'wrong', probe_interval=0.05, down_timeout=0.2).run(['lamp0'])
+    assert isinstance(results['lamp0'].error, LaPoeNakError)
+    assert servers['lamp0'].simulator.reboot_count == 0
@@ -0,0 +1,76 @@
+import time
+
+import pytest
+
+from fleet import ConnectionPool
+from main import PnsRunControlData, pns_clear_encode
+from reconciler import Reconciler
+from simulator import SimulatorServer
+
+
+@pytest.fixture
+def servers():
+    servers = [SimulatorServer(('127.0.0.1', 0)) for _ in range(4)]
+    for server in servers:
+        server.start()
+    yield servers
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+@pytest.fixture
+def pool(servers):
+    pool = ConnectionPool(timeout=2.0)
+    for i, server in enumerate(servers):
+        pool.add('lamp%d' % i, *server.server_address)
+    yield pool
+    pool.close()
+
+
+def wait_for(predicate, timeout: float = 5.0) -> bool:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.02)
+    return predicate()
+
+
+def test_converges_and_corrects_drift(servers, pool):
+    reconciler = Reconciler(pool)
+    try:
+        reconciler.set_desired('lamp0', PnsRunControlData(1, 0, 0, 0, 0, 0))
+        reconciler.set_desired('lamp1', 2)
+        assert sorted(reconciler.reconcile_once()) == ['lamp0', 'lamp1']
+        assert servers[0].simulator.led_patterns == (1, 0, 0, 0, 0)
+        assert servers[1].simulator.group_no == 2
+        assert reconciler.reconcile_once() == []
+        assert reconciler.diverged == {}
+        assert set(reconciler.convergence) == {'lamp0', 'lamp1'}
+
+        # manual change on the device
+        servers[0].simulator.handle(pns_clear_encode())
+        assert reconciler.reconcile_once() == ['lamp0']
+        assert servers[0].simulator.led_patterns == (1, 0, 0, 0, 0)
+    finally:
+        reconciler.stop()
+
+
+def test_rate_limited_corrections_do_not_hold_workers(servers, pool):
+    reconciler = Reconciler(pool, rate=2.0, max_workers=1)
+    try:
+        for i in range(4):
+            reconciler.set_desired('lamp%d' % i, PnsRunControlData(1, 1, 0, 0, 0, 0))
+        started = time.monotonic()
+        corrected = reconciler.reconcile_once()
+        # the burst of 2 is sent, the others wait for a token without blocking the pass
+        assert len(corrected) == 2
+        assert time.monotonic() - started < 0.5
+        assert sorted(reconciler.waiting + corrected) == ['lamp0', 'lamp1', 'lamp2', 'lamp3']
+        assert reconciler.reconcile_once() == []
+
+        assert wait_for(lambda: all(server.simulator.led_patterns[0:2] == (1, 1) for server in servers))
+        assert reconciler.waiting == []
+    finally:
+        reconciler.stop()
@@ -0,0 +1,88 @@
+import pytest
+
+from fleet import ConnectionPool
+from main import (
+    PnsRunControlData,
+    pns_get_data_command,
+    pns_get_detail_data_command,
+    pns_run_control_command,
+    set_recorder,
+)
+from recorder import RECORD_DIRECTION_RECV, RECORD_DIRECTION_SEND, Recorder, Replayer
+from simulator import LaPoeSimulator, SimulatorServer
+
+
+@pytest.fixture
+def capture(tmp_path):
+    path = str(tmp_path / 'capture')
+    server = SimulatorServer(('127.0.0.1', 0))
+    server.start()
+    pool = ConnectionPool(timeout=2.0)
+    pool.add('lamp', *server.server_address)
+    recorder = Recorder(path)
+    set_recorder(recorder)
+    try:
+        pool.run('lamp', pns_run_control_command, PnsRunControlData(1, 2, 0, 0, 0, 0))
+        pool.run('lamp', pns_get_data_command)
+        pool.run('lamp', pns_get_detail_data_command)
+    finally:
+        set_recorder(None)
+        recorder.close()
+        pool.close()
+        server.shutdown()
+        server.server_close()
+    return path
+
+
+def test_records(capture):
+    with Replayer(capture) as replayer:
+        records = list(replayer.records())
+        assert [record.direction for record in records] == [RECORD_DIRECTION_SEND, RECORD_DIRECTION_RECV] * 3
+        assert len({record.device for record in records}) == 1
+        assert records[0].timestamp <= records[-1].timestamp
+        assert len(list(replayer.exchanges())) == 3
+
+
+def test_decode(capture):
+    with Replayer(capture) as replayer:
+        statuses = [status for _, status in replayer.decode()]
+    assert len(statuses) == 2
+    assert statuses[0].led_mode_data.led2_pattern == 2
+    assert statuses[1].led_mode_detail_data.led_unit2_data.led_pattern == 2
+
+
+def test_replay_into_a_simulator(capture):
+    with Replayer(capture) as replayer:
+        assert replayer.replay_into(LaPoeSimulator()) == []
+        # a device whose input differs answers the status commands differently
+        simulator = LaPoeSimulator()
+        simulator.set_input(1, True)
+        assert len(replayer.replay_into(simulator)) == 2
+
+
+def test_truncated_capture(capture):
+    with open(capture, 'rb') as f:
+        data = f.read()
+    with open(capture, 'wb') as f:
+        f.write(data[:-3])
+    with Replayer(capture) as replayer:
+        assert len(list(replayer.records())) == 5
+        # the last command lost its response
+        assert list(replayer.exchanges())[-1][1] is None
+
+
+def test_recorder_appends(capture):
+    with Recorder(capture) as recorder:
+        recorder.record(RECORD_DIRECTION_SEND, 'other', b'x', timestamp=1.0)
+    with Replayer(capture) as replayer:
+        records = list(replayer.records())
+    assert len(records) == 7
+    assert (records[-1].device, records[-1].frame, records[-1].timestamp) == ('other', b'x', 1.0)
+
+
+def test_not_a_capture_file(tmp_path):
+    path = str(tmp_path / 'other')
+    with open(path, 'wb') as f:
+        f.write(b'something else')
+    with pytest.raises(ValueError):
+        Replayer(path)
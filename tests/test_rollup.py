@@ -0,0 +1,76 @@
+from main import (
+    PnsDetailRunControlData,
+    PnsRunControlData,
+    pns_detail_run_control_encode,
+    pns_get_data_decode,
+    pns_get_data_encode,
+    pns_get_detail_data_decode,
+    pns_get_detail_data_encode,
+    pns_run_control_encode,
+    pns_smart_mode_encode,
+)
+from rollup import (
+    ROLLUP_BLINKING,
+    ROLLUP_BUZZER,
+    ROLLUP_INPUTS_CLOSED,
+    ROLLUP_LIT,
+    ROLLUP_SMART_MODE,
+    ROLLUP_TOWERS,
+    ZoneRollup,
+    rollup_color_key,
+)
+from simulator import LaPoeSimulator
+
+
+def status(frame: bytes = None, detail: bool = False, closed: int = 0):
+    simulator = LaPoeSimulator()
+    if frame is not None:
+        simulator.handle(frame)
+    for input_no in range(1, closed + 1):
+        simulator.set_input(input_no, True)
+    if detail:
+        return pns_get_detail_data_decode(simulator.handle(pns_get_detail_data_encode()))
+    return pns_get_data_decode(simulator.handle(pns_get_data_encode()))
+
+
+def test_counters_follow_the_status_changes():
+    rollup = ZoneRollup({'a': 'line1', 'b': 'line1'})
+    changes = []
+    rollup.subscribe(lambda zone, changed: changes.append((zone, changed)))
+
+    assert rollup.update('a', status(closed=2)) == {ROLLUP_TOWERS: 1, ROLLUP_INPUTS_CLOSED: 2}
+    rollup.update('b', status(pns_run_control_encode(PnsRunControlData(1, 2, 0, 0, 0, 1))))
+    assert rollup.totals('line1') == {ROLLUP_TOWERS: 2, ROLLUP_INPUTS_CLOSED: 2, ROLLUP_LIT: 1, ROLLUP_BLINKING: 1,
+                                      ROLLUP_BUZZER: 1}
+
+    # only the difference is applied, an unchanged status changes nothing
+    assert rollup.update('b', status(pns_run_control_encode(PnsRunControlData(1, 0, 0, 0, 0, 0)))) == {
+        ROLLUP_BLINKING: 0, ROLLUP_BUZZER: 0}
+    assert rollup.update('b', status(pns_run_control_encode(PnsRunControlData(1, 0, 0, 0, 0, 0)))) == {}
+    assert len(changes) == 3
+
+    rollup.remove('a')
+    assert rollup.totals('line1') == {ROLLUP_TOWERS: 1, ROLLUP_LIT: 1}
+    rollup.remove('b')
+    assert rollup.zones == {}
+
+
+def test_colors_and_smart_mode():
+    rollup = ZoneRollup()
+    rollup.update('red', status(pns_detail_run_control_encode(PnsDetailRunControlData(1, 0, 0, 0, 0, 0, 0)), True))
+    rollup.update('smart', status(pns_smart_mode_encode(3)))
+    totals = rollup.totals()
+    assert totals[rollup_color_key(1)] == 1
+    assert totals[ROLLUP_SMART_MODE] == 1
+    assert totals[ROLLUP_TOWERS] == 2
+
+
+def test_moving_a_device_between_zones():
+    rollup = ZoneRollup({'a': 'line1'})
+    updates = []
+    rollup.subscribe(lambda zone, changed: updates.append((zone, changed)))
+    rollup.update('a', status(closed=1))
+    rollup.set_zone('a', 'line2')
+    assert rollup.zones == {'line2': {ROLLUP_TOWERS: 1, ROLLUP_INPUTS_CLOSED: 1}}
+    assert updates[1:] == [('line1', {ROLLUP_TOWERS: 0, ROLLUP_INPUTS_CLOSED: 0}),
+                           ('line2', {ROLLUP_TOWERS: 1, ROLLUP_INPUTS_CLOSED: 1})]
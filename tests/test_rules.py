@@ -0,0 +1,101 @@
+import concurrent.futures
+import threading
+
+import pytest
+
+from fleet import ConnectionPool
+from main import (
+    PnsRunControlData,
+    pns_clear_command,
+    pns_get_data_command,
+    pns_run_control_command,
+    pns_smart_mode_encode,
+)
+from rules import InputCondition, Rule, RuleAction, RuleEngine, SmartModeCondition
+from simulator import SimulatorServer
+
+
+@pytest.fixture
+def servers():
+    servers = [SimulatorServer(('127.0.0.1', 0)) for _ in range(2)]
+    for server in servers:
+        server.start()
+    yield servers
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+@pytest.fixture
+def pool(servers):
+    pool = ConnectionPool(timeout=2.0)
+    pool.add('sensor', *servers[0].server_address)
+    pool.add('lamp', *servers[1].server_address)
+    yield pool
+    pool.close()
+
+
+def alarm_rule() -> Rule:
+    return Rule('alarm', [InputCondition('sensor', 1)],
+                [RuleAction('lamp', pns_run_control_command, PnsRunControlData(1, 0, 0, 0, 0, 1))],
+                [RuleAction('lamp', pns_clear_command)])
+
+
+def test_input_edges_drive_the_target(servers, pool):
+    engine = RuleEngine(pool)
+    engine.add_rule(alarm_rule())
+    assert engine.update('sensor', pool.run('sensor', pns_get_data_command)) == []
+
+    servers[0].simulator.set_input(1, 1)
+    fired = engine.update('sensor', pool.run('sensor', pns_get_data_command))
+    assert [(rule.name, satisfied) for rule, satisfied in fired] == [('alarm', True)]
+    assert servers[1].simulator.led_patterns == (1, 0, 0, 0, 0)
+    # no change, no action
+    assert engine.update('sensor', pool.run('sensor', pns_get_data_command)) == []
+
+    servers[0].simulator.set_input(1, 0)
+    fired = engine.update('sensor', pool.run('sensor', pns_get_data_command))
+    assert [(rule.name, satisfied) for rule, satisfied in fired] == [('alarm', False)]
+    assert servers[1].simulator.led_patterns == (0, 0, 0, 0, 0)
+
+
+def test_smart_mode_condition(servers, pool):
+    engine = RuleEngine(pool)
+    engine.add_rule(Rule('group', [SmartModeCondition('sensor', 3)],
+                         [RuleAction('lamp', pns_run_control_command, PnsRunControlData(0, 1, 0, 0, 0, 0))]))
+    servers[0].simulator.handle(pns_smart_mode_encode(3))
+    fired = engine.update('sensor', pool.run('sensor', pns_get_data_command))
+    assert [rule.name for rule, _ in fired] == ['group']
+    assert servers[1].simulator.led_patterns[1] == 1
+
+
+def test_failed_action_is_raised_without_executor(servers, pool):
+    engine = RuleEngine(pool)
+    engine.add_rule(Rule('missing', [InputCondition('sensor', 1)], [RuleAction('unknown', pns_clear_command)]))
+    servers[0].simulator.set_input(1, 1)
+    with pytest.raises(KeyError):
+        engine.update('sensor', pool.run('sensor', pns_get_data_command))
+
+
+def test_executor_requires_on_error(pool):
+    with concurrent.futures.ThreadPoolExecutor(2) as executor:
+        with pytest.raises(ValueError):
+            RuleEngine(pool, executor)
+
+
+def test_executor_failures_reach_on_error(servers, pool):
+    errors = []
+    reported = threading.Event()
+
+    def on_error(rule, action, error):
+        errors.append((rule.name, action.device, error))
+        reported.set()
+
+    with concurrent.futures.ThreadPoolExecutor(2) as executor:
+        engine = RuleEngine(pool, executor, on_error)
+        engine.add_rule(Rule('missing', [InputCondition('sensor', 1)], [RuleAction('unknown', pns_clear_command)]))
+        servers[0].simulator.set_input(1, 1)
+        engine.update('sensor', pool.run('sensor', pns_get_data_command))
+        assert reported.wait(2.0)
+    assert errors[0][0:2] == ('missing', 'unknown')
+    assert isinstance(errors[0][2], KeyError)
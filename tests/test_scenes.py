@@ -0,0 +1,68 @@
+import pytest
+
+from fleet import ConnectionPool
+from main import (
+    PnsDetailRunControlData,
+    PnsRunControlData,
+    pns_get_data_command,
+    pns_run_control_encode,
+    pns_detail_run_control_encode,
+)
+from scenes import Scene, SceneManager
+from simulator import SimulatorServer
+
+ALARM = PnsDetailRunControlData(1, 0, 0, 0, 0, 1, 0)
+
+
+@pytest.fixture
+def server():
+    server = SimulatorServer(('127.0.0.1', 0))
+    server.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def pool(server):
+    pool = ConnectionPool(timeout=2.0)
+    pool.add('lamp', *server.server_address)
+    yield pool
+    pool.close()
+
+
+@pytest.fixture
+def manager(pool):
+    manager = SceneManager(pool)
+    manager.define(Scene('alarm', detail_run_control_data=ALARM))
+    manager.define(Scene('shift', group_no=2, detail_run_control_data=PnsDetailRunControlData(3, 3, 0, 0, 0, 0, 0)))
+    return manager
+
+
+def test_preloaded_scene_uses_smart_mode(server, manager):
+    manager.preload('lamp', [2])
+    assert manager.activate('lamp', 'shift')
+    assert server.simulator.group_no == 2
+    assert manager.refresh('lamp') == 'shift'
+    assert not manager.activate('lamp', 'shift')
+
+
+def test_frame_scene_is_tracked_from_the_status(server, manager):
+    assert manager.activate('lamp', 'alarm')
+    assert server.simulator.led_patterns[0] == 2
+    assert manager.refresh('lamp') == 'alarm'
+    assert not manager.activate('lamp', 'alarm')
+
+
+def test_manual_change_ends_the_scene(server, pool, manager):
+    manager.activate('lamp', 'alarm')
+    # another client lights the first unit in another color
+    server.simulator.handle(pns_detail_run_control_encode(PnsDetailRunControlData(4, 0, 0, 0, 0, 1, 0)))
+    assert manager.refresh('lamp') is None
+    assert manager.activate('lamp', 'alarm')
+    assert manager.refresh('lamp') == 'alarm'
+
+    # the get status command shows the patterns only
+    server.simulator.handle(pns_run_control_encode(PnsRunControlData(1, 0, 0, 0, 0, 0)))
+    assert manager.update('lamp', pool.run('lamp', pns_get_data_command)) is None
+    assert manager.active('lamp') is None
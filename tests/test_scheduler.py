@@ -0,0 +1,111 @@
+import logging
+import time
+
+import pytest
+
+from fleet import ConnectionPool
+from main import LaPoeNakError, PnsRunControlData, pns_mute_command, pns_reboot_command, pns_run_control_command
+from scheduler import Scheduler, ScheduledAction, TimerWheel
+from simulator import LaPoeSimulator, SimulatorServer
+
+
+@pytest.fixture
+def device():
+    server = SimulatorServer(('127.0.0.1', 0), LaPoeSimulator(password='secret'))
+    server.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def pool(device):
+    pool = ConnectionPool(timeout=2.0)
+    pool.add('lamp', *device.server_address)
+    yield pool
+    pool.close()
+
+
+def test_timer_wheel_returns_items_in_due_order():
+    wheel = TimerWheel(tick=1.0, slots=(4, 4), start=0.0)
+    # level 0, level 1 and overflow (beyond 16 ticks)
+    for when in (40.0, 2.0, 9.0, 3.0, 17.0):
+        wheel.insert(when, when)
+    assert len(wheel) == 5
+    assert wheel.advance(1.5) == []
+    assert wheel.advance(3.0) == [2.0, 3.0]
+    assert wheel.advance(16.0) == [9.0]
+    assert wheel.advance(39.0) == [17.0]
+    assert wheel.advance(40.0) == [40.0]
+    assert len(wheel) == 0
+
+
+def test_timer_wheel_never_returns_an_item_in_the_past_tick():
+    wheel = TimerWheel(tick=1.0, start=0.0)
+    wheel.advance(5.0)
+    wheel.insert(1.0, 'late')
+    assert wheel.advance(6.0) == ['late']
+
+
+def test_actions_of_a_tick_are_merged(device, pool):
+    scheduler = Scheduler(pool, tick=1.0)
+    try:
+        now = time.time()
+        scheduler.schedule(now, 'lamp', pns_run_control_command, PnsRunControlData(1, 1, 1, 1, 1, 0))
+        scheduler.schedule(now, 'lamp', pns_mute_command, 1)
+        scheduler.schedule(now, 'lamp', pns_run_control_command, PnsRunControlData(2, 0, 0, 0, 0, 0))
+        cancelled = scheduler.schedule(now, 'lamp', pns_mute_command, 0, key=None)
+        cancelled.cancel()
+        futures = scheduler.run_due(now + 1.0)
+        assert len(futures) == 1
+        futures[0].result(timeout=2.0)
+        # the last run control of the tick wins, the cancelled unmute is dropped
+        assert device.simulator.led_patterns == (2, 0, 0, 0, 0)
+        assert scheduler.pending == 0
+    finally:
+        scheduler.stop()
+
+
+def test_merge_keeps_scheduling_order():
+    actions = [ScheduledAction(0.0, 'lamp', pns_mute_command, mute, key='mute') for mute in (1, 0, 1)]
+    actions.append(ScheduledAction(0.0, 'lamp', pns_mute_command, 0, key=None))
+    assert Scheduler._merge(list(reversed(actions))) == actions[2:]
+
+
+def test_failure_is_raised_without_on_error(pool):
+    scheduler = Scheduler(pool, tick=1.0)
+    try:
+        now = time.time()
+        scheduler.schedule(now, 'lamp', pns_reboot_command, 'wrong')
+        scheduler.schedule(now, 'lamp', pns_mute_command, 1, key=None)
+        future, = scheduler.run_due(now + 1.0)
+        with pytest.raises(LaPoeNakError):
+            future.result(timeout=2.0)
+    finally:
+        scheduler.stop()
+
+
+def test_failure_is_reported_to_on_error(pool):
+    errors = []
+    scheduler = Scheduler(pool, tick=1.0, on_error=lambda action, e: errors.append((action, e)))
+    try:
+        now = time.time()
+        action = scheduler.schedule(now, 'lamp', pns_reboot_command, 'wrong')
+        future, = scheduler.run_due(now + 1.0)
+        future.result(timeout=2.0)
+        assert errors[0][0] is action
+        assert isinstance(errors[0][1], LaPoeNakError)
+    finally:
+        scheduler.stop()
+
+
+def test_background_failure_is_logged(pool, caplog):
+    scheduler = Scheduler(pool, tick=0.05)
+    scheduler.schedule(time.time(), 'lamp', pns_reboot_command, 'wrong')
+    with caplog.at_level(logging.ERROR, logger='scheduler'):
+        scheduler.start()
+        deadline = time.monotonic() + 2.0
+        while not caplog.records and time.monotonic() < deadline:
+            time.sleep(0.05)
+        scheduler.stop()
+    assert caplog.records[0].exc_info[0] is LaPoeNakError
@@ -0,0 +1,64 @@
+import threading
+import time
+
+from main import PNS_LED_MODE
+from shard import HashRing, ShardSupervisor
+from simulator import SimulatorServer
+
+
+def wait_for(predicate, timeout: float = 10.0) -> bool:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.05)
+    return predicate()
+
+
+def test_hash_ring_moves_only_the_devices_of_a_removed_node():
+    ring = HashRing(['a', 'b', 'c'])
+    devices = ['device-%d' % i for i in range(200)]
+    before = {device: ring.node(device) for device in devices}
+    assert set(before.values()) == {'a', 'b', 'c'}
+    ring.remove('b')
+    after = {device: ring.node(device) for device in devices}
+    assert all(after[device] == before[device] for device in devices if before[device] != 'b')
+    assert 'b' not in after.values()
+
+
+def test_device_recovers_after_an_outage():
+    server = SimulatorServer(('127.0.0.1', 0))
+    port = server.server_address[1]
+    server.server_close()
+
+    statuses = []
+    errors = []
+    lock = threading.Lock()
+
+    def on_status(device, status, timestamp):
+        with lock:
+            statuses.append((device, status))
+
+    def on_error(device, error, timestamp):
+        with lock:
+            errors.append((device, error))
+
+    supervisor = ShardSupervisor(workers=1, interval=0.1, timeout=0.5, on_status=on_status, on_error=on_error,
+                                 open_duration=0.3)
+    supervisor.start()
+    server = None
+    try:
+        supervisor.add('lamp', '127.0.0.1', port)
+        assert wait_for(lambda: any('CircuitOpenError' in error for _, error in errors))
+
+        server = SimulatorServer(('127.0.0.1', port))
+        server.start()
+        assert wait_for(lambda: supervisor.status('lamp') is not None)
+        assert supervisor.status('lamp').mode == PNS_LED_MODE
+        assert wait_for(lambda: 'lamp' not in supervisor.errors)
+        assert statuses[0][0] == 'lamp'
+    finally:
+        supervisor.stop()
+        if server is not None:
+            server.shutdown()
+            server.server_close()
@@ -0,0 +1,78 @@
+import struct
+
+import pytest
+
+from fleet import ConnectionPool
+from main import (
+    PnsDetailRunControlData,
+    pns_clear_command,
+    pns_detail_run_control_command,
+    pns_smart_mode_command,
+)
+from simulator import SimulatorServer
+from snapshot import load_snapshot, restore_snapshot, take_snapshot
+
+
+@pytest.fixture
+def servers():
+    servers = [SimulatorServer(('127.0.0.1', 0)) for _ in range(2)]
+    for server in servers:
+        server.start()
+    yield servers
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+@pytest.fixture
+def pool(servers):
+    stopped = SimulatorServer(('127.0.0.1', 0))
+    stopped.server_close()
+    pool = ConnectionPool(timeout=2.0)
+    pool.add('led', *servers[0].server_address)
+    pool.add('smart', *servers[1].server_address)
+    pool.add('down', *stopped.server_address)
+    yield pool
+    pool.close()
+
+
+def test_snapshot_round_trip(tmp_path, servers, pool):
+    path = str(tmp_path / 'fleet.snapshot')
+    pool.run('led', pns_detail_run_control_command, PnsDetailRunControlData(1, 4, 0, 0, 0, 0, 0))
+    pool.run('smart', pns_smart_mode_command, 2)
+
+    captured = (servers[0].simulator.led_patterns, servers[0].simulator.led_colors)
+    errors = take_snapshot(pool, path)
+    assert list(errors) == ['down']
+    snapshot = load_snapshot(path)
+    assert sorted(snapshot) == ['led', 'smart']
+
+    pool.run('led', pns_clear_command)
+    pool.run('smart', pns_clear_command)
+    progress = []
+    results = restore_snapshot(pool, path, progress=lambda *args: progress.append(args))
+    assert results == {'led': None, 'smart': None}
+    assert len(progress) == 2 and progress[-1][2:] == (2, 2)
+    assert (servers[0].simulator.led_patterns, servers[0].simulator.led_colors) == captured
+    assert servers[0].simulator.led_patterns[0:2] == (1, 1)
+    assert servers[1].simulator.group_no == 2
+
+
+def test_missing_device_is_reported(tmp_path, servers, pool):
+    path = str(tmp_path / 'fleet.snapshot')
+    take_snapshot(pool, path)
+    progress = []
+    results = restore_snapshot(pool, path, devices=['led', 'down'], progress=lambda *args: progress.append(args))
+    assert results['led'] is None
+    assert isinstance(results['down'], KeyError)
+    assert sorted(device for device, *_ in progress) == ['down', 'led']
+
+
+def test_load_skips_malformed_and_truncated_entries(tmp_path, pool):
+    path = tmp_path / 'fleet.snapshot'
+    take_snapshot(pool, str(path), devices=['led'])
+    with open(path, 'ab') as f:
+        # entries: capture time, device id size, response size, device id, response data
+        f.write(struct.pack('>dBH', 0.0, 3, 2) + b'bad' + b'\x00\x00')
+        f.write(struct.pack('>dBH', 0.0, 5, 45) + b'smart' + bytes(10))
+    assert list(load_snapshot(str(path))) == ['led']
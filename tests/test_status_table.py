@@ -0,0 +1,114 @@
+import struct
+import threading
+
+import pytest
+
+from fleet import ConnectionPool
+from main import PNS_GET_DETAIL_DATA_COMMAND, pns_get_data_encode, pns_get_detail_data_encode
+from simulator import LaPoeSimulator, SimulatorServer
+from status_table import StatusTable, StatusTablePoller
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / 'status')
+
+
+def responses(simulator: LaPoeSimulator) -> list:
+    frames = [simulator.handle(pns_get_data_encode())]
+    simulator.set_input(1, True)
+    frames.append(simulator.handle(pns_get_data_encode()))
+    return frames
+
+
+def test_reader_sees_the_writes(path):
+    simulator = LaPoeSimulator(mac_address=b'\x00\x0a\x0b\x0c\x0d\x0e')
+    first, second = responses(simulator)
+    with StatusTable(path, slot_count=4, create=True) as writer, StatusTable(path) as reader:
+        assert reader.slot_count == 4
+        assert reader.read('lamp') is None
+        writer.write('lamp', first, timestamp=1.0)
+        assert reader.read('lamp') == (first, b'G', 1.0)
+        writer.write('lamp', second)
+        assert reader.status('lamp').input[0] == 1
+
+        detail = simulator.handle(pns_get_detail_data_encode())
+        writer.write('detail', detail, PNS_GET_DETAIL_DATA_COMMAND)
+        assert reader.status('detail').mac_address == b'\x00\x0a\x0b\x0c\x0d\x0e'
+        assert reader.devices == ['lamp', 'detail']
+
+
+def test_removed_slot_is_reused(path):
+    first, second = responses(LaPoeSimulator())
+    with StatusTable(path, slot_count=1, create=True) as writer, StatusTable(path) as reader:
+        writer.write('lamp', first)
+        assert reader.read('lamp') is not None
+        with pytest.raises(ValueError):
+            writer.write('other', first)
+        writer.remove('lamp')
+        writer.write('other', second)
+        assert reader.read('lamp') is None
+        assert reader.read('other')[0] == second
+        assert reader.devices == ['other']
+
+
+def test_reads_are_never_torn(path):
+    frames = responses(LaPoeSimulator())
+    stop = threading.Event()
+    with StatusTable(path, slot_count=1, create=True) as writer, StatusTable(path) as reader:
+        writer.write('lamp', frames[0])
+
+        def write():
+            i = 0
+            while not stop.is_set():
+                i += 1
+                writer.write('lamp', frames[i % 2])
+
+        thread = threading.Thread(target=write)
+        thread.start()
+        try:
+            for _ in range(2000):
+                entry = reader.read('lamp')
+                assert entry is None or entry[0] in frames
+        finally:
+            stop.set()
+            thread.join()
+
+
+def test_slot_left_in_the_middle_of_a_write(path):
+    first, _ = responses(LaPoeSimulator())
+    with StatusTable(path, slot_count=1, create=True) as writer:
+        writer.write('lamp', first)
+    # a writer that died after marking the slot (odd sequence)
+    with open(path, 'r+b') as f:
+        f.seek(64)
+        f.write(struct.pack('>I', 3))
+    with StatusTable(path) as reader:
+        assert reader.read('lamp') is None
+
+
+def test_not_a_status_table(path):
+    with open(path, 'wb') as f:
+        f.write(bytes(256))
+    with pytest.raises(ValueError):
+        StatusTable(path)
+
+
+def test_poller_fills_the_table(path):
+    server = SimulatorServer(('127.0.0.1', 0), LaPoeSimulator(mac_address=b'\x00\x0a\x0b\x0c\x0d\x0e'))
+    server.start()
+    pool = ConnectionPool(timeout=2.0)
+    pool.add('lamp', *server.server_address)
+    pool.add('other', *server.server_address)
+    try:
+        with StatusTable(path, slot_count=1, create=True) as table:
+            poller = StatusTablePoller(pool, table, detail=True)
+            poller.poll_once()
+            assert table.status('lamp').mac_address == b'\x00\x0a\x0b\x0c\x0d\x0e'
+            # no slot left for the second device
+            assert list(poller.errors) == ['other']
+            assert isinstance(poller.errors['other'], ValueError)
+    finally:
+        pool.close()
+        server.shutdown()
+        server.server_close()
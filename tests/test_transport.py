@@ -0,0 +1,83 @@
+import asyncio
+
+import pytest
+
+from main import (
+    LaPoeNakError,
+    LaPoeTimeoutError,
+    PnsRunControlData,
+    phn_read_command,
+    phn_write_command,
+    pns_get_data_command,
+    pns_reboot_command,
+    pns_run_control_command,
+)
+from recorder import RECORD_DIRECTION_RECV, RECORD_DIRECTION_SEND, Recorder, Replayer
+from simulator import LaPoeSimulator, SimulatorServer
+from transport import AsyncTransport, LoopbackTransport, RecordingTransport, async_run
+
+
+@pytest.fixture
+def device():
+    server = SimulatorServer(('127.0.0.1', 0), LaPoeSimulator(password='secret'))
+    server.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_loopback_transport():
+    simulator = LaPoeSimulator()
+    transport = LoopbackTransport(simulator.handle)
+    pns_run_control_command(PnsRunControlData(1, 2, 0, 0, 0, 0), transport)
+    assert simulator.led_patterns == (1, 2, 0, 0, 0)
+    assert pns_get_data_command(transport).led_mode_data.led2_pattern == 2
+    phn_write_command(0x01, transport)
+    assert phn_read_command(transport) == 0x01
+    # nothing left to receive
+    assert transport.recv(1024) == b''
+
+
+def test_recording_transport(tmp_path):
+    path = str(tmp_path / 'capture')
+    with Recorder(path) as recorder:
+        transport = RecordingTransport(LoopbackTransport(LaPoeSimulator().handle, ('10.0.0.1', 10000)), recorder)
+        pns_get_data_command(transport)
+    with Replayer(path) as replayer:
+        records = list(replayer.records())
+    assert [(record.direction, record.device) for record in records] == [
+        (RECORD_DIRECTION_SEND, '10.0.0.1:10000'), (RECORD_DIRECTION_RECV, '10.0.0.1:10000')]
+
+
+def test_async_transport(device):
+    async def run():
+        transport = await AsyncTransport.open(*device.server_address, timeout=2.0)
+        try:
+            assert transport.getpeername()[:2] == device.server_address
+            await async_run(transport, pns_run_control_command, PnsRunControlData(2, 0, 0, 0, 0, 0), timeout=2.0)
+            status = await async_run(transport, pns_get_data_command, timeout=2.0)
+            with pytest.raises(LaPoeNakError):
+                await async_run(transport, pns_reboot_command, 'wrong', timeout=2.0)
+        finally:
+            await transport.close()
+        return status
+
+    assert asyncio.run(run()).led_mode_data.led1_pattern == 2
+
+
+def test_async_transport_timeout():
+    async def silent(reader, writer):
+        await reader.read(1024)
+
+    async def run():
+        server = await asyncio.start_server(silent, '127.0.0.1', 0)
+        transport = await AsyncTransport.open(*server.sockets[0].getsockname()[:2], timeout=2.0)
+        try:
+            with pytest.raises(LaPoeTimeoutError):
+                await async_run(transport, pns_get_data_command, timeout=0.1)
+        finally:
+            await transport.close()
+            server.close()
+            await server.wait_closed()
+
+    asyncio.run(run())